@@ -3,25 +3,147 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 import os
+import threading
 
-db = SQLAlchemy()
+from .storage import (
+    RoutingSession, configure_storage, ensure_columns, ensure_indexes, init_storage,
+    warm_pool,
+)
+from .services.search import init_search
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 jwt = JWTManager()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///stock.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY", "super-secret")
+    app.config['BULK_BATCH_SIZE'] = int(os.getenv("BULK_BATCH_SIZE", 5000))
+    app.config['SLOW_REQUEST_MS'] = int(os.getenv("SLOW_REQUEST_MS", 1000))
+    app.config['FORECAST_SCHEDULER'] = os.getenv("FORECAST_SCHEDULER", "1") == "1"
+    app.config['FORECAST_POLL_SECONDS'] = float(os.getenv("FORECAST_POLL_SECONDS", 5))
+    app.config['FORECAST_REFRESH_SECONDS'] = int(os.getenv("FORECAST_REFRESH_SECONDS", 300))
+    app.config['FORECAST_REFRESH_MOVEMENTS'] = int(os.getenv("FORECAST_REFRESH_MOVEMENTS", 50))
+    app.config['FORECAST_JOB_TIMEOUT'] = int(os.getenv("FORECAST_JOB_TIMEOUT", 600))
+    app.config['FORECAST_WAIT_SECONDS'] = float(os.getenv("FORECAST_WAIT_SECONDS", 10))
+    app.config['CATALOG_CACHE_SIZE'] = int(os.getenv("CATALOG_CACHE_SIZE", 50000))
+    app.config['ARCHIVE_DIR'] = os.getenv("ARCHIVE_DIR", os.path.join(app.instance_path, "archive"))
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+    app.config['STREAM_POLL_SECONDS'] = float(os.getenv("STREAM_POLL_SECONDS", 1))
+    app.config['STREAM_HEARTBEAT_SECONDS'] = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+    app.config['STREAM_RETRY_MS'] = int(os.getenv("STREAM_RETRY_MS", 3000))
+    app.config['STREAM_BUFFER_SIZE'] = int(os.getenv("STREAM_BUFFER_SIZE", 1000))
+    app.config['STREAM_EVENT_RETENTION'] = int(os.getenv("STREAM_EVENT_RETENTION", 100000))
+    app.config['STREAM_MAX_CLIENTS'] = int(os.getenv("STREAM_MAX_CLIENTS", 50))
+    app.config['LOW_STOCK_THRESHOLD'] = int(os.getenv("LOW_STOCK_THRESHOLD", 10))
+    app.config['SNAPSHOT_INTERVAL_DAYS'] = int(os.getenv("SNAPSHOT_INTERVAL_DAYS", 7))
+    app.config['SCHEMA_ON_STARTUP'] = os.getenv("SCHEMA_ON_STARTUP", "1") == "1"
+    app.config['BACKGROUND_ON_STARTUP'] = os.getenv("BACKGROUND_ON_STARTUP", "0") == "1"
+    if config:
+        app.config.update(config)
+    configure_storage(app)
     
-    CORS(app)
+    CORS(app, expose_headers=[
+        "ETag", "Last-Modified", "X-Next-Cursor", "X-Sync-Token",
+        "X-Computed-At", "X-Forecast-Stale",
+    ])
     db.init_app(app)
     jwt.init_app(app)
 
     from .routes import bp as routes_bp
     app.register_blueprint(routes_bp)
 
+    from .commands import register_commands
+    register_commands(app)
+
     with app.app_context():
-        db.create_all()
+        init_storage(app, db)
+        if app.config['SCHEMA_ON_STARTUP']:
+            init_schema(app)
+        else:
+            init_search(app, db, create=False)
+
+    if app.config['BACKGROUND_ON_STARTUP']:
+        start_background(app)
+    else:
+        # CLI commands (init-db, export-*, snapshot-stock, ...) and scripts
+        # never serve a request, so they never start the threads.
+        app.before_request(_start_background_once(app))
 
     return app
+
+
+def init_schema(app):
+    """Create missing tables/columns/indexes and backfill new rollups.
+
+    Idempotent; runs inside an application context. ``create_app`` calls it
+    unless ``SCHEMA_ON_STARTUP`` is off. Preforked servers run it once (see
+    ``gunicorn.conf.py``) and ``flask init-db`` runs it on demand.
+    """
+    from .models.demanda import DailyMovementTotal, DailyProductDemand
+    from .models.prediccion import ForecastResult  # noqa: F401  (registers the table)
+    from .models.evento import StockEvent  # noqa: F401
+    from .models.archivo import ArchiveFile  # noqa: F401
+    from .models.instantanea import StockSnapshot  # noqa: F401
+    from .models.producto import Product
+    from .models.valoracion import StockValuation
+
+    # Backfill the rollups the first time their tables appear.
+    inspector = db.inspect(db.engine)
+    backfill = not inspector.has_table(DailyProductDemand.__tablename__)
+    backfill_totals = not inspector.has_table(DailyMovementTotal.__tablename__)
+    db.create_all()
+    ensure_columns(db)
+    ensure_indexes(db)
+    init_search(app, db)
+    # Products written before ``change_seq`` existed sync as version 0.
+    db.session.query(Product).filter(Product.change_seq.is_(None)).update(
+        {Product.change_seq: 0}, synchronize_session=False
+    )
+    db.session.commit()
+    if backfill:
+        DailyProductDemand.rebuild()
+    elif backfill_totals:
+        DailyMovementTotal.rebuild()
+        db.session.commit()
+    StockValuation.ensure(app.config['LOW_STOCK_THRESHOLD'])
+
+
+def start_background(app):
+    """Start this process's background threads (forecast/snapshot scheduler).
+
+    Idempotent. By default it runs on the first request the process serves;
+    ``BACKGROUND_ON_STARTUP`` starts them in ``create_app`` instead. Threads
+    do not survive ``fork``: preforked servers call this in each worker
+    rather than in the preloading master.
+    """
+    if app.config['FORECAST_SCHEDULER']:
+        from .routes import FORECAST_DEFAULTS
+        from .services.scheduler import start_scheduler
+        start_scheduler(app, FORECAST_DEFAULTS)
+
+
+def _start_background_once(app):
+    lock = threading.Lock()
+    started = False
+
+    def start():
+        nonlocal started
+        if started:
+            return
+        with lock:
+            if not started:
+                start_background(app)
+                started = True
+
+    return start
+
+
+def warmup(app, connections=1):
+    """Open pooled connections and fill in-process caches before serving."""
+    with app.app_context():
+        warm_pool(app, db, connections)
+        from .services.catalog import get_catalog
+        get_catalog().all()
+        db.session.remove()
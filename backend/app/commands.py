@@ -0,0 +1,137 @@
+"""Flask CLI commands, e.g. ``flask --app wsgi rebuild-rollup``."""
+
+import json
+
+import click
+
+
+def register_commands(app):
+    @app.cli.command("init-db")
+    def init_db():
+        """Crea tablas e índices faltantes y completa rollups nuevos (idempotente)."""
+        from . import init_schema
+
+        init_schema(app)
+        click.echo("Esquema actualizado")
+
+    @app.cli.command("rebuild-rollup")
+    def rebuild_rollup():
+        """Regenera daily_product_demand a partir de inventory_movement."""
+        from .models.demanda import DailyProductDemand
+
+        rows = DailyProductDemand.rebuild()
+        click.echo(f"daily_product_demand regenerada: {rows} filas")
+
+    @app.cli.command("rebuild-dashboard")
+    def rebuild_dashboard():
+        """Regenera stock_valuation y daily_movement_total (rollups del tablero)."""
+        from . import db
+        from .models.demanda import DailyMovementTotal
+        from .models.valoracion import StockValuation
+
+        rows = StockValuation.rebuild(app.config["LOW_STOCK_THRESHOLD"])
+        DailyMovementTotal.rebuild()
+        db.session.commit()
+        click.echo(f"stock_valuation regenerada: {rows} filas")
+
+    @app.cli.command("rebuild-search")
+    def rebuild_search_index():
+        """Reindexa product_fts (tras un VACUUM o una carga sin triggers)."""
+        from . import db
+        from .services.search import fts_available, rebuild_search
+
+        if not fts_available(app):
+            click.echo("FTS5 no disponible en esta base de datos")
+            return
+        rebuild_search(db)
+        click.echo("product_fts reindexada")
+
+    @app.cli.command("refresh-forecast")
+    @click.option("--force", is_flag=True, help="Recalcula aunque otro proceso lo esté haciendo.")
+    def refresh_forecast(force):
+        """Recalcula y guarda la predicción con los parámetros por defecto."""
+        from .models.prediccion import ForecastResult
+        from .routes import FORECAST_DEFAULTS
+
+        row = ForecastResult.refresh(FORECAST_DEFAULTS, force=force)
+        if row is None:
+            click.echo("Otro proceso está calculando la predicción")
+            return
+        click.echo(f"Predicción {row.params_key}: {len(row.result)} productos en {row.duration_ms} ms")
+
+    @app.cli.command("archive-movements")
+    @click.option("--older-than", type=int, default=None,
+                  help="Días de antigüedad (por defecto ARCHIVE_AFTER_DAYS).")
+    @click.option("--dry-run", is_flag=True, help="Solo informa qué meses se archivarían.")
+    def archive_movements(older_than, dry_run):
+        """Mueve movimientos antiguos a resúmenes mensuales y archivos columnares."""
+        from .services.archive import archive_movements as run
+
+        report = run(older_than, dry_run=dry_run)
+        click.echo(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+
+    @app.cli.command("snapshot-stock")
+    @click.option("--day", type=click.DateTime(["%Y-%m-%d"]), default=None,
+                  help="Día del snapshot (stock a las 00:00 UTC); por defecto hoy.")
+    @click.option("--batch-size", type=int, default=None,
+                  help="Productos por lote/transacción (BULK_BATCH_SIZE).")
+    @click.option("--force", is_flag=True, help="Regenera aunque el día ya exista.")
+    def snapshot_stock(day, batch_size, force):
+        """Guarda el stock de todos los productos en stock_snapshot."""
+        from .models.instantanea import StockSnapshot
+
+        run = StockSnapshot.build(
+            day.date() if day else None,
+            batch_size=batch_size or app.config["BULK_BATCH_SIZE"],
+            force=force,
+        )
+        if run is None:
+            click.echo("El snapshot de ese día ya existe o se está generando (usar --force)")
+            return
+        click.echo(json.dumps(run.to_dict(), ensure_ascii=False, indent=2))
+
+    @app.cli.command("export-movements")
+    @click.argument("output", type=click.File("wb"))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "parquet"]), default="csv")
+    @click.option("--from", "date_from", type=click.DateTime(), default=None,
+                  help="Fecha inicial (inclusive, UTC).")
+    @click.option("--to", "date_to", type=click.DateTime(), default=None,
+                  help="Fecha final (exclusiva, UTC).")
+    @click.option("--gzip", is_flag=True, help="CSV comprimido (.csv.gz) / Parquet con gzip.")
+    def export_movements(output, fmt, date_from, date_to, gzip):
+        """Exporta movimientos (archivados + actuales) a CSV o Parquet ('-' = stdout)."""
+        from .services import export
+
+        batches = export.movement_batches(date_from, date_to)
+        for chunk in export.encode(fmt, export.MOVEMENT_COLUMNS, batches, gzip=gzip):
+            output.write(chunk)
+
+    @app.cli.command("export-stock")
+    @click.argument("output", type=click.File("wb"))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "parquet"]), default="csv")
+    @click.option("--all", "include_inactive", is_flag=True, help="Incluye productos inactivos.")
+    @click.option("--gzip", is_flag=True, help="CSV comprimido (.csv.gz) / Parquet con gzip.")
+    def export_stock(output, fmt, include_inactive, gzip):
+        """Exporta la foto actual del stock a CSV o Parquet ('-' = stdout)."""
+        from .services import export
+
+        batches = export.stock_batches(active_only=not include_inactive)
+        for chunk in export.encode(fmt, export.STOCK_COLUMNS, batches, gzip=gzip):
+            output.write(chunk)
+
+    @app.cli.command("import-movements")
+    @click.argument("source", type=click.File("rb"))
+    @click.option("--format", "fmt", type=click.Choice(["ndjson", "csv"]), default=None,
+                  help="Por defecto se deduce de la extensión (.csv → csv).")
+    @click.option("--batch-size", type=int, default=None,
+                  help="Filas por lote/transacción (BULK_BATCH_SIZE).")
+    def import_movements(source, fmt, batch_size):
+        """Importa movimientos desde un archivo NDJSON o CSV ('-' = stdin)."""
+        from .services.ingest import ingest_stream
+
+        if fmt is None:
+            fmt = "csv" if source.name.endswith(".csv") else "ndjson"
+        report = ingest_stream(
+            source, fmt, batch_size=batch_size or app.config["BULK_BATCH_SIZE"]
+        )
+        click.echo(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
@@ -0,0 +1,184 @@
+"""Request and SQL instrumentation exported in Prometheus text format.
+
+Every request served by the ``api`` blueprint records, per route template
+and method:
+
+* latency histogram (``stockio_request_duration_seconds``);
+* status code counter (``stockio_requests_total``);
+* response size (``stockio_response_bytes``; streamed bodies count as 0);
+* SQL statements and time spent in them, captured through SQLAlchemy
+  ``before/after_cursor_execute`` engine events
+  (``stockio_request_sql_queries`` / ``stockio_request_sql_seconds``).
+
+Requests slower than ``SLOW_REQUEST_MS`` (0 disables it) are logged with
+the statements they executed, which makes N+1 patterns and slow forecasts
+obvious. Metrics are kept per process; with several workers each one is
+scraped (or aggregated) separately. ``/api/metrics`` requires a JWT like
+every other API route.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+MAX_LOGGED_STATEMENTS = 50
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.total:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class Registry:
+    """Thread-safe in-process metric store."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: _Histogram(LATENCY_BUCKETS))
+        self.sql_queries = defaultdict(lambda: _Histogram(QUERY_BUCKETS))
+        self.sql_seconds = defaultdict(lambda: _Histogram(LATENCY_BUCKETS))
+        self.statuses = defaultdict(int)
+        self.response_bytes = defaultdict(int)
+
+    def observe(self, route, method, status, seconds, size, queries, sql_seconds):
+        key = (route, method)
+        with self._lock:
+            self.latency[key].observe(seconds)
+            self.sql_queries[key].observe(queries)
+            self.sql_seconds[key].observe(sql_seconds)
+            self.statuses[(route, method, status)] += 1
+            self.response_bytes[key] += size
+
+    def render(self) -> str:
+        out = []
+        with self._lock:
+            out.append("# HELP stockio_requests_total Requests by route, method and status.")
+            out.append("# TYPE stockio_requests_total counter")
+            for (route, method, status), n in sorted(self.statuses.items()):
+                out.append(
+                    f'stockio_requests_total{{route="{route}",method="{method}",'
+                    f'status="{status}"}} {n}'
+                )
+            out.append("# HELP stockio_response_bytes_total Response bytes by route.")
+            out.append("# TYPE stockio_response_bytes_total counter")
+            for (route, method), n in sorted(self.response_bytes.items()):
+                out.append(
+                    f'stockio_response_bytes_total{{route="{route}",method="{method}"}} {n}'
+                )
+            for name, help_text, store in (
+                ("stockio_request_duration_seconds", "Request latency.", self.latency),
+                ("stockio_request_sql_queries", "SQL statements per request.", self.sql_queries),
+                ("stockio_request_sql_seconds", "SQL time per request.", self.sql_seconds),
+            ):
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} histogram")
+                for (route, method), hist in sorted(store.items()):
+                    out.extend(hist.lines(name, f'route="{route}",method="{method}"'))
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+
+# ─── SQL capture ──────────────────────────────────────────────────────────
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "metrics_sql" in g:
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_start")
+    if not starts or not has_request_context() or "metrics_sql" not in g:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = g.metrics_sql
+    stats["count"] += 1
+    stats["seconds"] += elapsed
+    if stats["log"] is not None and len(stats["log"]) < MAX_LOGGED_STATEMENTS:
+        stats["log"].append((elapsed, statement))
+
+
+# ─── Blueprint hooks ──────────────────────────────────────────────────────
+def instrument(bp) -> None:
+    """Register the timing hooks on blueprint *bp*."""
+
+    @bp.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = {
+            "count": 0,
+            "seconds": 0.0,
+            "log": [] if current_app.config.get("SLOW_REQUEST_MS") else None,
+        }
+
+    @bp.after_request
+    def _record(response):
+        start = g.pop("metrics_start", None)
+        stats = g.pop("metrics_sql", None)
+        if start is None or stats is None:
+            return response
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        size = 0 if response.is_streamed else (response.content_length or 0)
+        registry.observe(
+            route,
+            request.method,
+            response.status_code,
+            elapsed,
+            size,
+            stats["count"],
+            stats["seconds"],
+        )
+
+        slow_ms = current_app.config.get("SLOW_REQUEST_MS")
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            statements = "\n".join(
+                f"  {secs * 1000:8.1f} ms  {sql}" for secs, sql in stats["log"]
+            )
+            logger.warning(
+                "Request lenta: %s %s %.1f ms, %d consultas SQL (%.1f ms)\n%s",
+                request.method,
+                route,
+                elapsed * 1000,
+                stats["count"],
+                stats["seconds"] * 1000,
+                statements,
+            )
+        return response
+
+
+def metrics_response() -> Response:
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
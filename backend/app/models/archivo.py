@@ -0,0 +1,119 @@
+"""Cold tier of the movement ledger: monthly summaries and archive files.
+
+Movements older than ``ARCHIVE_AFTER_DAYS`` are moved out of
+``inventory_movement`` by :func:`app.services.archive.archive_movements`.
+Each archived batch leaves two things behind:
+
+* :class:`MonthlyProductMovement`, one row per ``(product, month, type)``
+  with counts and quantities, for reports that never need single rows.
+* :class:`ArchiveFile`, the registry entry of one compressed columnar file
+  (``.npz``) holding the archived rows of one month. The registry, not the
+  directory listing, decides what is part of the archive. A file left
+  behind by an interrupted run is ignored.
+
+:class:`ArchiveClaim` marks a month as being archived, so concurrent runs
+(CLI, cron, another worker) never process the same month at once.
+
+The ``daily_product_demand`` rollup is left untouched, so the forecast's
+history does not change when rows are archived.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+
+
+class MonthlyProductMovement(db.Model):
+    """Per-product, per-month, per-type totals of archived movements."""
+
+    __tablename__ = "monthly_product_movement"
+
+    # Columns -----------------------------------------------------------------
+    product_id: str = db.Column(
+        db.String(36), db.ForeignKey("product.product_id"), primary_key=True
+    )
+    month: date = db.Column(db.Date, primary_key=True, index=True)  # first day
+    movement_type: str = db.Column(db.String(20), primary_key=True)
+    movements: int = db.Column(db.Integer, nullable=False, default=0)
+    quantity: int = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            "product_id": self.product_id,
+            "month": self.month.strftime("%Y-%m"),
+            "movement_type": self.movement_type,
+            "movements": self.movements,
+            "quantity": self.quantity,
+        }
+
+
+class ArchiveFile(db.Model):
+    """One columnar archive file (a month, or a later part of it)."""
+
+    __tablename__ = "archive_file"
+
+    # Columns -----------------------------------------------------------------
+    path: str = db.Column(db.String(255), primary_key=True)  # relative to ARCHIVE_DIR
+    month: date = db.Column(db.Date, nullable=False, index=True)
+    rows: int = db.Column(db.Integer, nullable=False)
+    first_date: datetime = db.Column(db.DateTime, nullable=False)
+    last_date: datetime = db.Column(db.DateTime, nullable=False)
+    size_bytes: int = db.Column(db.Integer, nullable=False)
+    archived_at: datetime = db.Column(
+        db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "month": self.month.strftime("%Y-%m"),
+            "rows": self.rows,
+            "first_date": self.first_date.isoformat(),
+            "last_date": self.last_date.isoformat(),
+            "size_bytes": self.size_bytes,
+            "archived_at": self.archived_at.isoformat(),
+        }
+
+
+class ArchiveClaim(db.Model):
+    """Month currently being archived by one run."""
+
+    __tablename__ = "archive_claim"
+
+    # Columns -----------------------------------------------------------------
+    month: date = db.Column(db.Date, primary_key=True)  # first day
+    started_at: datetime = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def claim(cls, month: date, *, stale_after: int = 3600) -> bool:
+        """Take *month* for this run and commit; ``False`` if another run holds it.
+
+        A claim older than *stale_after* seconds (a crashed run) can be
+        taken over.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        try:
+            db.session.add(cls(month=month, started_at=now))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+
+        claimed = (
+            db.session.query(cls)
+            .filter(cls.month == month)
+            .filter(cls.started_at < now - timedelta(seconds=stale_after))
+            .update({cls.started_at: now}, synchronize_session=False)
+        )
+        db.session.commit()
+        return bool(claimed)
+
+    @classmethod
+    def release(cls, month: date) -> None:
+        db.session.rollback()
+        db.session.query(cls).filter(cls.month == month).delete(synchronize_session=False)
+        db.session.commit()
@@ -0,0 +1,337 @@
+"""Daily demand rollup maintained alongside the movement ledger.
+
+One row per ``(product_id, day)`` holding the quantities that came in, went
+out and the signed net (``OUT`` negative, everything else positive). The
+table is bounded by products × days, so readers such as the forecast never
+have to scan the raw ``inventory_movement`` ledger.
+
+Assumptions
+-----------
+* :class:`~app.models.movimiento.InventoryMovement` calls :meth:`apply`
+  inside its own transaction for every create, update and delete, so the
+  rollup commits (or rolls back) together with the ledger.
+* ``movements`` counts the ledger rows folded into each cell; a cell whose
+  count drops to zero is removed.
+* :class:`DailyMovementTotal` sums the same deltas over all products per
+  day, so dashboard volumes read one row per day instead of one per
+  product and day.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .. import db
+
+# Dialects with ``INSERT ... ON CONFLICT DO UPDATE``.
+_UPSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class DailyProductDemand(db.Model):
+    """Per-product, per-day aggregate of inventory movements."""
+
+    __tablename__ = "daily_product_demand"
+
+    # Columns -----------------------------------------------------------------
+    product_id: str = db.Column(
+        db.String(36), db.ForeignKey("product.product_id"), primary_key=True
+    )
+    day: date = db.Column(db.Date, primary_key=True, index=True)
+    in_qty: int = db.Column(db.Integer, nullable=False, default=0)
+    out_qty: int = db.Column(db.Integer, nullable=False, default=0)
+    net: int = db.Column(db.Integer, nullable=False, default=0)
+    movements: int = db.Column(db.Integer, nullable=False, default=0)
+
+    # ---------------------------------------------------------------------
+    # Maintenance
+    # ---------------------------------------------------------------------
+    @classmethod
+    def apply(
+        cls,
+        product_id: str,
+        when: datetime,
+        movement_type: str,
+        quantity: int,
+        sign: int = 1,
+    ) -> None:
+        """Add (``sign=1``) or remove (``sign=-1``) one movement from the rollup.
+
+        Runs in the caller's session and does not commit.
+        """
+        day = when.date() if isinstance(when, datetime) else when
+        is_out = movement_type == "OUT"
+        in_qty = 0 if is_out else sign * quantity
+        out_qty = sign * quantity if is_out else 0
+        delta = {
+            "in_qty": in_qty,
+            "out_qty": out_qty,
+            "net": in_qty - out_qty,
+            "movements": sign,
+        }
+
+        DailyMovementTotal.add(
+            [{"day": day, "in_qty": in_qty, "out_qty": out_qty, "movements": sign}]
+        )
+
+        sess = db.session
+        cell = sess.get(cls, (product_id, day))
+        if cell is None:
+            sess.add(cls(product_id=product_id, day=day, **delta))
+            return
+        for column, value in delta.items():
+            setattr(cell, column, getattr(cls, column) + value)
+        sess.flush([cell])
+        sess.query(cls).filter_by(product_id=product_id, day=day).filter(
+            cls.movements <= 0
+        ).delete(synchronize_session="fetch")
+
+    @classmethod
+    def apply_many(cls, movements: Iterable[Tuple[str, datetime, str, int]]) -> None:
+        """Fold a batch of new ``(product_id, date, type, qty)`` into the rollup.
+
+        Deltas are summed per cell in Python and written with one upsert
+        ``executemany``. Runs in the caller's session and does not commit.
+        """
+        cells: Dict[Tuple[str, date], list] = {}
+        for product_id, when, movement_type, quantity in movements:
+            day = when.date() if isinstance(when, datetime) else when
+            cell = cells.setdefault((product_id, day), [0, 0, 0])
+            cell[1 if movement_type == "OUT" else 0] += quantity
+            cell[2] += 1
+        if not cells:
+            return
+
+        rows = [
+            {
+                "product_id": pid,
+                "day": day,
+                "in_qty": in_qty,
+                "out_qty": out_qty,
+                "net": in_qty - out_qty,
+                "movements": count,
+            }
+            for (pid, day), (in_qty, out_qty, count) in cells.items()
+        ]
+        DailyMovementTotal.add_cells(rows)
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in _UPSERT:
+            for row in rows:
+                cls._merge_row(row)
+            return
+
+        stmt = _UPSERT[dialect](cls.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["product_id", "day"],
+            set_={
+                column: getattr(cls.__table__.c, column) + getattr(stmt.excluded, column)
+                for column in ("in_qty", "out_qty", "net", "movements")
+            },
+        )
+        db.session.execute(stmt, rows)
+
+    @classmethod
+    def _merge_row(cls, row: dict) -> None:
+        cell = db.session.get(cls, (row["product_id"], row["day"]))
+        if cell is None:
+            db.session.add(cls(**row))
+            return
+        for column in ("in_qty", "out_qty", "net", "movements"):
+            setattr(cell, column, getattr(cell, column) + row[column])
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Regenerate the whole rollup from ``inventory_movement`` plus the
+        archived movements (:mod:`app.services.archive`).
+
+        Returns the number of rollup rows written.
+        """
+        from .movimiento import InventoryMovement  # avoid circular import
+        from ..services.archive import rollup_batches
+
+        mv = InventoryMovement
+        is_out = mv.movement_type == "OUT"
+        in_qty = func.sum(case((is_out, 0), else_=mv.quantity))
+        out_qty = func.sum(case((is_out, mv.quantity), else_=0))
+        source = db.select(
+            mv.product_id,
+            func.date(mv.date),
+            in_qty,
+            out_qty,
+            in_qty - out_qty,
+            func.count(),
+        ).group_by(mv.product_id, func.date(mv.date))
+
+        try:
+            db.session.query(cls).delete(synchronize_session=False)
+            db.session.execute(
+                insert(cls).from_select(
+                    ["product_id", "day", "in_qty", "out_qty", "net", "movements"],
+                    source,
+                )
+            )
+            for batch in rollup_batches():
+                cls.apply_many(batch)
+            DailyMovementTotal.rebuild()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return db.session.query(func.count()).select_from(cls).scalar()
+
+    # ---------------------------------------------------------------------
+    # Readers
+    # ---------------------------------------------------------------------
+    @classmethod
+    def daily_net(cls, start: Optional[date] = None, products=None):
+        """Query of ``product_id, day, net, movements`` from *start* onwards.
+
+        *products* optionally restricts the rows to a select of product ids.
+        """
+        query = db.session.query(cls.product_id, cls.day, cls.net, cls.movements)
+        if start is not None:
+            query = query.filter(cls.day >= start)
+        if products is not None:
+            query = query.filter(cls.product_id.in_(products))
+        return query
+
+    @classmethod
+    def net_between(cls, start: Optional[date], end: Optional[date], products=None):
+        """Query of ``product_id, SUM(net)`` over days ``start <= day < end``.
+
+        Either bound may be ``None`` (open). *products* optionally restricts
+        the rows to a list or select of product ids.
+        """
+        query = db.session.query(cls.product_id, func.sum(cls.net))
+        if start is not None:
+            query = query.filter(cls.day >= start)
+        if end is not None:
+            query = query.filter(cls.day < end)
+        if products is not None:
+            query = query.filter(cls.product_id.in_(products))
+        return query.group_by(cls.product_id)
+
+    @classmethod
+    def earliest_day(cls, products=None) -> Optional[date]:
+        query = db.session.query(func.min(cls.day))
+        if products is not None:
+            query = query.filter(cls.product_id.in_(products))
+        return query.scalar()
+
+
+class DailyMovementTotal(db.Model):
+    """All-product movement totals per day (a rollup of the rollup)."""
+
+    __tablename__ = "daily_movement_total"
+
+    # Columns -----------------------------------------------------------------
+    day: date = db.Column(db.Date, primary_key=True)
+    in_qty: int = db.Column(db.Integer, nullable=False, default=0)
+    out_qty: int = db.Column(db.Integer, nullable=False, default=0)
+    movements: int = db.Column(db.Integer, nullable=False, default=0)
+
+    _COLUMNS = ("in_qty", "out_qty", "movements")
+    _upserts: Dict[str, object] = {}  # dialect -> prebuilt upsert
+
+    # ---------------------------------------------------------------------
+    # Maintenance (called by DailyProductDemand, same transaction)
+    # ---------------------------------------------------------------------
+    @classmethod
+    def add(cls, rows: List[dict]) -> None:
+        """Add ``{day, in_qty, out_qty, movements}`` deltas. Does not commit."""
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in _UPSERT:
+            for row in rows:
+                total = db.session.get(cls, row["day"])
+                if total is None:
+                    db.session.add(cls(**row))
+                    continue
+                for column in cls._COLUMNS:
+                    setattr(total, column, getattr(total, column) + row[column])
+            return
+
+        # Built once per dialect: this runs with every ledger write.
+        stmt = cls._upserts.get(dialect)
+        if stmt is None:
+            stmt = _UPSERT[dialect](cls.__table__)
+            stmt = cls._upserts[dialect] = stmt.on_conflict_do_update(
+                index_elements=["day"],
+                set_={
+                    column: getattr(cls.__table__.c, column) + getattr(stmt.excluded, column)
+                    for column in cls._COLUMNS
+                },
+            )
+        db.session.execute(stmt, rows)
+
+    @classmethod
+    def add_cells(cls, cells: Iterable[dict]) -> None:
+        """Sum per-product rollup deltas by day and :meth:`add` them."""
+        days: Dict[date, list] = {}
+        for cell in cells:
+            total = days.setdefault(cell["day"], [0, 0, 0])
+            total[0] += cell["in_qty"]
+            total[1] += cell["out_qty"]
+            total[2] += cell["movements"]
+        cls.add([
+            {"day": day, "in_qty": i, "out_qty": o, "movements": n}
+            for day, (i, o, n) in days.items()
+        ])
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """Re-derive every day from ``daily_product_demand``. Does not commit."""
+        d = DailyProductDemand
+        db.session.query(cls).delete(synchronize_session=False)
+        db.session.execute(
+            insert(cls).from_select(
+                ["day", "in_qty", "out_qty", "movements"],
+                db.select(
+                    d.day, func.sum(d.in_qty), func.sum(d.out_qty), func.sum(d.movements)
+                ).group_by(d.day),
+            )
+        )
+
+    # ---------------------------------------------------------------------
+    # Readers
+    # ---------------------------------------------------------------------
+    @classmethod
+    def volumes(cls, today: date, windows: Iterable[int] = (1, 7, 30)) -> Dict[int, dict]:
+        """``{days: {in_qty, out_qty, movements}}`` for the last *days* days
+        up to and including *today*; reads at most ``max(windows)`` rows."""
+        windows = sorted(windows)
+        start = today - timedelta(days=windows[-1] - 1)
+        rows = (
+            db.session.query(cls.day, cls.in_qty, cls.out_qty, cls.movements)
+            .filter(cls.day >= start, cls.day <= today)
+            .all()
+        )
+        result = {}
+        for days in windows:
+            first = today - timedelta(days=days - 1)
+            picked = [r for r in rows if r.day >= first]
+            result[days] = {
+                "in_qty": sum(r.in_qty for r in picked),
+                "out_qty": sum(r.out_qty for r in picked),
+                "movements": sum(r.movements for r in picked),
+            }
+        return result
+
+    @classmethod
+    def monthly(cls) -> List[dict]:
+        """``[{month, in_qty, out_qty, movements}]`` per calendar month,
+        oldest first; reads one row per day with movements."""
+        months: Dict[str, list] = {}
+        rows = db.session.query(cls.day, cls.in_qty, cls.out_qty, cls.movements)
+        for day, in_qty, out_qty, movements in rows.order_by(cls.day):
+            total = months.setdefault(f"{day.year:04d}-{day.month:02d}", [0, 0, 0])
+            total[0] += in_qty
+            total[1] += out_qty
+            total[2] += movements
+        return [
+            {"month": month, "in_qty": i, "out_qty": o, "movements": n}
+            for month, (i, o, n) in months.items()
+        ]
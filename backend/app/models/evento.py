@@ -0,0 +1,155 @@
+"""Append-only log of product changes pushed to live clients (SSE).
+
+Every stock adjustment, edit, activation and deactivation adds one row in the
+same transaction as the change, so an event is visible exactly when the
+change commits. ``event_id`` is the SSE ``id:``. A client that reconnects
+with ``Last-Event-ID`` gets every row after it, whichever worker wrote it.
+
+Assumptions
+-----------
+* Ids become visible in increasing order. This holds on SQLite, which has a
+  single writer. On servers where concurrent transactions can commit
+  sequence values out of order, a poller could skip a late commit.
+* The table is trimmed to the last ``STREAM_EVENT_RETENTION`` rows by
+  :class:`~app.services.events.EventHub`. A client that was away longer
+  than that resumes from the oldest row still kept.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, literal, select
+
+from .. import db
+
+# Session.info flag read by the after-commit hook in app.services.events.
+PENDING_FLAG = "stock_events"
+
+
+class StockEvent(db.Model):
+    """One compact product change: resulting stock plus movement summary."""
+
+    __tablename__ = "stock_event"
+
+    # Columns -----------------------------------------------------------------
+    event_id: int = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created_at: datetime = db.Column(
+        db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+    kind: str = db.Column(db.String(12), nullable=False)
+    product_id: str = db.Column(db.String(36), nullable=False)
+    stk_qty: int = db.Column(db.Integer, nullable=False)
+    active: bool = db.Column(db.Boolean, nullable=False, default=True)
+    movement_type: Optional[str] = db.Column(db.String(20), nullable=True)
+    quantity: Optional[int] = db.Column(db.Integer, nullable=True)
+    order_id: Optional[str] = db.Column(db.String(36), nullable=True)
+
+    def to_dict(self) -> Dict:
+        return _as_dict(self)
+
+    # ---------------------------------------------------------------------
+    # Writers (run in the caller's transaction, no commit)
+    # ---------------------------------------------------------------------
+    @classmethod
+    def emit(cls, product, kind: str) -> None:
+        """Record the current state of an ORM *product* (edit / (de)activation)."""
+        db.session.add(
+            cls(
+                kind=kind,
+                product_id=product.product_id,
+                stk_qty=product.stk_qty,
+                active=bool(product.active),
+            )
+        )
+        db.session.info[PENDING_FLAG] = True
+
+    @classmethod
+    def emit_stock(
+        cls,
+        movements: Iterable[Tuple[str, str, int]],
+        order_id: Optional[str] = None,
+    ) -> None:
+        """Record stock changes ``(product_id, movement_type, qty)``.
+
+        The resulting ``stk_qty`` is read by the ``INSERT ... SELECT`` itself,
+        so it is the value written earlier in the same transaction, with no
+        extra round trip.
+        """
+        from .producto import Product  # avoid circular import
+
+        params = [
+            {"pid": pid, "mtype": movement_type, "qty": qty}
+            for pid, movement_type, qty in movements
+        ]
+        if not params:
+            return
+        source = select(
+            literal("stock"),
+            literal(datetime.now(timezone.utc)),
+            Product.product_id,
+            Product.stk_qty,
+            Product.active,
+            bindparam("mtype"),
+            bindparam("qty"),
+            literal(order_id, db.String),
+        ).where(Product.product_id == bindparam("pid"))
+        stmt = insert(cls.__table__).from_select(
+            ["kind", "created_at", "product_id", "stk_qty", "active",
+             "movement_type", "quantity", "order_id"],
+            source,
+        )
+        db.session.execute(stmt, params)
+        db.session.info[PENDING_FLAG] = True
+
+    # ---------------------------------------------------------------------
+    # Readers
+    # ---------------------------------------------------------------------
+    @classmethod
+    def since(cls, event_id: int, limit: int = 500) -> List[Dict]:
+        """Up to *limit* events with id greater than *event_id*, oldest first."""
+        rows = (
+            db.session.query(*cls.__table__.c)
+            .filter(cls.event_id > event_id)
+            .order_by(cls.event_id)
+            .limit(limit)
+            .all()
+        )
+        return [_as_dict(row) for row in rows]
+
+    @classmethod
+    def last_id(cls) -> int:
+        return db.session.query(func.coalesce(func.max(cls.event_id), 0)).scalar()
+
+    @classmethod
+    def prune(cls, keep: int) -> int:
+        """Delete all but the newest *keep* events and commit. Returns rows deleted."""
+        cutoff = cls.last_id() - keep
+        if cutoff <= 0:
+            return 0
+        deleted = (
+            db.session.query(cls)
+            .filter(cls.event_id <= cutoff)
+            .delete(synchronize_session=False)
+        )
+        db.session.commit()
+        return deleted
+
+
+def _as_dict(row) -> Dict:
+    movement = None
+    if row.movement_type is not None:
+        movement = {"type": row.movement_type, "qty": row.quantity, "order_id": row.order_id}
+    created = row.created_at
+    if isinstance(created, datetime):
+        created = created.replace(tzinfo=created.tzinfo or timezone.utc).isoformat()
+    return {
+        "id": row.event_id,
+        "kind": row.kind,
+        "product_id": row.product_id,
+        "stk_qty": row.stk_qty,
+        "active": bool(row.active),
+        "movement": movement,
+        "at": created,
+    }
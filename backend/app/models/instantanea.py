@@ -0,0 +1,355 @@
+"""Periodic stock snapshots and point-in-time stock reconstruction.
+
+:class:`StockSnapshot` stores every product's ``stk_qty`` as of 00:00 UTC
+of a snapshot day. :class:`StockSnapshotRun` is the registry of snapshot
+days. A snapshot is readable only once its run is ``done``, so a half
+written or crashed build is never used.
+
+A snapshot is computed rather than copied: ``stk_qty`` minus the net of
+``daily_product_demand`` from the snapshot day onwards. The result is
+exact for that midnight whenever the job runs, and each batch is one
+``INSERT ... SELECT``.
+
+:meth:`StockSnapshot.as_of` answers "stock at instant *t*" with bounded
+work:
+
+* forward from the nearest snapshot on or before *t*: snapshot + rollup
+  net of the whole days in between + the movements of *t*'s day before *t*;
+* otherwise backwards from the nearest later snapshot (or the current
+  stock): minus the movements of *t*'s day from *t* on and minus the rollup
+  net of the following whole days.
+
+Assumptions
+-----------
+* Net follows the rollup convention: ``OUT`` subtracts, every other type
+  adds.
+* ``stk_qty`` changes that bypass the ledger (a direct edit through
+  ``PUT /products``) are not movements. The next snapshot includes them;
+  reconstructions across such an edit do not.
+* Products created after the snapshot day are not in that snapshot. They
+  are reconstructed backwards from their current stock.
+"""
+
+from __future__ import annotations
+
+import time as _time
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, literal, or_, select, true, type_coerce
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from .demanda import DailyProductDemand
+
+RUNNING, DONE = "running", "done"
+
+
+class StockSnapshotRun(db.Model):
+    """Registry entry (and build claim) of one snapshot day."""
+
+    __tablename__ = "stock_snapshot_run"
+
+    # Columns -----------------------------------------------------------------
+    day: date = db.Column(db.Date, primary_key=True)
+    status: str = db.Column(db.String(10), nullable=False, default=RUNNING)
+    products: Optional[int] = db.Column(db.Integer)
+    started_at: datetime = db.Column(db.DateTime, nullable=False)
+    finished_at: Optional[datetime] = db.Column(db.DateTime)
+    duration_ms: Optional[int] = db.Column(db.Integer)
+
+    def to_dict(self) -> dict:
+        return {
+            "day": self.day.isoformat(),
+            "status": self.status,
+            "products": self.products,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_ms": self.duration_ms,
+        }
+
+    @classmethod
+    def claim(cls, day: date, *, force: bool = False, stale_after: int = 3600) -> bool:
+        """Mark *day* as being built by this process; ``False`` if taken.
+
+        A ``running`` claim older than *stale_after* seconds (a crashed
+        build) can be taken over; *force* also rebuilds a ``done`` day.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        try:
+            db.session.add(cls(day=day, status=RUNNING, started_at=now))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+
+        takeover = cls.started_at < now - timedelta(seconds=stale_after)
+        condition = true() if force else ((cls.status == RUNNING) & takeover)
+        claimed = (
+            db.session.query(cls)
+            .filter(cls.day == day)
+            .filter(condition)
+            .update(
+                {cls.status: RUNNING, cls.started_at: now, cls.finished_at: None},
+                synchronize_session=False,
+            )
+        )
+        db.session.commit()
+        return bool(claimed)
+
+    @classmethod
+    def nearest(cls, day: date, *, before: bool = True) -> Optional[date]:
+        """Latest ``done`` day ``<= day`` (or earliest ``> day`` if not *before*)."""
+        query = db.session.query(func.max(cls.day) if before else func.min(cls.day))
+        query = query.filter(cls.status == DONE)
+        query = query.filter(cls.day <= day if before else cls.day > day)
+        return query.scalar()
+
+
+class StockSnapshot(db.Model):
+    """``stk_qty`` of one product at 00:00 UTC of a snapshot day."""
+
+    __tablename__ = "stock_snapshot"
+
+    # Columns -----------------------------------------------------------------
+    day: date = db.Column(db.Date, primary_key=True)
+    product_id: str = db.Column(
+        db.String(36), db.ForeignKey("product.product_id"), primary_key=True
+    )
+    stk_qty: int = db.Column(db.Integer, nullable=False)
+
+    # ---------------------------------------------------------------------
+    # Building
+    # ---------------------------------------------------------------------
+    @classmethod
+    def build(
+        cls,
+        day: Optional[date] = None,
+        *,
+        batch_size: int = 5000,
+        force: bool = False,
+    ) -> Optional[StockSnapshotRun]:
+        """Snapshot every product as of 00:00 UTC of *day* (default today).
+
+        Products are written in ``product_id`` ranges of *batch_size*, one
+        ``INSERT ... SELECT`` and commit per range. Returns the finished run,
+        or ``None`` when another process holds the claim for *day*.
+        """
+        day = day or datetime.now(timezone.utc).date()
+        if not StockSnapshotRun.claim(day, force=force):
+            return None
+
+        started = _time.perf_counter()
+        try:
+            db.session.query(cls).filter(cls.day == day).delete(synchronize_session=False)
+            db.session.commit()
+            total, after = 0, ""
+            while True:
+                bound = cls._batch_bound(after, batch_size)
+                total += cls._insert_batch(day, after, bound)
+                db.session.commit()
+                if bound is None:
+                    break
+                after = bound
+        except Exception:
+            db.session.rollback()
+            db.session.query(StockSnapshotRun).filter_by(day=day).delete()
+            db.session.commit()
+            raise
+
+        run = db.session.get(StockSnapshotRun, day)
+        run.status = DONE
+        run.products = total
+        run.finished_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        run.duration_ms = int((_time.perf_counter() - started) * 1000)
+        db.session.commit()
+        return run
+
+    @classmethod
+    def due(cls, interval_days: int, today: Optional[date] = None) -> bool:
+        """True when the latest snapshot is *interval_days* or more old."""
+        today = today or datetime.now(timezone.utc).date()
+        latest = StockSnapshotRun.nearest(today)
+        return latest is None or (today - latest).days >= interval_days
+
+    @staticmethod
+    def _batch_bound(after: str, batch_size: int) -> Optional[str]:
+        """Last ``product_id`` of the next range, ``None`` for the final range."""
+        from .producto import Product  # avoid circular import
+
+        return (
+            db.session.query(Product.product_id)
+            .filter(Product.product_id > after)
+            .order_by(Product.product_id)
+            .offset(batch_size - 1)
+            .limit(1)
+            .scalar()
+        )
+
+    @classmethod
+    def _insert_batch(cls, day: date, after: str, bound: Optional[str]) -> int:
+        from .producto import Product  # avoid circular import
+
+        d = DailyProductDemand
+        since = select(d.product_id, func.sum(d.net).label("net")).where(
+            d.day >= day, d.product_id > after
+        )
+        in_range = [Product.product_id > after]
+        if bound is not None:
+            since = since.where(d.product_id <= bound)
+            in_range.append(Product.product_id <= bound)
+        since = since.group_by(d.product_id).subquery()
+
+        source = (
+            select(
+                literal(day, db.Date),
+                Product.product_id,
+                Product.stk_qty - func.coalesce(since.c.net, 0),
+            )
+            .select_from(Product)
+            .outerjoin(since, since.c.product_id == Product.product_id)
+            .where(*in_range, _created_before(day))
+        )
+        result = db.session.execute(
+            insert(cls).from_select(["day", "product_id", "stk_qty"], source)
+        )
+        return result.rowcount
+
+    # ---------------------------------------------------------------------
+    # Point-in-time reads
+    # ---------------------------------------------------------------------
+    @classmethod
+    def as_of(
+        cls, at: datetime, product_ids: Optional[List[str]] = None
+    ) -> Tuple[dict, Dict[str, int]]:
+        """Stock of *product_ids* (default: every product) at instant *at*.
+
+        Returns ``(info, {product_id: stk_qty})``. *info* names the base
+        that was used: ``snapshot_day`` and ``direction`` (``forward`` /
+        ``backward``), with ``snapshot_day`` ``None`` for the current stock.
+        """
+        at = _utc_naive(at)
+        day = at.date()
+        base_day = StockSnapshotRun.nearest(day)
+        if base_day is None:
+            later = StockSnapshotRun.nearest(day, before=False)
+            stock = cls._backward(at, later, product_ids)
+            return {"snapshot_day": later, "direction": "backward"}, stock
+
+        query = db.session.query(cls.product_id, cls.stk_qty).filter(cls.day == base_day)
+        if product_ids is not None:
+            query = query.filter(cls.product_id.in_(product_ids))
+        stock = dict(query.all())
+        if stock:
+            _add(stock, DailyProductDemand.net_between(base_day, day, product_ids), 1)
+            _add(stock, _day_movements(at, True, product_ids), 1)
+
+        # Products that did not exist at the snapshot: backwards from now.
+        if product_ids is not None:
+            missing = [pid for pid in product_ids if pid not in stock]
+        else:
+            missing = _created_between(base_day, day)
+        if missing:
+            stock.update(cls._backward(at, None, missing))
+        return {"snapshot_day": base_day, "direction": "forward"}, stock
+
+    @classmethod
+    def _backward(
+        cls, at: datetime, later: Optional[date], product_ids: Optional[List[str]]
+    ) -> Dict[str, int]:
+        """Stock at *at* from snapshot *later* (or current stock) minus
+        everything that moved in between."""
+        from .producto import Product  # avoid circular import
+
+        day = at.date()
+        if later is not None:
+            query = db.session.query(cls.product_id, cls.stk_qty).filter(cls.day == later)
+            if product_ids is not None:
+                query = query.filter(cls.product_id.in_(product_ids))
+        else:
+            query = db.session.query(Product.product_id, Product.stk_qty).filter(
+                _created_before(day + timedelta(days=1))
+            )
+            if product_ids is not None:
+                query = query.filter(Product.product_id.in_(product_ids))
+        stock = dict(query.all())
+        if stock:
+            after_day = day + timedelta(days=1)
+            _add(stock, _day_movements(at, False, product_ids), -1)
+            _add(stock, DailyProductDemand.net_between(after_day, later, product_ids), -1)
+        return stock
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+def _add(stock: Dict[str, int], rows: Iterable[Tuple[str, int]], sign: int) -> None:
+    """Fold ``(product_id, net)`` into *stock*, ignoring products not in it.
+
+    Whole-catalog reads pass no id filter to SQL (no huge ``IN`` lists), so
+    rows of products outside *stock* can show up here.
+    """
+    for pid, net in rows:
+        if pid in stock and net:
+            stock[pid] += sign * int(net)
+
+
+def _day_movements(at: datetime, before: bool, product_ids: Optional[List[str]]):
+    """``(product_id, net)`` of the movements of *at*'s day before *at*
+    (*before*) or from *at* on, read from the ledger and the archive."""
+    from ..services import archive
+    from .movimiento import InventoryMovement as mv  # avoid circular import
+
+    midnight = datetime.combine(at.date(), time())
+    next_day = midnight + timedelta(days=1)
+    start, end = (midnight, at) if before else (at, next_day)
+    if start >= end:
+        return []
+
+    net: Dict[str, int] = {}
+    # Whole day by its text prefix (works for every stored ISO layout), then
+    # the exact bound in Python.
+    raw = type_coerce(mv.date, db.String)
+    rows = db.session.query(mv.product_id, mv.date, mv.movement_type, mv.quantity).filter(
+        raw >= midnight.date().isoformat(), raw < next_day.date().isoformat()
+    )
+    if product_ids is not None:
+        rows = rows.filter(mv.product_id.in_(product_ids))
+    for pid, when, movement_type, quantity in rows:
+        if start <= _utc_naive(when) < end:
+            net[pid] = net.get(pid, 0) + (-quantity if movement_type == "OUT" else quantity)
+    for chunk in archive.iter_chunks(start, end, product_ids):
+        for pid, movement_type, quantity in zip(
+            chunk.product_id.tolist(), chunk.movement_type.tolist(), chunk.quantity.tolist()
+        ):
+            net[pid] = net.get(pid, 0) + (-quantity if movement_type == "OUT" else quantity)
+    return net.items()
+
+
+def _created_before(day: date):
+    """``product.created_at < day`` on the stored text (either ISO layout)."""
+    from .producto import Product  # avoid circular import
+
+    return or_(
+        Product.created_at.is_(None),
+        type_coerce(Product.created_at, db.String) < day.isoformat(),
+    )
+
+
+def _created_between(start: date, day: date) -> List[str]:
+    """Ids of products created on or after *start* and no later than *day*."""
+    from .producto import Product  # avoid circular import
+
+    created = type_coerce(Product.created_at, db.String)
+    return [
+        pid
+        for (pid,) in db.session.query(Product.product_id).filter(
+            created >= start.isoformat(), created < (day + timedelta(days=1)).isoformat()
+        )
+    ]
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -19,20 +19,50 @@ Revision History
   both “YYYY‑MM‑DDTHH:MM:SS” and “YYYY‑MM‑DD HH:MM:SS”.
 * 2025‑06‑16 – Added dash normalisation in `_coerce_date` to fix "Invalid
   isoformat string" with non‑ASCII hyphens.
+* 2026‑10‑16 – `forecast_purchase_needs` delegates the per-product arithmetic to the
+  vectorised engine in :mod:`app.services.forecast`.
+* 2026‑10‑16 – create/update/delete keep the ``daily_product_demand`` rollup
+  in the same transaction; the forecast reads the rollup only.
+* 2026‑10‑16 – Writes bump the ``inventory_movement`` data version and
+  `forecast_watermark` exposes it for forecast caching.
+* 2026‑10‑16 – `record` stages a ledger row (rollup and version included)
+  without committing, so stock adjustments write it in their own
+  transaction; `record_many` is its one-executemany bulk counterpart.
+* 2026‑10‑16 – `get_page` pages newest first with an opaque
+  ``(date, movement_id)`` keyset cursor and optional filters, returning
+  plain dicts built from column tuples.
+* 2026‑10‑16 – `iter_dicts` and `iter_rows` stream plain column tuples in
+  ``yield_per`` batches for the JSON list and the CSV/Parquet exports.
+* 2026‑10‑16 – `forecast_scenarios` evaluates several scenarios over one
+  load of the rollup, with stock and names from the catalog cache.
+* 2026‑10‑16 – Old rows may be archived out of this table
+  (:mod:`app.services.archive`). The rollup keeps them, so the forecast's
+  all-history fallback is unaffected; ledger listings cover the hot table
+  only.
 """
 
 from __future__ import annotations
 
+from dataclasses import asdict
 from datetime import datetime, timezone ,timedelta
-from typing import Optional, Union, Dict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 import re  # for dash normalisation
-import statistics
+from uuid import uuid4
+
+import numpy as np
 
 from flask import current_app
+from sqlalchemy import and_, func, or_, type_coerce
 from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
 
 from .. import db
+from ..services.catalog import get_catalog
+from ..services.forecast import DemandMatrix, Scenario, scenario_needs
+from ..services.paging import decode_cursor, encode_cursor
+from ..services.streaming import iter_dicts
+from .demanda import DailyProductDemand
+from .version import DataVersion
 
 
 class InventoryMovement(db.Model):
@@ -71,6 +101,12 @@ class InventoryMovement(db.Model):
             "notes": self.notes,
         }
 
+    def _rollup(self, sign: int) -> None:
+        """Fold this movement into (``1``) or out of (``-1``) the daily rollup."""
+        DailyProductDemand.apply(
+            self.product_id, self.date, self.movement_type, self.quantity, sign
+        )
+
     # Static / class utilities -------------------------------------------
     _DASH_PATTERN = re.compile(r"[\u2010-\u2015\u2212]")
 
@@ -117,8 +153,7 @@ class InventoryMovement(db.Model):
             raise ValueError("La cantidad debe ser un entero")
 
         try:
-            movement = cls(**data)  # type: ignore[arg-type]
-            db.session.add(movement)
+            movement = cls._stage(cls(**data))  # type: ignore[arg-type]
             db.session.commit()
             return movement
         except (IntegrityError, DataError) as exc:
@@ -130,6 +165,75 @@ class InventoryMovement(db.Model):
             current_app.logger.exception("Error inesperado al crear movimiento")
             raise
 
+    @classmethod
+    def record(
+        cls,
+        product_id: str,
+        movement_type: str,
+        quantity: int,
+        *,
+        order_id: Optional[str] = None,
+        notes: Optional[str] = None,
+    ) -> "InventoryMovement":
+        """Stage a movement dated now in the current transaction (no commit).
+
+        Used by stock adjustments so the ledger row commits together with the
+        ``stk_qty`` change.
+        """
+        return cls._stage(
+            cls(
+                movement_id=str(uuid4()),
+                date=datetime.now(timezone.utc),
+                product_id=product_id,
+                movement_type=movement_type,
+                quantity=quantity,
+                order_id=order_id,
+                notes=notes,
+            )
+        )
+
+    @classmethod
+    def record_many(
+        cls,
+        lines: List[Tuple[str, str, int]],
+        *,
+        order_id: Optional[str] = None,
+        notes: Optional[str] = None,
+    ) -> None:
+        """Stage ``(product_id, movement_type, quantity)`` rows in one executemany.
+
+        Bulk counterpart of :meth:`record`: same timestamp for every row, one
+        rollup upsert and one version bump. Does not commit.
+        """
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                "movement_id": str(uuid4()),
+                "date": now,
+                "product_id": product_id,
+                "movement_type": movement_type,
+                "quantity": quantity,
+                "order_id": order_id,
+                "notes": notes,
+            }
+            for product_id, movement_type, quantity in lines
+        ]
+        if not rows:
+            return
+        db.session.execute(cls.__table__.insert(), rows)
+        DailyProductDemand.apply_many(
+            (product_id, now, movement_type, quantity)
+            for product_id, movement_type, quantity in lines
+        )
+        DataVersion.bump(cls.__tablename__)
+
+    @classmethod
+    def _stage(cls, movement: "InventoryMovement") -> "InventoryMovement":
+        db.session.add(movement)
+        movement._rollup(1)
+        DataVersion.bump(cls.__tablename__)
+        return movement
+
     @classmethod
     def get_all(cls, page: Optional[int] = None, per_page: Optional[int] = None):
         """Return a list or Pagination of movements, newest first."""
@@ -138,6 +242,102 @@ class InventoryMovement(db.Model):
             return query.paginate(page=page, per_page=per_page, error_out=False)
         return query.all()
 
+    @classmethod
+    def get_page(
+        cls,
+        limit: int,
+        cursor: Optional[str] = None,
+        *,
+        product_id: Optional[str] = None,
+        movement_type: Optional[str] = None,
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Return ``(rows, next_cursor)`` newest first, keyset-paginated.
+
+        *rows* are ``to_dict``-shaped dicts built from plain column tuples
+        (no ORM instances). Rows are ordered by ``(date, movement_id)``
+        descending and *cursor* is the opaque token of the previous page
+        (``None`` for the first one). ``next_cursor`` is ``None`` on the last
+        page. Filters use the ``date`` and ``product_id`` indexes; *date_to*
+        is exclusive.
+        """
+        # Compare the stored text as-is so the seek predicate matches the
+        # ORDER BY even for rows written with a different ISO layout.
+        raw_date = type_coerce(cls.date, db.String)
+        columns = list(cls.__table__.c)
+        query = cls._filtered(
+            db.session.query(*columns, raw_date), product_id, movement_type, date_from, date_to
+        )
+        if cursor:
+            last_date, last_id = decode_cursor(cursor, 2)
+            query = query.filter(
+                or_(
+                    raw_date < last_date,
+                    and_(raw_date == last_date, cls.movement_id < last_id),
+                )
+            )
+
+        rows = (
+            query.order_by(cls.date.desc(), cls.movement_id.desc()).limit(limit + 1).all()
+        )
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][-1], rows[-1].movement_id])
+        return list(iter_dicts(columns, (row[:-1] for row in rows))), next_cursor
+
+    @classmethod
+    def iter_dicts(
+        cls,
+        *,
+        product_id: Optional[str] = None,
+        movement_type: Optional[str] = None,
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+        batch_size: int = 1000,
+    ):
+        """Lazily yield ``to_dict``-shaped rows, newest first, without the ORM.
+
+        Selects plain column tuples in batches of *batch_size*; filters as in
+        :meth:`get_page`.
+        """
+        columns = list(cls.__table__.c)
+        query = cls._filtered(
+            db.session.query(*columns), product_id, movement_type, date_from, date_to
+        )
+        query = query.order_by(cls.date.desc(), cls.movement_id.desc())
+        return iter_dicts(columns, query.yield_per(batch_size))
+
+    @classmethod
+    def iter_rows(
+        cls,
+        columns,
+        *,
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+        batch_size: int = 1000,
+    ):
+        """Lazily yield tuples of *columns*, oldest first, for bulk exports.
+
+        Uses ``yield_per`` so rows are fetched in batches of *batch_size*;
+        *date_to* is exclusive.
+        """
+        query = cls._filtered(db.session.query(*columns), None, None, date_from, date_to)
+        return query.order_by(cls.date, cls.movement_id).yield_per(batch_size)
+
+    @classmethod
+    def _filtered(cls, query, product_id, movement_type, date_from, date_to):
+        if product_id:
+            query = query.filter(cls.product_id == product_id)
+        if movement_type:
+            query = query.filter(cls.movement_type == movement_type)
+        if date_from:
+            query = query.filter(cls.date >= cls._coerce_date(date_from))
+        if date_to:
+            query = query.filter(cls.date < cls._coerce_date(date_to))
+        return query
+
     @classmethod
     def update(cls, movement_id: str, data: dict) -> "InventoryMovement":
         """Update the record identified by *movement_id* with *data*."""
@@ -146,11 +346,14 @@ class InventoryMovement(db.Model):
             raise ValueError("Movimiento no encontrado")
 
         try:
+            movement._rollup(-1)
             for key, value in data.items():
                 if key == "date":
                     value = cls._coerce_date(value)
                 if hasattr(movement, key):
                     setattr(movement, key, value)
+            movement._rollup(1)
+            DataVersion.bump(cls.__tablename__)
             db.session.commit()
             return movement
         except Exception:
@@ -165,7 +368,9 @@ class InventoryMovement(db.Model):
         if not movement:
             raise ValueError("Movimiento no encontrado")
         try:
+            movement._rollup(-1)
             db.session.delete(movement)
+            DataVersion.bump(cls.__tablename__)
             db.session.commit()
         except Exception:
             db.session.rollback()
@@ -186,60 +391,133 @@ class InventoryMovement(db.Model):
     ) -> Dict[str, int]:
         """Return ``{product_id: qty_to_order}`` using simple moving average.
 
+        Daily nets are read from the ``daily_product_demand`` rollup (never
+        the raw ledger) and the arithmetic runs in one batched NumPy pass over
+        a dense ``(product × day)`` matrix, see :mod:`app.services.forecast`.
         If fewer than *min_records* movements are found in the window, the query
         widens to include all history.
         """
+        scenario = Scenario(horizon_days, cover_days, window_days)
+        product_ids, qty = cls.forecast_scenarios([scenario], min_records=min_records)
+        return {product_ids[i]: int(qty[i, 0]) for i in np.flatnonzero(qty[:, 0])}
+
+    @classmethod
+    def forecast_scenarios(
+        cls,
+        scenarios: Sequence[Scenario],
+        *,
+        min_records: int = 30,
+        product_ids: Optional[Sequence[str]] = None,
+        category: Optional[str] = None,
+    ) -> Tuple[List[str], np.ndarray]:
+        """Evaluate several scenarios over one load of the demand rollup.
+
+        Returns ``(product_ids, qty)`` where ``qty[i, j]`` is the quantity to
+        order of ``product_ids[i]`` under ``scenarios[j]``. The rollup is read
+        once for the widest window (plus once more for all history if some
+        scenario has fewer than *min_records* movements in its window),
+        optionally restricted to *product_ids* and/or *category*; stock comes
+        from the catalog cache (:mod:`app.services.catalog`).
+        """
         from ..models.producto import Product  # avoid circular import
 
-        sess = db.session
-        today = datetime.utcnow().date()
-        start = today - timedelta(days=window_days)
+        if not scenarios:
+            return [], np.zeros((0, 0), dtype=np.int64)
 
-        rows = list(
-            sess.query(cls.product_id, cls.date, cls.movement_type, cls.quantity)
-            .filter(cls.date >= start)
-            .all()
+        products = None
+        if product_ids or category:
+            products = db.select(Product.product_id)
+            if product_ids:
+                products = products.where(Product.product_id.in_(list(product_ids)))
+            if category:
+                products = products.where(Product.category == category)
+
+        today = datetime.utcnow().date()
+        origin = today - timedelta(days=max(sc.window_days for sc in scenarios))
+        matrix = DemandMatrix.from_daily_net(
+            DailyProductDemand.daily_net(start=origin, products=products),
+            origin,
+            (today - origin).days + 1,
         )
 
-        if len(rows) < min_records:
-            rows = list(sess.query(cls.product_id, cls.date, cls.movement_type, cls.quantity).all())
-            if rows:
-                earliest = min(r[1] for r in rows).date()
-                window_days = (today - earliest).days + 1
-                start = earliest
-
-        # Aggregate to daily net per product
-        daily_net: Dict[str, Dict[datetime, int]] = {}
-        for pid, dt, typ, qty in rows:
-            day = dt.date()
-            signed = -qty if typ == "OUT" else qty
-            daily_net.setdefault(pid, {}).setdefault(day, 0)
-            daily_net[pid][day] += signed
-
-        stock = {p.product_id: p.stk_qty for p in sess.query(Product).all()}
-        needs: Dict[str, int] = {}
-
-        for pid, by_day in daily_net.items():
-            series = [by_day.get(start + timedelta(d), 0) for d in range(window_days)]
-            non_zero = [v for v in series if v != 0]
-            if len(non_zero) < max(1, min_records // 3):  # evitar promedio sobre muchos ceros
-                continue
-            avg_daily = statistics.mean(non_zero)
-            demand = avg_daily * horizon_days
-            buffer = avg_daily * cover_days
-            qty = max(int(round(demand + buffer - stock.get(pid, 0))), 0)
-            if qty:
-                needs[pid] = qty
-        return needs
+        widened = [
+            matrix.movements_since(today - timedelta(days=sc.window_days)) < min_records
+            for sc in scenarios
+        ]
+        if any(widened):
+            earliest = DailyProductDemand.earliest_day(products=products)
+            if earliest is None:
+                widened = []
+            else:
+                matrix = DemandMatrix.from_daily_net(
+                    DailyProductDemand.daily_net(products=products),
+                    earliest,
+                    (today - earliest).days + 1,
+                )
+
+        if products is None:
+            stock = {e.product_id: e.stk_qty for e in get_catalog().all()}
+        else:
+            stock = {
+                pid: e.stk_qty for pid, e in get_catalog().many(matrix.product_ids).items()
+            }
+        qty = scenario_needs(
+            matrix,
+            stock,
+            scenarios,
+            today=today,
+            min_records=min_records,
+            widened=widened,
+        )
+        return list(matrix.product_ids), qty
 
     @classmethod
     def forecast_purchase_needs_list(cls, **kwargs):
         """Return list ``[{producto, prediccion}, …]`` ready for frontend."""
-        from ..models.producto import Product
-
         needs = cls.forecast_purchase_needs(**kwargs)
-        names = {p.product_id: p.product_name for p in db.session.query(Product).all()}
+        names = cls._product_names(list(needs))
         return [
             {"producto": names.get(pid, pid), "prediccion": qty}
             for pid, qty in needs.items()
         ]
+
+    @classmethod
+    def forecast_scenarios_table(cls, scenarios: Sequence[Scenario], **kwargs):
+        """Return :meth:`forecast_scenarios` as a JSON-ready dict.
+
+        Only products needing a purchase in at least one scenario are listed;
+        ``needs[i][j]`` is the quantity of ``products[i]`` under scenario *j*.
+        """
+        product_ids, qty = cls.forecast_scenarios(scenarios, **kwargs)
+        rows = np.flatnonzero(qty.any(axis=1)) if qty.size else []
+        ids = [product_ids[i] for i in rows]
+        names = cls._product_names(ids)
+        return {
+            "scenarios": [asdict(sc) for sc in scenarios],
+            "products": [{"product_id": pid, "producto": names.get(pid, pid)} for pid in ids],
+            "needs": qty[rows].tolist() if len(ids) else [],
+        }
+
+    @staticmethod
+    def _product_names(ids: List[str]) -> Dict[str, str]:
+        return {pid: e.product_name for pid, e in get_catalog().many(ids).items()}
+
+    @classmethod
+    def forecast_watermark(cls):
+        """Return ``(watermark, last_modified)`` for caching forecast results.
+
+        The watermark changes whenever a movement is written, a product is
+        created or updated (stock included) or the calendar day rolls over.
+        """
+        from ..models.producto import Product
+
+        version, movements_at = DataVersion.current(cls.__tablename__)
+        products_at, products = db.session.query(
+            func.max(Product.updated_at), func.count()
+        ).one()
+        today = datetime.utcnow().date()
+        # The forecast window moves at midnight even without new data.
+        stamps = [datetime.combine(today, datetime.min.time())]
+        stamps += [ts.replace(tzinfo=None) for ts in (movements_at, products_at) if ts]
+        last_modified = max(stamps)
+        return (today.isoformat(), version, products, str(products_at)), last_modified
@@ -0,0 +1,193 @@
+"""Precomputed purchase forecasts and the status of the job that builds them.
+
+One row per precomputed parameter set (``horizon_days``, ``window_days``,
+``cover_days``, ``min_records``). The row stores the last finished result,
+the data watermark it was computed against, and the state of the current or
+last run. Request handlers serve the stored result, and the background
+scheduler (:mod:`app.services.scheduler`) refreshes it.
+
+Assumptions
+-----------
+* A run claims its row with a conditional ``UPDATE``, so only one worker
+  computes a given parameter set at a time. Claims older than
+  ``FORECAST_JOB_TIMEOUT`` seconds are treated as abandoned.
+* Only the default parameter set is stored. Other sets requested by clients
+  are computed on demand and kept in the in-process forecast cache, so
+  query strings cannot grow this table or the scheduler's work.
+* The watermark is the same one used by the in-process forecast cache
+  (:meth:`InventoryMovement.forecast_watermark`). A row whose watermark
+  differs from the current one is stale, but it can still be served.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from .movimiento import InventoryMovement
+from .version import DataVersion
+
+STATUS_IDLE = "idle"
+STATUS_RUNNING = "running"
+STATUS_FAILED = "failed"
+
+
+def params_key(params: Dict[str, int]) -> str:
+    """Stable row key for a forecast parameter set, e.g. ``c=30,h=90,m=30,w=180``."""
+    short = {"horizon_days": "h", "window_days": "w", "cover_days": "c", "min_records": "m"}
+    return ",".join(f"{short[k]}={params[k]}" for k in sorted(params, key=short.get))
+
+
+class ForecastResult(db.Model):
+    """Latest forecast for one parameter set, plus its job status."""
+
+    __tablename__ = "forecast_result"
+
+    # Columns -----------------------------------------------------------------
+    params_key: str = db.Column(db.String(64), primary_key=True)
+    params: dict = db.Column(db.JSON, nullable=False)
+    result: Optional[list] = db.Column(db.JSON, nullable=True)
+    watermark: Optional[str] = db.Column(db.String(200), nullable=True)
+    movements_version: int = db.Column(db.Integer, nullable=False, default=0)
+    computed_at: Optional[datetime] = db.Column(db.DateTime, nullable=True)
+    duration_ms: Optional[float] = db.Column(db.Float, nullable=True)
+    status: str = db.Column(db.String(10), nullable=False, default=STATUS_IDLE)
+    started_at: Optional[datetime] = db.Column(db.DateTime, nullable=True)
+    error: Optional[str] = db.Column(db.Text, nullable=True)
+    runs: int = db.Column(db.Integer, nullable=False, default=0)
+
+    # ---------------------------------------------------------------------
+    # Read helpers
+    # ---------------------------------------------------------------------
+    @classmethod
+    def latest(cls, params: Dict[str, int]) -> Optional["ForecastResult"]:
+        """Stored row for *params* if it has a finished result, else ``None``."""
+        row = db.session.get(cls, params_key(params))
+        return row if row is not None and row.computed_at is not None else None
+
+    @classmethod
+    def wait_latest(
+        cls, params: Dict[str, int], timeout: float, interval: float = 0.2
+    ) -> Optional["ForecastResult"]:
+        """Poll :meth:`latest` while another worker computes *params*.
+
+        Each poll starts a new transaction so the other worker's commit is
+        seen. Returns ``None`` if no result is stored within *timeout*
+        seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            db.session.rollback()
+            row = cls.latest(params)
+            if row is not None or time.monotonic() >= deadline:
+                return row
+            time.sleep(interval)
+
+    @classmethod
+    def prune(cls, keep: Iterable[str]) -> int:
+        """Delete the rows whose key is not in *keep* and commit."""
+        deleted = (
+            db.session.query(cls)
+            .filter(cls.params_key.notin_(list(keep)))
+            .delete(synchronize_session=False)
+        )
+        db.session.commit()
+        return deleted
+
+    def is_stale(self, watermark: Tuple) -> bool:
+        return self.watermark != repr(watermark)
+
+    def to_status(self, movements_version: int, watermark: Tuple) -> dict:
+        """Job status without the (potentially large) result payload."""
+        return {
+            "params": self.params,
+            "status": self.status,
+            "computed_at": _iso(self.computed_at),
+            "started_at": _iso(self.started_at),
+            "duration_ms": self.duration_ms,
+            "runs": self.runs,
+            "error": self.error,
+            "stale": self.is_stale(watermark),
+            "pending_movements": max(movements_version - self.movements_version, 0),
+        }
+
+    # ---------------------------------------------------------------------
+    # Job
+    # ---------------------------------------------------------------------
+    @classmethod
+    def refresh(cls, params: Dict[str, int], *, force: bool = False) -> Optional["ForecastResult"]:
+        """Compute the forecast for *params*, persist it and return the row.
+
+        Returns ``None`` if another worker holds a live claim on the row and
+        *force* is false. A failed run is recorded in the row (``status``
+        ``failed`` with its ``error``) and the exception is re-raised.
+        """
+        key = params_key(params)
+        if not cls._claim(key, params, force):
+            return None
+
+        started = time.perf_counter()
+        try:
+            # Read the counters first: writes that land while we compute make
+            # the stored result stale and trigger another run.
+            movements_version, _ = DataVersion.current(InventoryMovement.__tablename__)
+            watermark, _ = InventoryMovement.forecast_watermark()
+            result = InventoryMovement.forecast_purchase_needs_list(**params)
+        except Exception as exc:
+            db.session.rollback()
+            cls._finish(key, status=STATUS_FAILED, error=str(exc)[:1000])
+            raise
+
+        return cls._finish(
+            key,
+            status=STATUS_IDLE,
+            error=None,
+            result=result,
+            watermark=repr(watermark),
+            movements_version=movements_version,
+            computed_at=datetime.now(timezone.utc).replace(tzinfo=None),
+            duration_ms=round((time.perf_counter() - started) * 1000, 3),
+        )
+
+    @classmethod
+    def _claim(cls, key: str, params: Dict[str, int], force: bool) -> bool:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        timeout = timedelta(seconds=current_app.config["FORECAST_JOB_TIMEOUT"])
+        query = db.session.query(cls).filter(cls.params_key == key)
+        if not force:
+            query = query.filter(
+                or_(cls.status != STATUS_RUNNING, cls.started_at < now - timeout)
+            )
+        claimed = query.update(
+            {cls.status: STATUS_RUNNING, cls.started_at: now}, synchronize_session=False
+        )
+        if not claimed:
+            if db.session.get(cls, key) is not None:
+                db.session.rollback()
+                return False
+            db.session.add(cls(params_key=key, params=params, status=STATUS_RUNNING, started_at=now))
+        try:
+            db.session.commit()
+        except IntegrityError:  # another worker created the row first
+            db.session.rollback()
+            return False
+        return True
+
+    @classmethod
+    def _finish(cls, key: str, **values) -> "ForecastResult":
+        row = db.session.get(cls, key)
+        for field, value in values.items():
+            setattr(row, field, value)
+        row.runs = (row.runs or 0) + 1
+        db.session.commit()
+        return row
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.replace(tzinfo=timezone.utc).isoformat() if value else None
@@ -1,11 +1,30 @@
 from datetime import datetime, timezone
 from uuid import uuid4
+from sqlalchemy import and_, bindparam, false, func, literal_column, or_, type_coerce, update
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, DataError
 from flask import current_app
 from .. import db
+from .evento import StockEvent
+from .valoracion import StockValuation
+from ..services.catalog import get_catalog, mark_changed
+from ..services.search import fts_available, match_expression, matching_rowids
+from ..services.paging import decode_cursor, encode_cursor
+from ..services.streaming import iter_dicts
 
 class Product(db.Model):
     __tablename__ = "product"
+    # Índices compuestos para la búsqueda: filtro de igualdad primero, luego
+    # la columna de orden o de rango y el desempate ``product_id`` (ver
+    # ``search``), para que el ORDER BY + LIMIT se resuelva sin ordenar.
+    __table_args__ = (
+        db.Index("ix_product_active_name", "active", "product_name", "product_id"),
+        db.Index("ix_product_active_sku", "active", "sku", "product_id"),
+        db.Index("ix_product_active_category_name",
+                 "active", "category", "product_name", "product_id"),
+        db.Index("ix_product_active_location_name",
+                 "active", "location", "product_name", "product_id"),
+        db.Index("ix_product_active_stock", "active", "stk_qty", "product_id"),
+    )
 
     product_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     product_name = db.Column(db.String(100), nullable=False)
@@ -18,9 +37,15 @@ class Product(db.Model):
     stk_qty = db.Column(db.Integer, nullable=False)
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # El índice de ``updated_at`` ya no lo usa el delta sync (``change_seq``);
+    # se mantiene para ``search(sort="updated")`` y el ``max`` de ``sync_token``.
     updated_at = db.Column(db.DateTime,
                          default=lambda: datetime.now(timezone.utc),
-                         onupdate=lambda: datetime.now(timezone.utc))
+                         onupdate=lambda: datetime.now(timezone.utc),
+                         index=True)
+    # Versión del catálogo (``data_version`` "product") de la última
+    # escritura; es el token de delta sync (ver ``sync_token``).
+    change_seq = db.Column(db.BigInteger, index=True)
 
     def to_dict(self):
         """Versión única del método to_dict"""
@@ -49,6 +74,9 @@ class Product(db.Model):
 
             product = cls(**data)
             db.session.add(product)
+            db.session.flush()  # asigna product_id
+            mark_changed([product.product_id])
+            StockValuation.restore([product.product_id], _low_stock())
             db.session.commit()
             return product
 
@@ -72,6 +100,113 @@ class Product(db.Model):
             query = query.filter_by(active=True)
         return query.all()
 
+    @classmethod
+    def iter_dicts(cls, active_only=True, batch_size=1000):
+        """Igual que ``get_all`` + ``to_dict`` pero sin ORM, en lotes (streaming)."""
+        columns = [c for c in cls.__table__.c if c.key != "change_seq"]
+        query = db.session.query(*columns)
+        if active_only:
+            query = query.filter(cls.active.is_(True))
+        return iter_dicts(columns, query.yield_per(batch_size))
+
+    # ─── Sincronización incremental (delta sync) ──────────────────
+    # Alta, edición, (des)activación y ajustes de stock guardan en
+    # ``change_seq`` la versión del catálogo que su transacción incrementa
+    # justo antes del commit (``mark_changed``). Esa fila de ``data_version``
+    # queda bloqueada solo hasta el commit, así que los valores se asignan
+    # en orden de commit: a diferencia de ``updated_at`` (hora tomada antes
+    # del commit), un cliente con token N nunca pierde una escritura que
+    # confirme después con un valor <= N.
+    @classmethod
+    def sync_token(cls):
+        """Devuelve ``(token, last_modified)`` del catálogo actual."""
+        seq, count, last = db.session.query(
+            func.max(cls.change_seq), func.count(), func.max(cls.updated_at)
+        ).one()
+        return (encode_cursor([seq or 0]) if count else None), last
+
+    @classmethod
+    def changed_since(cls, token: str):
+        """Productos creados o modificados desde *token* (activos o no)."""
+        (since,) = decode_cursor(token, 1)
+        if isinstance(since, bool) or not isinstance(since, int):
+            raise ValueError("Token de sincronización inválido")
+        return cls.query.filter(cls.change_seq > since).order_by(cls.change_seq).all()
+
+    # ─── Búsqueda, filtros y orden en el servidor ─────────────────
+    SEARCH_SORTS = {
+        "name": "product_name",
+        "sku": "sku",
+        "stock": "stk_qty",
+        "category": "category",
+        "updated": "updated_at",
+    }
+
+    @classmethod
+    def search(cls, limit: int, cursor=None, *, q=None, prefix=None, category=None,
+               location=None, active=True, stock_below=None, sort="name"):
+        """Devuelve ``(productos, next_cursor)`` filtrados, ordenados y paginados.
+
+        *q* busca todas las palabras en el nombre (FTS5 si está disponible) y
+        *prefix* es prefijo de SKU o de una palabra del nombre. *active*
+        ``None`` incluye activos e inactivos. *sort* es una clave de
+        ``SEARCH_SORTS``, con ``-`` delante para orden descendente; el
+        desempate es ``product_id`` y el cursor es el token de la página
+        anterior.
+        """
+        descending = sort.startswith("-")
+        field = cls.SEARCH_SORTS.get(sort.lstrip("-"))
+        if field is None:
+            raise ValueError(f"Orden inválido: {sort}")
+        column = getattr(cls, field)
+        # updated_at se compara como texto guardado, como lo ordena el índice.
+        key = type_coerce(column, db.String) if field == "updated_at" else column
+
+        query = db.session.query(cls, key)
+        if active is not None:
+            query = query.filter(cls.active.is_(bool(active)))
+        if category:
+            query = query.filter(cls.category == category)
+        if location:
+            query = query.filter(cls.location == location)
+        if stock_below is not None:
+            query = query.filter(cls.stk_qty < stock_below)
+        if q:
+            query = query.filter(cls._name_matches(q, prefix=False))
+        if prefix:
+            upper = prefix.upper()
+            sku_ranges = [
+                and_(cls.sku >= p, cls.sku < p + "\U0010ffff") for p in {prefix, upper}
+            ]
+            query = query.filter(or_(*sku_ranges, cls._name_matches(prefix, prefix=True)))
+
+        if cursor:
+            last_key, last_id = decode_cursor(cursor, 2)
+            if descending:
+                seek = or_(key < last_key, and_(key == last_key, cls.product_id < last_id))
+            else:
+                seek = or_(key > last_key, and_(key == last_key, cls.product_id > last_id))
+            query = query.filter(seek)
+
+        order = (column.desc(), cls.product_id.desc()) if descending else (column, cls.product_id)
+        rows = query.order_by(*order).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][1], rows[-1][0].product_id])
+        return [product for product, _ in rows], next_cursor
+
+    @classmethod
+    def _name_matches(cls, text, prefix):
+        expression = match_expression(text, prefix=prefix)
+        if expression is None:
+            return false()
+        if fts_available(current_app):
+            return literal_column("product.rowid").in_(matching_rowids(expression))
+        if prefix:
+            return cls.product_name.ilike(f"{text}%")
+        return and_(*(cls.product_name.ilike(f"%{w}%") for w in text.split()))
+
     @classmethod
     def get_by_id(cls, product_id):
         return cls.query.filter_by(product_id=product_id).first()
@@ -79,10 +214,14 @@ class Product(db.Model):
          # ─── Actualiza campos arbitrarios en la instancia ─────────────
     def update(self, data: dict):
         try:
+            mark_changed([self.product_id])
+            StockValuation.retract([self.product_id], _low_stock())
             for k, v in data.items():
                 # Solo permite campos existentes (evita AttributeError)
                 if hasattr(self, k):
                     setattr(self, k, v)
+            StockValuation.restore([self.product_id], _low_stock())
+            StockEvent.emit(self, "update")
             db.session.commit()
             return self
         except (IntegrityError, DataError) as e:
@@ -92,39 +231,185 @@ class Product(db.Model):
 
     # ─── Baja lógica / reactivación ───────────────────────────────
     def deactivate(self):
+        mark_changed([self.product_id])
+        StockValuation.retract([self.product_id], _low_stock())
         self.active = False
+        StockValuation.restore([self.product_id], _low_stock())
+        StockEvent.emit(self, "deactivate")
         db.session.commit()
 
     def activate(self):
+        mark_changed([self.product_id])
+        StockValuation.retract([self.product_id], _low_stock())
         self.active = True
+        StockValuation.restore([self.product_id], _low_stock())
+        StockEvent.emit(self, "activate")
         db.session.commit()
 
     # ─── Ajuste de stock (métodos de clase) ──────────────────────
+    # Un único UPDATE condicional (sin cargar el objeto) más el movimiento en
+    # el ledger, en la misma transacción: sin actualizaciones perdidas ni
+    # sobreventa con varios workers.
     @classmethod
-    def add_stock(cls, product_id: str, qty: int):
-        if qty <= 0:
-            raise ValueError("La cantidad a agregar debe ser mayor que cero")
-        prod = cls.get_by_id(product_id)
-        if not prod:
-            raise ValueError("Producto no encontrado")
-        prod.stk_qty += qty
-        db.session.commit()
-        return prod
+    def add_stock(cls, product_id: str, qty: int, order_id=None, notes=None):
+        cls._check_qty(qty, "agregar")
+        return cls._adjust_stock(product_id, qty, "IN", order_id, notes)
 
     @classmethod
-    def subtract_stock(cls, product_id: str, qty: int):
+    def subtract_stock(cls, product_id: str, qty: int, order_id=None, notes=None):
+        cls._check_qty(qty, "descontar")
+        return cls._adjust_stock(product_id, qty, "OUT", order_id, notes)
+
+    @staticmethod
+    def _check_qty(qty, verb: str) -> None:
+        # bool es subclase de int: {"qty": true} no es una cantidad.
+        if isinstance(qty, bool) or not isinstance(qty, int):
+            raise ValueError(f"La cantidad a {verb} debe ser un número entero")
         if qty <= 0:
-            raise ValueError("La cantidad a descontar debe ser mayor que cero")
-        prod = cls.get_by_id(product_id)
-        if not prod:
-            raise ValueError("Producto no encontrado")
-        if prod.stk_qty < qty:
-            raise ValueError("Stock insuficiente")
-        prod.stk_qty -= qty
-        db.session.commit()
-        return prod
+            raise ValueError(f"La cantidad a {verb} debe ser mayor que cero")
+
+    @classmethod
+    def _adjust_stock(cls, product_id, qty, movement_type, order_id, notes):
+        from .movimiento import InventoryMovement  # evita import circular
+
+        try:
+            stmt = update(cls).where(cls.product_id == product_id)
+            if movement_type == "OUT":
+                stmt = stmt.where(cls.stk_qty >= qty).values(stk_qty=cls.stk_qty - qty)
+            else:
+                stmt = stmt.values(stk_qty=cls.stk_qty + qty)
+            result = db.session.execute(stmt.execution_options(synchronize_session=False))
+            if result.rowcount != 1:
+                db.session.rollback()
+                if db.session.query(cls.product_id).filter_by(product_id=product_id).first():
+                    raise ValueError("Stock insuficiente")
+                raise ValueError("Producto no encontrado")
+
+            mark_changed([product_id])
+            InventoryMovement.record(
+                product_id, movement_type, qty, order_id=order_id, notes=notes
+            )
+            StockValuation.shift_stock(
+                {product_id: -qty if movement_type == "OUT" else qty}, _low_stock()
+            )
+            StockEvent.emit_stock([(product_id, movement_type, qty)], order_id=order_id)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error ajustando stock: {str(e)}")
+            raise
+        return cls.get_by_id(product_id)
+
+    # ─── Ajuste de stock por lotes (todo o nada) ──────────────────
+    _DIRECTIONS = {"add": "IN", "in": "IN", "subtract": "OUT", "out": "OUT"}
+
+    @classmethod
+    def adjust_stock_batch(cls, lines: list, order_id=None, notes=None):
+        """Aplica varias líneas ``{product_id|sku, qty, direction}`` en una transacción.
+
+        Las cantidades se netean por producto y se aplican con un único
+        UPDATE en ``executemany``; si algún producto no existe o queda con
+        stock negativo se revierte la transacción y no se aplica ninguna
+        línea. Devuelve ``[{product_id, sku, stk_qty}]`` con las cantidades
+        resultantes.
+        """
+        from .movimiento import InventoryMovement  # evita import circular
+
+        if not isinstance(lines, list) or not lines:
+            raise ValueError("Se requiere una lista de líneas no vacía")
+
+        parsed = []
+        for n, line in enumerate(lines, start=1):
+            if not isinstance(line, dict):
+                raise ValueError(f"Línea {n}: formato inválido")
+            qty = line.get("qty")
+            if isinstance(qty, bool) or not isinstance(qty, int):
+                raise ValueError(f"Línea {n}: la cantidad debe ser un número entero")
+            if qty <= 0:
+                raise ValueError(f"Línea {n}: la cantidad debe ser mayor que cero")
+            movement_type = cls._DIRECTIONS.get(str(line.get("direction", "")).lower())
+            if movement_type is None:
+                raise ValueError(f"Línea {n}: direction debe ser 'add' o 'subtract'")
+            if not (line.get("product_id") or line.get("sku")):
+                raise ValueError(f"Línea {n}: falta product_id o sku")
+            parsed.append((n, line.get("product_id"), line.get("sku"), movement_type, qty))
+
+        skus = {sku for _, pid, sku, _, _ in parsed if not pid}
+        by_sku = {
+            sku: entry.product_id for sku, entry in get_catalog().many_by_sku(skus).items()
+        } if skus else {}
+
+        deltas, movements, missing = {}, [], []
+        for n, pid, sku, movement_type, qty in parsed:
+            pid = pid or by_sku.get(sku)
+            if pid is None:
+                missing.append(f"línea {n} (SKU {sku})")
+                continue
+            deltas[pid] = deltas.get(pid, 0) + (qty if movement_type == "IN" else -qty)
+            movements.append((pid, movement_type, qty))
+        if missing:
+            raise ValueError(f"Producto no encontrado: {', '.join(missing)}")
+
+        # Las líneas que se netean a cero no tocan ``product`` ni emiten
+        # eventos, pero quedan en el ledger.
+        changed = {pid: delta for pid, delta in deltas.items() if delta}
+        table = cls.__table__
+        stmt = (
+            table.update()
+            .where(table.c.product_id == bindparam("pid"))
+            .values(stk_qty=table.c.stk_qty + bindparam("delta"))
+        )
+        try:
+            if changed:
+                mark_changed(changed)
+                db.session.execute(
+                    stmt, [{"pid": pid, "delta": delta} for pid, delta in changed.items()]
+                )
+            # Se verifica con un SELECT y no con ``rowcount``: en executemany
+            # no todos los drivers lo informan, y MySQL cuenta filas cambiadas.
+            rows = db.session.query(cls.product_id, cls.sku, cls.stk_qty).filter(
+                cls.product_id.in_(list(deltas))
+            ).all()
+            failure = cls._batch_failure(deltas, {p: q for p, _, q in rows})
+            if failure:
+                db.session.rollback()
+                raise ValueError(failure)
+            InventoryMovement.record_many(movements, order_id=order_id, notes=notes)
+            StockValuation.shift_stock(changed, _low_stock())
+            StockEvent.emit_stock(
+                [(pid, "IN" if d > 0 else "OUT", abs(d)) for pid, d in changed.items()],
+                order_id=order_id,
+            )
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error ajustando stock por lotes: {str(e)}")
+            raise
+
+        return [{"product_id": p, "sku": s, "stk_qty": q} for p, s, q in rows]
+
+    @staticmethod
+    def _batch_failure(deltas: dict, stock: dict):
+        """Motivo del rechazo según el stock ya ajustado, o ``None`` si es válido."""
+        missing = [pid for pid in deltas if pid not in stock]
+        if missing:
+            return f"Producto no encontrado: {', '.join(missing)}"
+        short = [
+            f"{pid} (disponible {stock[pid] - delta}, requerido {-delta})"
+            for pid, delta in deltas.items()
+            if stock[pid] < 0
+        ]
+        return f"Stock insuficiente: {', '.join(short)}" if short else None
 
     # ─── Utilitario de búsqueda por SKU ───────────────────────────
+    # Resuelve el SKU con la caché de catálogo y carga el producto por clave
+    # primaria (mapa de identidad de la sesión).
     @classmethod
     def get_by_sku(cls, sku: str):
-        return cls.query.filter_by(sku=sku).first()
\ No newline at end of file
+        entry = get_catalog().get_by_sku(sku)
+        return db.session.get(cls, entry.product_id) if entry else None
+
+
+def _low_stock():
+    """Umbral de stock bajo del rollup de valoración (``LOW_STOCK_THRESHOLD``)."""
+    return current_app.config["LOW_STOCK_THRESHOLD"]
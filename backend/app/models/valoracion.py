@@ -0,0 +1,260 @@
+"""Stock valuation rollup maintained alongside ``product``.
+
+One row per ``(category, location, active)`` holding the number of
+products, units in stock, stock value at cost and at sale price, and how
+many products are below the low-stock threshold. The table is bounded by
+categories × locations, so the dashboard never aggregates the catalog at
+request time.
+
+Assumptions
+-----------
+* Values are integer cents: ``stk_qty * ROUND(price * 100)`` summed in SQL.
+  The sums are exact (no float rounding), and readers turn them back into
+  :class:`~decimal.Decimal`.
+* :class:`~app.models.producto.Product` keeps the rollup current in its own
+  transaction. Stock adjustments call :meth:`shift_stock` with the applied
+  deltas. Other edits call :meth:`retract` before and :meth:`restore` after
+  the change.
+* ``low_stock`` counts ``stk_qty < LOW_STOCK_THRESHOLD``, the same test as
+  ``/api/products/search?stock_below=``. Every row stores the threshold it
+  was computed with. :meth:`ensure` rebuilds the table at startup when the
+  configured value changes.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Dict, List
+
+from sqlalchemy import BigInteger, Integer, bindparam, case, cast, func, insert, literal, select, true
+
+from .. import db
+from .demanda import _UPSERT
+
+
+class StockValuation(db.Model):
+    """Per-category, per-location stock totals."""
+
+    __tablename__ = "stock_valuation"
+
+    # Columns -----------------------------------------------------------------
+    category: str = db.Column(db.String(50), primary_key=True)
+    location: str = db.Column(db.String(50), primary_key=True)
+    active: bool = db.Column(db.Boolean, primary_key=True)
+    products: int = db.Column(db.Integer, nullable=False, default=0)
+    units: int = db.Column(db.BigInteger, nullable=False, default=0)
+    cost_cents: int = db.Column(db.BigInteger, nullable=False, default=0)
+    sale_cents: int = db.Column(db.BigInteger, nullable=False, default=0)
+    low_stock: int = db.Column(db.Integer, nullable=False, default=0)
+    threshold: int = db.Column(db.Integer, nullable=False)
+
+    _KEYS = ("category", "location", "active")
+    _COLUMNS = ("products", "units", "cost_cents", "sale_cents", "low_stock")
+    _shift_stmts: Dict[str, object] = {}  # dialect -> prebuilt shift_stock upsert
+
+    # ---------------------------------------------------------------------
+    # Maintenance (caller's transaction, no commit)
+    # ---------------------------------------------------------------------
+    @classmethod
+    def retract(cls, product_ids: List[str], threshold: int) -> None:
+        """Take the current rows of *product_ids* out of the rollup.
+
+        Locks the product rows (where the dialect supports it) so no other
+        transaction changes them before :meth:`restore`.
+        """
+        from .producto import Product  # avoid circular import
+
+        db.session.query(Product.product_id).filter(
+            Product.product_id.in_(product_ids)
+        ).with_for_update().all()
+        cls._fold(cls._contribution(-1, threshold, product_ids))
+
+    @classmethod
+    def restore(cls, product_ids: List[str], threshold: int) -> None:
+        """Add the (changed) rows of *product_ids* back into the rollup."""
+        db.session.flush()
+        cls._fold(cls._contribution(1, threshold, product_ids))
+        db.session.query(cls).filter(cls.products <= 0).delete(synchronize_session=False)
+
+    @classmethod
+    def shift_stock(cls, deltas: Dict[str, int], threshold: int) -> None:
+        """Fold stock deltas already applied to ``product.stk_qty``.
+
+        One ``INSERT ... SELECT`` upsert per product (``executemany``) reads
+        the new quantity and prices in the same statement.
+        """
+        params = [
+            {"pid": pid, "delta": d, "threshold": threshold}
+            for pid, d in deltas.items()
+            if d
+        ]
+        if not params:
+            return
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in _UPSERT:
+            cls._fold(cls._shift_source(), params)
+            return
+        # Built once per dialect: this runs on every stock adjustment.
+        stmt = cls._shift_stmts.get(dialect)
+        if stmt is None:
+            stmt = cls._shift_stmts[dialect] = cls._upsert(dialect, cls._shift_source())
+        db.session.execute(stmt, params)
+
+    @classmethod
+    def _shift_source(cls):
+        from .producto import Product  # avoid circular import
+
+        delta = bindparam("delta", type_=BigInteger)
+        threshold = bindparam("threshold", type_=Integer)
+        low_now = case((Product.stk_qty < threshold, 1), else_=0)
+        low_before = case((Product.stk_qty - delta < threshold, 1), else_=0)
+        return select(
+            Product.category,
+            Product.location,
+            func.coalesce(Product.active, true()),
+            literal(0),
+            delta,
+            delta * _cents(Product.cost),
+            delta * _cents(Product.sale_price),
+            low_now - low_before,
+            threshold,
+        ).where(Product.product_id == bindparam("pid"))
+
+    @classmethod
+    def rebuild(cls, threshold: int) -> int:
+        """Regenerate the whole rollup from ``product`` and commit.
+
+        Returns the number of rollup rows written.
+        """
+        try:
+            db.session.query(cls).delete(synchronize_session=False)
+            db.session.execute(
+                insert(cls).from_select(
+                    [*cls._KEYS, *cls._COLUMNS, "threshold"],
+                    cls._contribution(1, threshold),
+                )
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return db.session.query(func.count()).select_from(cls).scalar()
+
+    @classmethod
+    def ensure(cls, threshold: int) -> None:
+        """Rebuild when the rollup is missing or used another threshold."""
+        from .producto import Product  # avoid circular import
+
+        stale = db.session.query(cls.category).filter(cls.threshold != threshold).first()
+        empty = db.session.query(cls.category).first() is None
+        if stale or (empty and db.session.query(Product.product_id).first()):
+            cls.rebuild(threshold)
+
+    @classmethod
+    def _contribution(cls, sign: int, threshold: int, product_ids=None):
+        from .producto import Product  # avoid circular import
+
+        low = case((Product.stk_qty < threshold, 1), else_=0)
+        active = func.coalesce(Product.active, true())
+        query = select(
+            Product.category,
+            Product.location,
+            active,
+            sign * func.count(),
+            sign * func.sum(Product.stk_qty),
+            sign * func.sum(Product.stk_qty * _cents(Product.cost)),
+            sign * func.sum(Product.stk_qty * _cents(Product.sale_price)),
+            sign * func.sum(low),
+            literal(threshold),
+        )
+        if product_ids is not None:
+            query = query.where(Product.product_id.in_(product_ids))
+        return query.group_by(Product.category, Product.location, active)
+
+    @classmethod
+    def _fold(cls, source, params=None) -> None:
+        """Add the rows of *source* (key, deltas, threshold) to the rollup."""
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in _UPSERT:
+            columns = [*cls._KEYS, *cls._COLUMNS, "threshold"]
+            for bound in params or [{}]:
+                for row in db.session.execute(source, bound).all():
+                    cls._merge_row(dict(zip(columns, row)))
+            return
+        db.session.execute(cls._upsert(dialect, source), params)
+
+    @classmethod
+    def _upsert(cls, dialect: str, source):
+        stmt = _UPSERT[dialect](cls.__table__).from_select(
+            [*cls._KEYS, *cls._COLUMNS, "threshold"], source
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=list(cls._KEYS),
+            set_={
+                column: getattr(cls.__table__.c, column) + getattr(stmt.excluded, column)
+                for column in cls._COLUMNS
+            },
+        )
+
+    @classmethod
+    def _merge_row(cls, row: dict) -> None:
+        key = tuple(row[k] for k in cls._KEYS)
+        current = db.session.get(cls, key)
+        if current is None:
+            db.session.add(cls(**row))
+            return
+        for column in cls._COLUMNS:
+            setattr(current, column, getattr(current, column) + row[column])
+
+    # ---------------------------------------------------------------------
+    # Readers
+    # ---------------------------------------------------------------------
+    @classmethod
+    def summary(cls) -> dict:
+        """Totals of active products overall, by category and by location,
+        plus the number of inactive products."""
+        rows = db.session.query(cls).all()
+        totals, by_category, by_location = _Totals(), {}, {}
+        inactive = 0
+        for row in rows:
+            if not row.active:
+                inactive += row.products
+                continue
+            totals.add(row)
+            by_category.setdefault(row.category, _Totals()).add(row)
+            by_location.setdefault(row.location, _Totals()).add(row)
+        return {
+            "totals": {**totals.to_dict(), "inactive_products": inactive},
+            "by_category": _grouped("category", by_category),
+            "by_location": _grouped("location", by_location),
+        }
+
+
+class _Totals:
+    __slots__ = ("products", "units", "cost_cents", "sale_cents", "low_stock")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def add(self, row: StockValuation) -> None:
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(row, name))
+
+    def to_dict(self) -> dict:
+        return {
+            "products": self.products,
+            "units": self.units,
+            "cost_value": Decimal(self.cost_cents).scaleb(-2),
+            "sale_value": Decimal(self.sale_cents).scaleb(-2),
+            "low_stock": self.low_stock,
+        }
+
+
+def _grouped(key: str, groups: Dict[str, _Totals]) -> List[dict]:
+    return [{key: name, **groups[name].to_dict()} for name in sorted(groups)]
+
+
+def _cents(column):
+    """Price column as integer cents, rounded once per product."""
+    return cast(func.round(column * 100), BigInteger)
@@ -0,0 +1,140 @@
+"""Monotonic change counters used as cache watermarks.
+
+Every writer that other processes cache against bumps its counter in the
+same transaction as the change itself, so any worker can tell whether its
+cached view is stale with a single primary-key read.
+
+Assumptions
+-----------
+* :meth:`DataVersion.bump` only schedules the increment. It runs in a
+  ``before_commit`` hook, right before ``COMMIT``, so the counter row is
+  locked for the last statements of the transaction instead of all of it.
+  Writers of different products no longer queue on the shared row while
+  they do their own work.
+* Counters are incremented in name order, so two transactions that bump
+  the same counters cannot deadlock on them.
+* The incremented row stays locked until ``COMMIT``, so values are handed
+  out in commit order. ``on_bump`` callbacks receive the new value in that
+  same window (``product.change_seq`` is stamped this way).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .. import db
+from .demanda import _UPSERT
+
+_PENDING = "data_version_pending"  # session.info: name -> on_bump callbacks
+
+
+class DataVersion(db.Model):
+    __tablename__ = "data_version"
+
+    name: str = db.Column(db.String(50), primary_key=True)
+    version: int = db.Column(db.Integer, nullable=False, default=0)
+    changed_at: datetime = db.Column(
+        db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+
+    _bump_stmts: Dict[str, object] = {}  # dialect -> prebuilt bump upsert
+
+    @classmethod
+    def bump(cls, name: str, on_bump: Optional[Callable] = None) -> None:
+        """Increment counter *name* when the current transaction commits.
+
+        Repeated calls in one transaction increment it once. *on_bump*, if
+        given, is called as ``on_bump(session, version)`` with the new value
+        after the increment and before ``COMMIT``; each callback runs once.
+        Does not commit.
+        """
+        callbacks: List[Callable] = db.session.info.setdefault(_PENDING, {}).setdefault(
+            name, []
+        )
+        if on_bump is not None and on_bump not in callbacks:
+            callbacks.append(on_bump)
+
+    @classmethod
+    def _increment(cls, session: Session, name: str) -> int:
+        """Increment *name* now and return its new value.
+
+        One ``INSERT ... ON CONFLICT DO UPDATE`` where the dialect has it, so
+        two transactions creating the same counter both succeed instead of
+        one failing on the primary key.
+        """
+        now = datetime.now(timezone.utc)
+        dialect = session.get_bind().dialect.name
+        if dialect not in _UPSERT:
+            cls._bump_fallback(session, name, now)
+            return session.query(cls.version).filter_by(name=name).scalar()
+        # Built once per dialect: this runs on every catalog and ledger commit.
+        stmt = cls._bump_stmts.get(dialect)
+        if stmt is None:
+            stmt = cls._bump_stmts[dialect] = cls._upsert(dialect)
+        return session.execute(stmt, {"name": name, "changed_at": now}).scalar_one()
+
+    @classmethod
+    def _upsert(cls, dialect: str):
+        table = cls.__table__
+        stmt = _UPSERT[dialect](table).values(
+            name=bindparam("name"), version=1, changed_at=bindparam("changed_at")
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"version": table.c.version + 1, "changed_at": stmt.excluded.changed_at},
+        ).returning(table.c.version)
+
+    @classmethod
+    def _bump_fallback(cls, session: Session, name: str, now: datetime) -> None:
+        """``UPDATE``, else ``INSERT`` in a savepoint; a lost insert race
+        retries the ``UPDATE`` instead of failing the caller's transaction."""
+        for attempt in range(2):
+            updated = (
+                session.query(cls)
+                .filter_by(name=name)
+                .update(
+                    {cls.version: cls.version + 1, cls.changed_at: now},
+                    synchronize_session=False,
+                )
+            )
+            if updated or attempt:
+                return
+            try:
+                with session.begin_nested():
+                    session.add(cls(name=name, version=1, changed_at=now))
+                return
+            except IntegrityError:
+                continue
+
+    @classmethod
+    def current(cls, name: str) -> Tuple[int, Optional[datetime]]:
+        """Return ``(version, changed_at)`` for *name*; ``(0, None)`` if unset."""
+        row = (
+            db.session.query(cls.version, cls.changed_at).filter_by(name=name).first()
+        )
+        return (row.version, row.changed_at) if row else (0, None)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_pending(session) -> None:
+    if session.in_nested_transaction():
+        return  # a savepoint release, not the real commit
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    session.flush()
+    for name in sorted(pending):
+        version = DataVersion._increment(session, name)
+        for on_bump in pending[name]:
+            on_bump(session, version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session) -> None:
+    if not session.in_nested_transaction():
+        session.info.pop(_PENDING, None)
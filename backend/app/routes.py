@@ -1,7 +1,23 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime, timezone
+from flask import Blueprint, Response, current_app, request, jsonify, make_response, stream_with_context
 from flask_jwt_extended import jwt_required, create_access_token
 from .models.producto import Product
 from .models.movimiento import InventoryMovement
+from .models.prediccion import ForecastResult
+from .models.demanda import DailyMovementTotal
+from .models.valoracion import StockValuation
+from .models.instantanea import StockSnapshot, StockSnapshotRun
+from .models.version import DataVersion
+from .metrics import instrument, metrics_response
+from .services import archive, export
+from .services.cache import forecast_cache
+from .services.events import get_hub, sse_stream
+from .services.forecast import Scenario
+from .services.ingest import ingest_stream
+from .services.paging import clamp_limit
+from .services.streaming import stream_json_array, wants_stream
+import hashlib
+import itertools
 import logging
 
 bp = Blueprint("api", __name__, url_prefix="/api")
@@ -9,6 +25,9 @@ bp = Blueprint("api", __name__, url_prefix="/api")
 # ─── Logging ──────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
+# ─── Instrumentación (latencia, SQL, tamaño de respuesta) ────────────────
+instrument(bp)
+
 # ══════════════════════════════════════════════════════════════════════════
 #  Auth
 # ══════════════════════════════════════════════════════════════════════════
@@ -32,47 +51,445 @@ def login():
         logger.error(f"Error en login: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 400
     
+# ══════════════════════════════════════════════════════════════════════════
+#  Métricas
+# ══════════════════════════════════════════════════════════════════════════
+@bp.route("/metrics", methods=["GET"])
+@jwt_required()
+def metrics():
+    """Métricas del proceso en formato de texto Prometheus.
+
+    Expone rutas, latencias y estadísticas SQL, así que requiere el mismo
+    token que el resto de la API (en Prometheus, ``authorization`` con
+    ``credentials`` del scrape job).
+    """
+    return metrics_response()
+
 # ══════════════════════════════════════════════════════════════════════════
 #  Prediccion
 # ══════════════════════════════════════════════════════════════════════════
+FORECAST_DEFAULTS = {
+    "horizon_days": 90,
+    "window_days": 180,
+    "cover_days": 30,
+    "min_records": 30,
+}
+
+
+def _not_modified(etag, last_modified):
+    """Devuelve un 304 si el cliente ya tiene la versión *etag* / *last_modified*."""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        since = request.if_modified_since
+        fresh = bool(since and last_modified) and (
+            last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+        )
+    if not fresh:
+        return None
+    resp = make_response("", 304)
+    resp.set_etag(etag)
+    return resp
+
+
+def _conditional(resp, etag, last_modified):
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
 @bp.route("/get_prediction", methods=["GET"])
 @jwt_required()
-def get_prediction():    
+def get_prediction():
+    """Predicción de compras precalculada en segundo plano.
+
+    Con los parámetros por defecto sirve el último resultado guardado en
+    ``forecast_result`` sin recalcular; ``?fresh=true`` fuerza el cálculo en
+    la petición. Otras combinaciones no se guardan: se calculan en la
+    petición y quedan en la caché en memoria hasta que cambian los datos. Los headers
+    ``X-Computed-At`` y ``X-Forecast-Stale`` indican la antigüedad del dato.
+    Si otro proceso está calculando el primer resultado se lo espera hasta
+    ``FORECAST_WAIT_SECONDS``; después se responde 202 con ``Retry-After``.
+    """
     try:
-        needs  = InventoryMovement.forecast_purchase_needs_list()
-        return jsonify(needs), 200
+        params = {
+            k: request.args.get(k, default, type=int)
+            for k, default in FORECAST_DEFAULTS.items()
+        }
+        if params != FORECAST_DEFAULTS:
+            return _adhoc_prediction(params)
+        fresh = request.args.get("fresh", "").lower() in ("1", "true", "yes")
+        row = None if fresh else ForecastResult.latest(params)
+        if row is None:
+            row = ForecastResult.refresh(params, force=True)
+        if row is None:  # otro worker creó la fila primero y la está calculando
+            row = ForecastResult.wait_latest(
+                params, current_app.config["FORECAST_WAIT_SECONDS"]
+            )
+        if row is None:
+            resp = make_response(jsonify({"status": "pending"}), 202)
+            resp.headers["Retry-After"] = "5"
+            return resp
+
+        etag = hashlib.sha1(repr((row.params_key, row.computed_at)).encode()).hexdigest()
+        not_modified = _not_modified(etag, row.computed_at)
+        if not_modified is not None:
+            return not_modified
+
+        watermark, _ = InventoryMovement.forecast_watermark()
+        stale = row.is_stale(watermark)
+        scheduler = current_app.extensions.get("forecast_scheduler")
+        if stale and scheduler is not None:
+            scheduler.poke()
+
+        resp = make_response(jsonify(row.result), 200)
+        resp.headers["X-Computed-At"] = row.computed_at.replace(tzinfo=timezone.utc).isoformat()
+        resp.headers["X-Forecast-Stale"] = "true" if stale else "false"
+        return _conditional(resp, etag, row.computed_at)
     except Exception as e:
         logger.error(f"Error obteniendo productos: {str(e)}", exc_info=True)
         return jsonify({"error": "Error interno del servidor"}), 500
-    
+
+
+def _adhoc_prediction(params):
+    """Predicción con parámetros no precalculados (caché por marca de agua)."""
+    watermark, last_modified = InventoryMovement.forecast_watermark()
+    key = ("prediction", tuple(sorted(params.items())))
+    etag = hashlib.sha1(repr((key, watermark)).encode()).hexdigest()
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    needs = forecast_cache.get_or_compute(
+        key, watermark, lambda: InventoryMovement.forecast_purchase_needs_list(**params)
+    )
+    resp = make_response(jsonify(needs), 200)
+    resp.headers["X-Forecast-Stale"] = "false"
+    return _conditional(resp, etag, last_modified)
+
+
+@bp.route("/forecast/status", methods=["GET"])
+@jwt_required()
+def forecast_status():
+    """Estado del planificador y de cada predicción precalculada."""
+    try:
+        config = current_app.config
+        scheduler = current_app.extensions.get("forecast_scheduler")
+        watermark, _ = InventoryMovement.forecast_watermark()
+        version, _ = DataVersion.current(InventoryMovement.__tablename__)
+        jobs = [
+            row.to_status(version, watermark)
+            for row in ForecastResult.query.order_by(ForecastResult.params_key)
+        ]
+        return jsonify({
+            "scheduler": {
+                "enabled": scheduler is not None,
+                "running": bool(scheduler and scheduler.running),
+                "last_check": scheduler.last_check.isoformat()
+                if scheduler and scheduler.last_check else None,
+                "last_error": scheduler.last_error if scheduler else None,
+                "poll_seconds": config["FORECAST_POLL_SECONDS"],
+                "refresh_seconds": config["FORECAST_REFRESH_SECONDS"],
+                "refresh_movements": config["FORECAST_REFRESH_MOVEMENTS"],
+            },
+            "jobs": jobs,
+        }), 200
+    except Exception as e:
+        logger.error(f"Error obteniendo estado de predicciones: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+
+MAX_SCENARIOS = 100
+SCENARIO_FIELDS = ("horizon_days", "cover_days", "window_days")
+
+
+def _positive_int(value, field):
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f"'{field}' debe ser un entero positivo")
+    return value
+
+
+def _parse_scenarios(data):
+    """Escenarios explícitos (``scenarios``) o grilla de listas por campo."""
+    if "scenarios" in data:
+        items = data["scenarios"]
+        if not isinstance(items, list) or not items:
+            raise ValueError("'scenarios' debe ser una lista no vacía")
+        combos = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError("Cada escenario debe ser un objeto")
+            combos.append(
+                tuple(item.get(f, FORECAST_DEFAULTS[f]) for f in SCENARIO_FIELDS)
+            )
+    else:
+        axes = []
+        for f in SCENARIO_FIELDS:
+            values = data.get(f, [FORECAST_DEFAULTS[f]])
+            if not isinstance(values, list) or not values:
+                raise ValueError(f"'{f}' debe ser una lista no vacía")
+            axes.append(values)
+        combos = list(itertools.product(*axes))
+    if len(combos) > MAX_SCENARIOS:
+        raise ValueError(f"Máximo {MAX_SCENARIOS} escenarios por consulta")
+    return [
+        Scenario(*(_positive_int(v, f) for v, f in zip(combo, SCENARIO_FIELDS)))
+        for combo in combos
+    ]
+
+
+@bp.route("/forecast/scenarios", methods=["POST"])
+@jwt_required()
+def forecast_scenarios():
+    """Evalúa varios escenarios de predicción sobre una sola carga de datos.
+
+    Body: ``{"scenarios": [{horizon_days, cover_days, window_days}, …]}`` o
+    una grilla ``{"horizon_days": [...], "cover_days": [...],
+    "window_days": [...]}`` (producto cartesiano). Opcionales:
+    ``min_records``, ``product_ids`` y ``category``.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        scenarios = _parse_scenarios(data)
+        min_records = _positive_int(
+            data.get("min_records", FORECAST_DEFAULTS["min_records"]), "min_records"
+        )
+        product_ids = data.get("product_ids")
+        if product_ids is not None and (
+            not isinstance(product_ids, list)
+            or not all(isinstance(pid, str) for pid in product_ids)
+        ):
+            raise ValueError("'product_ids' debe ser una lista de strings")
+        category = data.get("category")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        watermark, _ = InventoryMovement.forecast_watermark()
+        filters = dict(
+            min_records=min_records,
+            product_ids=tuple(sorted(product_ids)) if product_ids else None,
+            category=category,
+        )
+        key = ("scenarios", tuple(scenarios), tuple(sorted(filters.items())))
+        table = forecast_cache.get_or_compute(
+            key,
+            watermark,
+            lambda: InventoryMovement.forecast_scenarios_table(scenarios, **filters),
+        )
+        return jsonify(table), 200
+    except Exception as e:
+        logger.error(f"Error calculando escenarios: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
 # ══════════════════════════════════════════════════════════════════════════
 #  Stock
 # ══════════════════════════════════════════════════════════════════════════
+STOCKS_PAGE_SIZE = 500
+
+
 @bp.route("/get_stocks", methods=["GET"])
 @jwt_required()
 def get_stocks():
-    """Lista todos los movimientos activos (o todos, con ?all=true)."""
-    try:        
-        stkmovs = InventoryMovement.get_all()
-        return jsonify([m.to_dict() for m in stkmovs]), 200
+    """Lista movimientos, del más reciente al más antiguo, por páginas.
+
+    Paginación por cursor (keyset): ``?limit=`` (por defecto 500) y
+    ``?cursor=`` con el token recibido en el header ``X-Next-Cursor``.
+    Filtros: ``product_id``, ``movement_type``, ``from`` y ``to`` (ISO 8601,
+    ``to`` exclusivo). Con ``?stream=true`` envía todo el resultado filtrado
+    en streaming, sin ORM ni paginación.
+    """
+    try:
+        args = request.args
+        if wants_stream(args):
+            return stream_json_array(
+                InventoryMovement.iter_dicts(
+                    product_id=args.get("product_id"),
+                    movement_type=args.get("movement_type"),
+                    date_from=args.get("from"),
+                    date_to=args.get("to"),
+                )
+            )
+        movs, next_cursor = InventoryMovement.get_page(
+            clamp_limit(args.get("limit", type=int), STOCKS_PAGE_SIZE),
+            args.get("cursor"),
+            product_id=args.get("product_id"),
+            movement_type=args.get("movement_type"),
+            date_from=args.get("from"),
+            date_to=args.get("to"),
+        )
+        resp = make_response(jsonify(movs), 200)
+        if next_cursor:
+            resp.headers["X-Next-Cursor"] = next_cursor
+        return resp
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error obteniendo stock: {str(e)}", exc_info=True)
         return jsonify({"error": "Error interno del servidor"}), 500
+
+
+@bp.route("/movements/bulk", methods=["POST"])
+@jwt_required()
+def bulk_movements():
+    """Carga masiva de movimientos (NDJSON o CSV en streaming, por lotes).
+
+    Formato por ``?format=ndjson|csv`` o por Content-Type (``text/csv``);
+    tamaño de lote por ``?batch_size=``. Devuelve el reporte con errores por
+    línea sin abortar la carga completa.
+    """
+    try:
+        fmt = request.args.get("format") or (
+            "csv" if request.mimetype == "text/csv" else "ndjson"
+        )
+        batch_size = request.args.get(
+            "batch_size", current_app.config["BULK_BATCH_SIZE"], type=int
+        )
+        report = ingest_stream(request.stream, fmt, batch_size=max(batch_size, 1))
+        return jsonify(report.to_dict()), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error en carga masiva: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+
+@bp.route("/stock/as-of", methods=["GET"])
+@jwt_required()
+def stock_as_of():
+    """Stock en un instante pasado: ``?at=`` (ISO 8601, UTC si no trae zona).
+
+    Parte del snapshot más cercano anterior a ``at`` y aplica solo los
+    movimientos posteriores; sin snapshot previo recorre hacia atrás desde el
+    siguiente snapshot o desde el stock actual. ``?product_id=a,b`` limita
+    los productos (por defecto, todo el catálogo).
+    """
+    try:
+        at = _iso_arg("at")
+        if at is None:
+            raise ValueError("Falta el parámetro 'at'")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        product_ids = [p for p in request.args.get("product_id", "").split(",") if p]
+        info, stock = StockSnapshot.as_of(at, product_ids or None)
+        day = info["snapshot_day"]
+        return jsonify({
+            "at": at.isoformat(),
+            "snapshot_day": day.isoformat() if day else None,
+            "direction": info["direction"],
+            "stock": [
+                {"product_id": pid, "stk_qty": qty} for pid, qty in sorted(stock.items())
+            ],
+        }), 200
+    except Exception as e:
+        logger.error(f"Error reconstruyendo stock: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+
+@bp.route("/stock/snapshots", methods=["GET"])
+@jwt_required()
+def stock_snapshots():
+    """Snapshots de stock registrados, del más reciente al más antiguo."""
+    runs = StockSnapshotRun.query.order_by(StockSnapshotRun.day.desc()).all()
+    return jsonify([r.to_dict() for r in runs]), 200
+
+
 # ══════════════════════════════════════════════════════════════════════════
 #  Productos
 # ══════════════════════════════════════════════════════════════════════════
 @bp.route("/get_products", methods=["GET"])
 @jwt_required()
 def get_products():
-    """Lista todos los productos activos (o todos, con ?all=true)."""
+    """Lista todos los productos activos (o todos, con ?all=true).
+
+    Con ``?since=<token>`` devuelve sólo los productos creados o modificados
+    (incluidas altas/bajas lógicas y ajustes de stock) desde ese token,
+    activos o no. El token siguiente viaja en el header ``X-Sync-Token``.
+    Soporta GET condicional (ETag / Last-Modified → 304).
+    Con ``?stream=true`` la respuesta se serializa en streaming sin ORM.
+    """
     try:
-        active_only = request.args.get("all") != "true"
-        productos = Product.get_all(active_only=active_only)
-        return jsonify([p.to_dict() for p in productos]), 200
+        args = request.args
+        active_only = args.get("all") != "true"
+        since = args.get("since")
+        token, last_modified = Product.sync_token()
+        etag = hashlib.sha1(
+            repr((token, since, active_only, wants_stream(args))).encode()
+        ).hexdigest()
+
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        if since:
+            body = jsonify([p.to_dict() for p in Product.changed_since(since)])
+            resp = make_response(body, 200)
+        elif wants_stream(args):
+            resp = stream_json_array(Product.iter_dicts(active_only=active_only))
+        else:
+            productos = Product.get_all(active_only=active_only)
+            resp = make_response(jsonify([p.to_dict() for p in productos]), 200)
+
+        if token:
+            resp.headers["X-Sync-Token"] = token
+        return _conditional(resp, etag, last_modified)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error obteniendo productos: {str(e)}", exc_info=True)
         return jsonify({"error": "Error interno del servidor"}), 500
 
+
+SEARCH_PAGE_SIZE = 50
+
+
+@bp.route("/products/search", methods=["GET"])
+@jwt_required()
+def search_products():
+    """Búsqueda de productos con filtros, orden y paginación en el servidor.
+
+    Parámetros: ``q`` (texto en el nombre), ``prefix`` (prefijo de SKU o de
+    palabra del nombre), ``category``, ``location``, ``active``
+    (``true`` por defecto, ``false`` o ``all``), ``stock_below`` (stock
+    menor que N), ``sort`` (``name``, ``sku``, ``stock``, ``category``,
+    ``updated``; ``-`` delante para descendente), ``limit`` y ``cursor``
+    (token del header ``X-Next-Cursor``).
+    """
+    try:
+        args = request.args
+        active = {"true": True, "false": False, "all": None}.get(args.get("active", "true"))
+        if "active" in args and args["active"] not in ("true", "false", "all"):
+            raise ValueError("'active' debe ser true, false o all")
+        stock_below = args.get("stock_below")
+        if stock_below is not None:
+            try:
+                stock_below = int(stock_below)
+            except ValueError:
+                raise ValueError("'stock_below' debe ser un entero")
+        productos, next_cursor = Product.search(
+            clamp_limit(args.get("limit", type=int), SEARCH_PAGE_SIZE),
+            args.get("cursor"),
+            q=args.get("q"),
+            prefix=args.get("prefix"),
+            category=args.get("category"),
+            location=args.get("location"),
+            active=active,
+            stock_below=stock_below,
+            sort=args.get("sort", "name"),
+        )
+        resp = make_response(jsonify([p.to_dict() for p in productos]), 200)
+        if next_cursor:
+            resp.headers["X-Next-Cursor"] = next_cursor
+        return resp
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error buscando productos: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
     
 @bp.route("/products", methods=["POST", "OPTIONS"])
 @jwt_required()
@@ -138,8 +555,10 @@ def deactivate_product(product_id):
 def add_stock(product_id):
     """Incrementa el stock de un producto."""
     try:
-        qty = request.get_json().get("qty", 0)
-        producto = Product.add_stock(product_id, qty)
+        data = request.get_json()
+        producto = Product.add_stock(
+            product_id, data.get("qty", 0), data.get("order_id"), data.get("notes")
+        )
         return jsonify(producto.to_dict()), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
@@ -153,11 +572,248 @@ def add_stock(product_id):
 def subtract_stock(product_id):
     """Descuenta stock (p.ej., venta o salida)."""
     try:
-        qty = request.get_json().get("qty", 0)
-        producto = Product.subtract_stock(product_id, qty)
+        data = request.get_json()
+        producto = Product.subtract_stock(
+            product_id, data.get("qty", 0), data.get("order_id"), data.get("notes")
+        )
         return jsonify(producto.to_dict()), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Descontando stock: {str(e)}", exc_info=True)
         return jsonify({"error": "Error interno del servidor"}), 500
+
+
+@bp.route("/stock/batch", methods=["POST", "OPTIONS"])
+@jwt_required()
+def adjust_stock_batch():
+    """Ajusta stock de varias líneas en una sola transacción (todo o nada).
+
+    Cuerpo: ``{"lines": [{"product_id"|"sku", "qty", "direction": "add"|"subtract"}],
+    "order_id"?, "notes"?}``.
+    """
+    try:
+        data = request.get_json() or {}
+        result = Product.adjust_stock_batch(
+            data.get("lines"), data.get("order_id"), data.get("notes")
+        )
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Ajuste de stock por lotes: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+
+# ══════════════════════════════════════════════════════════════════════════
+#  Eventos en vivo (SSE)
+# ══════════════════════════════════════════════════════════════════════════
+@bp.route("/stream", methods=["GET"])
+@jwt_required(locations=["headers", "query_string"])
+def stream_events():
+    """Cambios de stock/producto en vivo (Server-Sent Events).
+
+    Cada evento lleva ``id`` (para reanudar), ``event`` (``stock``,
+    ``update``, ``activate``, ``deactivate``) y ``data`` con ``product_id``,
+    ``stk_qty``, ``active`` y el resumen del movimiento. Se reanuda con el
+    header ``Last-Event-ID`` (o ``?last_event_id=``); sin él solo llegan
+    eventos nuevos. ``?product_id=a,b`` filtra productos. Como
+    ``EventSource`` no envía headers, el token JWT puede ir en ``?jwt=``
+    (el access log de gunicorn omite la query string, ver
+    ``gunicorn.conf.py``).
+    Cada stream ocupa un hilo del servidor: con ``STREAM_MAX_CLIENTS``
+    streams abiertos en el proceso responde 503 con ``Retry-After``.
+    """
+    app = current_app._get_current_object()
+    hub = get_hub(app)
+    last = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        after_id = int(last) if last else hub.last_id
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID inválido"}), 400
+    product_ids = [p for p in request.args.get("product_id", "").split(",") if p]
+
+    if not hub.subscribe():
+        resp = make_response(
+            jsonify({"error": "Demasiadas conexiones de streaming, reintentar luego"}), 503
+        )
+        resp.headers["Retry-After"] = str(max(int(app.config["STREAM_RETRY_MS"] / 1000), 1))
+        return resp
+    resp = Response(sse_stream(app, after_id, product_ids), mimetype="text/event-stream")
+    # El servidor cierra la respuesta al desconectarse el cliente (o al
+    # fallar un heartbeat), aunque el generador no haya arrancado.
+    resp.call_on_close(hub.unsubscribe)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx: no bufferizar el stream
+    return resp
+
+
+# ══════════════════════════════════════════════════════════════════════════
+#  Archivo histórico
+# ══════════════════════════════════════════════════════════════════════════
+def _iso_arg(name, month=False):
+    """Fecha ISO (o ``YYYY-MM`` si *month*) del query string; ``None`` si falta."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        if month and len(value) == 7:
+            value += "-01"
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Fecha inválida en '{name}': {value}")
+
+
+@bp.route("/archive", methods=["GET"])
+@jwt_required()
+def archive_info():
+    """Archivos del histórico y filas que quedan en la tabla caliente."""
+    try:
+        return jsonify(archive.archive_status()), 200
+    except Exception as e:
+        logger.error(f"Error leyendo archivo histórico: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+
+@bp.route("/archive/summary", methods=["GET"])
+@jwt_required()
+def archive_summary():
+    """Totales mensuales archivados; ``?product_id=a,b&from=YYYY-MM&to=YYYY-MM``."""
+    try:
+        month_from, month_to = _iso_arg("from", month=True), _iso_arg("to", month=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        product_ids = [p for p in request.args.get("product_id", "").split(",") if p]
+        rows = archive.monthly_summary(
+            product_ids,
+            month_from.date() if month_from else None,
+            month_to.date() if month_to else None,
+        )
+        return jsonify(rows), 200
+    except Exception as e:
+        logger.error(f"Error leyendo resumen archivado: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+
+@bp.route("/archive/movements", methods=["GET"])
+@jwt_required()
+def archive_movements():
+    """Movimientos archivados en streaming, del más antiguo al más nuevo.
+
+    Filtros: ``product_id`` (lista separada por comas), ``from`` y ``to``
+    (ISO 8601, ``to`` exclusivo). Mismo formato que ``/get_stocks``.
+    """
+    try:
+        start, end = _iso_arg("from"), _iso_arg("to")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    product_ids = [p for p in request.args.get("product_id", "").split(",") if p]
+    return stream_json_array(archive.iter_dicts(start, end, product_ids or None))
+
+
+# ══════════════════════════════════════════════════════════════════════════
+#  Exportación (CSV / Parquet)
+# ══════════════════════════════════════════════════════════════════════════
+def _export_response(kind, columns, batches):
+    """Respuesta en streaming con ``?format=csv|parquet`` y ``?gzip=true``."""
+    fmt = request.args.get("format", "csv").lower()
+    gzip = request.args.get("gzip", "false").lower() == "true"
+    chunks = export.encode(fmt, columns, batches, gzip=gzip)  # ValueError → 400
+    mimetype, extension = export.content_type(fmt, gzip)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    resp = Response(stream_with_context(chunks), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{kind}-{stamp}{extension}"'
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@bp.route("/export/movements", methods=["GET"])
+@jwt_required()
+def export_movements():
+    """Movimientos (histórico archivado + tabla caliente) en CSV o Parquet.
+
+    ``from`` / ``to`` en ISO 8601 (``to`` exclusivo). Las filas se leen por
+    lotes con ``yield_per`` y se envían a medida que se codifican.
+    """
+    try:
+        start, end = _iso_arg("from"), _iso_arg("to")
+        return _export_response(
+            "movements", export.MOVEMENT_COLUMNS, export.movement_batches(start, end)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@bp.route("/export/stock", methods=["GET"])
+@jwt_required()
+def export_stock():
+    """Foto actual del stock por producto en CSV o Parquet (``?all=true`` incluye inactivos)."""
+    active_only = request.args.get("all", "false").lower() != "true"
+    try:
+        return _export_response(
+            "stock", export.STOCK_COLUMNS, export.stock_batches(active_only=active_only)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+# ══════════════════════════════════════════════════════════════════════════
+#  Tablero
+# ══════════════════════════════════════════════════════════════════════════
+@bp.route("/dashboard/summary", methods=["GET"])
+@jwt_required()
+def dashboard_summary():
+    """Valorización, stock bajo y volumen de movimientos desde los rollups.
+
+    Lee ``stock_valuation`` (una fila por categoría/ubicación) y
+    ``daily_movement_total`` (una fila por día), así que el costo no depende
+    del tamaño del catálogo ni del ledger. Los importes son decimales
+    exactos serializados como texto. Admite ``If-None-Match``.
+    """
+    try:
+        today = datetime.now(timezone.utc).date()
+        threshold = current_app.config["LOW_STOCK_THRESHOLD"]
+        products, products_at = DataVersion.current(Product.__tablename__)
+        movements, movements_at = DataVersion.current(InventoryMovement.__tablename__)
+        etag = hashlib.sha1(
+            repr((products, movements, today, threshold)).encode()
+        ).hexdigest()
+        last_modified = max(filter(None, (products_at, movements_at)), default=None)
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        summary = StockValuation.summary()
+        volumes = DailyMovementTotal.volumes(today, (1, 7, 30))
+        summary["low_stock_threshold"] = threshold
+        summary["movements"] = {
+            "today": volumes[1], "last_7_days": volumes[7], "last_30_days": volumes[30],
+        }
+        return _conditional(make_response(jsonify(summary), 200), etag, last_modified)
+    except Exception as e:
+        logger.error(f"Error generando el resumen del tablero: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+
+@bp.route("/dashboard/monthly", methods=["GET"])
+@jwt_required()
+def dashboard_monthly():
+    """Entradas, salidas y cantidad de movimientos por mes, del más antiguo
+    al más reciente.
+
+    Lee ``daily_movement_total`` (una fila por día), que conserva también
+    los meses archivados, así que el tablero no descarga el ledger.
+    Admite ``If-None-Match``.
+    """
+    try:
+        version, movements_at = DataVersion.current(InventoryMovement.__tablename__)
+        etag = hashlib.sha1(repr(("monthly", version)).encode()).hexdigest()
+        not_modified = _not_modified(etag, movements_at)
+        if not_modified is not None:
+            return not_modified
+        months = DailyMovementTotal.monthly()
+        return _conditional(make_response(jsonify(months), 200), etag, movements_at)
+    except Exception as e:
+        logger.error(f"Error generando los totales mensuales: {str(e)}", exc_info=True)
+        return jsonify({"error": "Error interno del servidor"}), 500
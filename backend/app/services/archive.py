@@ -0,0 +1,450 @@
+"""Tiered archival of ``inventory_movement`` into monthly columnar files.
+
+:func:`archive_movements` moves ledger rows dated before a cutoff day out of
+the hot table, one calendar month per transaction. Each month's rows are:
+
+1. written to ``ARCHIVE_DIR/YYYY/movements-YYYY-MM-<id>.npz``, a
+   compressed NumPy archive with one array per column. Product ids and
+   movement types are dictionary-encoded and dates are stored as
+   ``datetime64[us]`` in UTC. The file is written to a temporary name and
+   renamed. ``<id>`` is random, so no run ever replaces another run's file.
+2. added to :class:`~app.models.archivo.MonthlyProductMovement` (upsert).
+3. registered in :class:`~app.models.archivo.ArchiveFile` and deleted from
+   ``inventory_movement``, all in the same transaction.
+
+A month is only archived under an
+:class:`~app.models.archivo.ArchiveClaim`; a concurrent run skips it.
+
+Readers (:func:`iter_chunks`, :func:`iter_dicts`) go through the registry
+and load one file at a time. Within a file, rows are yielded in slices of
+*chunk_rows*, so memory is bounded by the largest month, never by the full
+history.
+
+Assumptions
+-----------
+* On SQLite, day bounds are compared with the stored text of ``date``. Seed
+  rows (``YYYY-MM-DDTHH:MM:SS+00:00``) and rows written by SQLAlchemy
+  (``YYYY-MM-DD HH:MM:SS``) both sort correctly against a bare
+  ``YYYY-MM-DD`` day. Server databases compare real timestamps.
+* The months to archive come from a ``MIN``/``MAX`` scan of the dates
+  before the cutoff, walked in Python; no dialect-specific date function is
+  needed.
+* Timestamps without an offset are UTC, as everywhere else in the app.
+* Archiving does not change ``daily_product_demand``.
+  :meth:`DailyProductDemand.rebuild` folds the archive back in.
+"""
+
+from __future__ import annotations
+
+import os
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, type_coerce
+
+from .. import db
+from ..models.archivo import ArchiveClaim, ArchiveFile, MonthlyProductMovement
+from ..models.demanda import _UPSERT
+from ..models.movimiento import InventoryMovement
+
+DEFAULT_CHUNK_ROWS = 10_000
+_DELETE_CHUNK = 500
+
+
+@dataclass
+class ArchiveReport:
+    cutoff: str
+    dry_run: bool = False
+    months: List[str] = field(default_factory=list)
+    rows: int = 0
+    files: List[str] = field(default_factory=list)
+    bytes_written: int = 0
+    skipped: List[str] = field(default_factory=list)  # claimed by another run
+
+    def to_dict(self) -> dict:
+        return {
+            "cutoff": self.cutoff,
+            "dry_run": self.dry_run,
+            "months": self.months,
+            "skipped": self.skipped,
+            "rows": self.rows,
+            "files": self.files,
+            "bytes_written": self.bytes_written,
+        }
+
+
+class ArchiveChunk(NamedTuple):
+    """A slice of archived rows as parallel column arrays."""
+
+    movement_id: np.ndarray
+    date: np.ndarray  # datetime64[us], UTC
+    product_id: np.ndarray
+    movement_type: np.ndarray
+    quantity: np.ndarray
+    order_id: List[Optional[str]]
+    notes: List[Optional[str]]
+
+    def __len__(self) -> int:
+        return len(self.movement_id)
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+def archive_movements(
+    older_than_days: Optional[int] = None,
+    *,
+    cutoff: Optional[date] = None,
+    directory: Optional[str] = None,
+    dry_run: bool = False,
+) -> ArchiveReport:
+    """Archive movements dated before *cutoff* (default: today minus the age).
+
+    Each month is archived and committed independently. An error stops the
+    run, but months already committed stay archived.
+    """
+    config = current_app.config
+    if cutoff is None:
+        days = config["ARCHIVE_AFTER_DAYS"] if older_than_days is None else older_than_days
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=days)
+    directory = directory or config["ARCHIVE_DIR"]
+    report = ArchiveReport(cutoff=cutoff.isoformat(), dry_run=dry_run)
+
+    column = _date_column()
+    first, last = (
+        db.session.query(func.min(column), func.max(column))
+        .filter(column < _day_bound(cutoff))
+        .one()
+    )
+    db.session.rollback()
+    for month in _months_between(first, last):
+        if dry_run:
+            count = _month_query(func.count(), month, cutoff).scalar()
+            db.session.rollback()
+            if count:
+                report.months.append(month)
+                report.rows += count
+            continue
+        report.months.append(month)
+        if not ArchiveClaim.claim(_month_start(month)):
+            report.skipped.append(month)
+            continue
+        try:
+            path, rows, size = _archive_month(month, cutoff, directory)
+        finally:
+            ArchiveClaim.release(_month_start(month))
+        report.rows += rows
+        report.bytes_written += size
+        if path:
+            report.files.append(path)
+    return report
+
+
+def _month_query(columns, month: str, cutoff: date):
+    """Query of *columns* over the movements of *month* dated before *cutoff*."""
+    if not isinstance(columns, (list, tuple)):
+        columns = [columns]
+    column = _date_column()
+    start = _month_start(month)
+    return db.session.query(*columns).filter(
+        column >= _day_bound(start),
+        column < _day_bound(_next_month(start)),
+        column < _day_bound(cutoff),
+    )
+
+
+def _archive_month(month: str, cutoff: date, directory: str):
+    mv = InventoryMovement
+    rows = (
+        _month_query(
+            [mv.movement_id, mv.date, mv.product_id, mv.movement_type,
+             mv.quantity, mv.order_id, mv.notes],
+            month,
+            cutoff,
+        )
+        .order_by(mv.date, mv.movement_id)
+        .all()
+    )
+    if not rows:
+        return None, 0, 0
+
+    columns = _encode(rows)
+    relpath = _new_path(month)
+    fullpath = os.path.join(directory, relpath)
+    os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+    tmp = fullpath + ".tmp"
+    with open(tmp, "wb") as fh:
+        np.savez_compressed(fh, **columns)
+    os.replace(tmp, fullpath)
+    size = os.path.getsize(fullpath)
+
+    try:
+        _add_summary(month, rows)
+        dates = columns["date"]
+        db.session.add(
+            ArchiveFile(
+                path=relpath,
+                month=_month_start(month),
+                rows=len(rows),
+                first_date=dates[0].astype(datetime),
+                last_date=dates[-1].astype(datetime),
+                size_bytes=size,
+            )
+        )
+        ids = [r.movement_id for r in rows]
+        deleted = 0
+        for i in range(0, len(ids), _DELETE_CHUNK):
+            deleted += db.session.query(mv).filter(
+                mv.movement_id.in_(ids[i : i + _DELETE_CHUNK])
+            ).delete(synchronize_session=False)
+        if deleted != len(ids):
+            # Rows already archived by a run that outlived its claim.
+            db.session.rollback()
+            os.remove(fullpath)
+            return None, 0, 0
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        os.remove(fullpath)  # this run's own, unregistered file
+        raise
+    return relpath, len(rows), size
+
+
+def _encode(rows) -> Dict[str, np.ndarray]:
+    products, product_code = np.unique([r.product_id for r in rows], return_inverse=True)
+    types, type_code = np.unique([r.movement_type for r in rows], return_inverse=True)
+    return {
+        "movement_id": np.array([r.movement_id for r in rows]),
+        "date": np.array([_utc_naive(r.date) for r in rows], dtype="datetime64[us]"),
+        "products": products,
+        "product_code": product_code.astype(np.int32),
+        "types": types,
+        "type_code": type_code.astype(np.int8),
+        "quantity": np.array([r.quantity for r in rows], dtype=np.int64),
+        "order_id": np.array([r.order_id or "" for r in rows]),
+        "order_id_null": np.array([r.order_id is None for r in rows]),
+        "notes": np.array([r.notes or "" for r in rows]),
+        "notes_null": np.array([r.notes is None for r in rows]),
+    }
+
+
+def _add_summary(month: str, rows) -> None:
+    totals: Counter = Counter()
+    counts: Counter = Counter()
+    for r in rows:
+        key = (r.product_id, r.movement_type)
+        totals[key] += r.quantity
+        counts[key] += 1
+    values = [
+        {
+            "product_id": pid,
+            "month": _month_start(month),
+            "movement_type": mtype,
+            "movements": counts[(pid, mtype)],
+            "quantity": qty,
+        }
+        for (pid, mtype), qty in totals.items()
+    ]
+    table = MonthlyProductMovement.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in _UPSERT:
+        stmt = _UPSERT[dialect](table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["product_id", "month", "movement_type"],
+            set_={
+                c: getattr(table.c, c) + getattr(stmt.excluded, c)
+                for c in ("movements", "quantity")
+            },
+        )
+        db.session.execute(stmt, values)
+        return
+    for row in values:
+        key = (row["product_id"], row["month"], row["movement_type"])
+        cell = db.session.get(MonthlyProductMovement, key)
+        if cell is None:
+            db.session.add(MonthlyProductMovement(**row))
+        else:
+            cell.movements += row["movements"]
+            cell.quantity += row["quantity"]
+
+
+def _new_path(month: str) -> str:
+    return os.path.join(month[:4], f"movements-{month}-{uuid.uuid4().hex[:12]}.npz")
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+def iter_chunks(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    product_ids: Optional[Sequence[str]] = None,
+    *,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    directory: Optional[str] = None,
+) -> Iterator[ArchiveChunk]:
+    """Yield archived rows with ``start <= date < end``, oldest file first.
+
+    Files outside the range are skipped using the registry, so they are
+    never opened.
+    """
+    directory = directory or current_app.config["ARCHIVE_DIR"]
+    query = db.session.query(ArchiveFile.path).order_by(
+        ArchiveFile.month, ArchiveFile.first_date
+    )
+    if start is not None:
+        query = query.filter(ArchiveFile.last_date >= _utc_naive(start))
+    if end is not None:
+        query = query.filter(ArchiveFile.first_date < _utc_naive(end))
+    paths = [p for (p,) in query]
+    wanted = list(product_ids) if product_ids else None
+    lo = np.datetime64(_utc_naive(start), "us") if start is not None else None
+    hi = np.datetime64(_utc_naive(end), "us") if end is not None else None
+
+    for path in paths:
+        with np.load(os.path.join(directory, path)) as npz:
+            dates = npz["date"]
+            mask = np.ones(len(dates), dtype=bool)
+            if lo is not None:
+                mask &= dates >= lo
+            if hi is not None:
+                mask &= dates < hi
+            products = npz["products"]
+            codes = npz["product_code"]
+            if wanted is not None:
+                mask &= np.isin(codes, np.flatnonzero(np.isin(products, wanted)))
+            index = np.flatnonzero(mask)
+            if not len(index):
+                continue
+            columns = {name: npz[name] for name in npz.files}
+        for i in range(0, len(index), chunk_rows):
+            sel = index[i : i + chunk_rows]
+            yield ArchiveChunk(
+                movement_id=columns["movement_id"][sel],
+                date=columns["date"][sel],
+                product_id=products[codes[sel]],
+                movement_type=columns["types"][columns["type_code"][sel]],
+                quantity=columns["quantity"][sel],
+                order_id=_nullable(columns["order_id"][sel], columns["order_id_null"][sel]),
+                notes=_nullable(columns["notes"][sel], columns["notes_null"][sel]),
+            )
+
+
+def iter_dicts(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    product_ids: Optional[Sequence[str]] = None,
+    **kwargs,
+) -> Iterator[dict]:
+    """Archived rows shaped like :meth:`InventoryMovement.to_dict`, oldest first."""
+    for chunk in iter_chunks(start, end, product_ids, **kwargs):
+        dates = chunk.date.astype(datetime)
+        for i in range(len(chunk)):
+            yield {
+                "movement_id": str(chunk.movement_id[i]),
+                "date": dates[i].replace(tzinfo=timezone.utc).isoformat(),
+                "product_id": str(chunk.product_id[i]),
+                "movement_type": str(chunk.movement_type[i]),
+                "quantity": int(chunk.quantity[i]),
+                "order_id": chunk.order_id[i],
+                "notes": chunk.notes[i],
+            }
+
+
+def rollup_batches(**kwargs) -> Iterator[List[tuple]]:
+    """Archived rows as ``(product_id, day, movement_type, qty)`` lists, one
+    per chunk, ready for :meth:`DailyProductDemand.apply_many`."""
+    for chunk in iter_chunks(**kwargs):
+        days = chunk.date.astype("datetime64[D]").astype(date)
+        yield list(
+            zip(
+                chunk.product_id.tolist(),
+                days.tolist(),
+                chunk.movement_type.tolist(),
+                chunk.quantity.tolist(),
+            )
+        )
+
+
+def monthly_summary(
+    product_ids: Optional[Sequence[str]] = None,
+    month_from: Optional[date] = None,
+    month_to: Optional[date] = None,
+) -> List[dict]:
+    """Monthly totals of archived movements, filtered by product and month."""
+    m = MonthlyProductMovement
+    query = db.session.query(m).order_by(m.month, m.product_id, m.movement_type)
+    if product_ids:
+        query = query.filter(m.product_id.in_(list(product_ids)))
+    if month_from is not None:
+        query = query.filter(m.month >= month_from.replace(day=1))
+    if month_to is not None:
+        query = query.filter(m.month <= month_to.replace(day=1))
+    return [row.to_dict() for row in query]
+
+
+def archive_status() -> dict:
+    files = db.session.query(ArchiveFile).order_by(ArchiveFile.month, ArchiveFile.path).all()
+    return {
+        "files": [f.to_dict() for f in files],
+        "rows": sum(f.rows for f in files),
+        "size_bytes": sum(f.size_bytes for f in files),
+        "hot_rows": db.session.query(func.count()).select_from(InventoryMovement).scalar(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+def _month_start(month: str) -> date:
+    year, mon = month.split("-")
+    return date(int(year), int(mon), 1)
+
+
+def _next_month(start: date) -> date:
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def _date_column():
+    """``date`` as compared by this dialect: stored text on SQLite."""
+    if db.session.get_bind().dialect.name == "sqlite":
+        return type_coerce(InventoryMovement.date, db.String)
+    return InventoryMovement.date
+
+
+def _day_bound(day: date):
+    """00:00 UTC of *day*, comparable with :func:`_date_column`."""
+    if db.session.get_bind().dialect.name == "sqlite":
+        return day.isoformat()
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def _months_between(first, last) -> Iterator[str]:
+    """``YYYY-MM`` of every month from *first* to *last* (MIN/MAX values)."""
+    if first is None or last is None:
+        return
+    month, end = _month_start(_month_of(first)), _month_start(_month_of(last))
+    while month <= end:
+        yield month.strftime("%Y-%m")
+        month = _next_month(month)
+
+
+def _month_of(value) -> str:
+    if isinstance(value, str):  # SQLite text, any ISO layout
+        return value[:7]
+    return _utc_naive(value).strftime("%Y-%m")
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _nullable(values: np.ndarray, nulls: np.ndarray) -> List[Optional[str]]:
+    return [None if null else str(v) for v, null in zip(values.tolist(), nulls.tolist())]
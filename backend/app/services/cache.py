@@ -0,0 +1,45 @@
+"""Small in-process result caches guarded by a data watermark.
+
+Entries are keyed by the call parameters and tagged with the watermark that
+was current when they were computed; a lookup with a different watermark is
+a miss, so invalidation is implicit whenever the underlying data changes.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class WatermarkCache:
+    """Thread-safe LRU of ``key -> (watermark, value)``."""
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(
+        self, key: Hashable, watermark: Hashable, compute: Callable[[], Any]
+    ) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == watermark:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (watermark, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+forecast_cache = WatermarkCache()
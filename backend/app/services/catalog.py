@@ -0,0 +1,309 @@
+"""Read-through, process-wide cache of the product catalog.
+
+Each product is kept as a :class:`CatalogEntry`, a plain named tuple of its
+column values, about a tenth the size of an ORM instance with its state.
+Entries are indexed by ``product_id`` in LRU order and by ``sku``. The
+cache holds at most ``CATALOG_CACHE_SIZE`` products.
+
+Consistency
+-----------
+Every catalog write (create, edit, (de)activation, stock change) bumps the
+``product`` :class:`~app.models.version.DataVersion` counter when its
+transaction commits and stamps the new value on the rows it wrote
+(``product.change_seq``, see :func:`mark_changed`). Before serving, the
+cache compares its version with the database. When the counter moved it
+re-reads only the rows stamped after its own version (indexed on
+``change_seq``) and replaces those entries, so a stock change on one
+product does not drop the rest of the catalog. If more than
+``_REFRESH_LIMIT`` rows changed it drops everything instead and reloads on
+demand. Inside a request the counter is read at most once. The writing
+process also calls :meth:`CatalogCache.invalidate` after its commit, which
+makes its own changes visible within the same request.
+
+Entries loaded after the version was read may already be newer than that
+version. They are never older, so a stale entry can only survive until the
+next version check.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+VERSION_NAME = "product"
+_PENDING_IDS = "catalog_changed"  # session.info: product ids written
+_CHUNK = 500
+_REFRESH_LIMIT = 1000  # changed rows re-read in place; beyond that, drop all
+
+
+class CatalogEntry(NamedTuple):
+    """Compact, immutable snapshot of one ``product`` row."""
+
+    product_id: str
+    product_name: str
+    sku: str
+    unit_of_measure: str
+    cost: float
+    sale_price: float
+    category: str
+    location: str
+    stk_qty: int
+    active: bool
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    def to_dict(self) -> Dict:
+        """Same shape as :meth:`Product.to_dict`."""
+        data = self._asdict()
+        data["active"] = bool(self.active)
+        for key in ("created_at", "updated_at"):
+            data[key] = data[key].isoformat() if data[key] else None
+        return data
+
+
+class CatalogCache:
+    """Thread-safe LRU of catalog entries, validated against the DB version."""
+
+    def __init__(self, maxsize: int = 50_000):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, CatalogEntry]" = OrderedDict()
+        self._by_sku: Dict[str, str] = {}
+        self._complete = False
+        self._version: Optional[int] = None
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def get(self, product_id: str) -> Optional[CatalogEntry]:
+        return self.many([product_id]).get(product_id)
+
+    def get_by_sku(self, sku: str) -> Optional[CatalogEntry]:
+        return self.many_by_sku([sku]).get(sku)
+
+    def many(self, product_ids: Iterable[str]) -> Dict[str, CatalogEntry]:
+        """``{product_id: entry}`` for the ids that exist; misses are read in chunks."""
+        return self._lookup(product_ids, by_sku=False)
+
+    def many_by_sku(self, skus: Iterable[str]) -> Dict[str, CatalogEntry]:
+        """``{sku: entry}`` for the SKUs that exist; misses are read in chunks."""
+        return self._lookup(skus, by_sku=True)
+
+    def _lookup(self, keys: Iterable[str], by_sku: bool) -> Dict[str, CatalogEntry]:
+        from ..models.producto import Product
+
+        version = self._sync()
+        column = Product.sku if by_sku else Product.product_id
+        out: Dict[str, CatalogEntry] = {}
+        missing: List[str] = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                pid = self._by_sku.get(key) if by_sku else key
+                entry = self._entries.get(pid) if pid is not None else None
+                if entry is not None:
+                    self._entries.move_to_end(pid)
+                    out[key] = entry
+                elif not self._complete:
+                    missing.append(key)
+        for i in range(0, len(missing), _CHUNK):
+            for entry in self._load(column.in_(missing[i : i + _CHUNK]), version):
+                out[entry.sku if by_sku else entry.product_id] = entry
+        return out
+
+    def all(self) -> List[CatalogEntry]:
+        """Every product. The result is cached only if it fits in ``maxsize``."""
+        version = self._sync()
+        with self._lock:
+            if self._complete:
+                return list(self._entries.values())
+        entries = self._load(None)
+        with self._lock:
+            if len(entries) <= self.maxsize and self._version == version:
+                self._clear()
+                for entry in entries:
+                    self._put(entry)
+                self._complete = True
+        return entries
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def invalidate(self) -> None:
+        """Re-check the version on the next lookup (called by this process
+        after a catalog write); only the rows written since are re-read."""
+        if has_request_context():
+            g.pop("catalog_version", None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "complete": self._complete,
+                "version": self._version,
+            }
+
+    def _sync(self) -> int:
+        """Validate against the database counter and return the version."""
+        from ..models.version import DataVersion
+
+        version = g.get("catalog_version") if has_request_context() else None
+        if version is None:
+            version, _ = DataVersion.current(VERSION_NAME)
+            if has_request_context():
+                g.catalog_version = version
+        with self._lock:
+            known = self._version
+        changed = None
+        if known is not None and version > known:
+            changed = self._changed_since(known)
+        with self._lock:
+            # Counters only grow: a request that read an older value must not
+            # roll back a newer view loaded by another thread.
+            if self._version is None or version > self._version:
+                if changed is not None and self._version == known:
+                    self._refresh(changed)
+                else:
+                    self._clear()
+                self._version = version
+            return self._version
+
+    def _changed_since(self, version: int) -> Optional[List[CatalogEntry]]:
+        """Rows stamped after *version*; ``None`` if more than the limit."""
+        from .. import db
+        from ..models.producto import Product
+
+        rows = (
+            db.session.query(*Product.__table__.c)
+            .filter(Product.change_seq > version)
+            .limit(_REFRESH_LIMIT + 1)
+            .all()
+        )
+        if len(rows) > _REFRESH_LIMIT:
+            return None
+        return [_entry(row) for row in rows]
+
+    def _refresh(self, entries: List[CatalogEntry]) -> None:
+        """Replace cached entries with *entries*; add new products only while
+        the cache holds the whole catalog."""
+        for entry in entries:
+            if entry.product_id in self._entries or self._complete:
+                self._put(entry)
+
+    def _load(self, clause, version: Optional[int] = None) -> List[CatalogEntry]:
+        """Read matching rows; keep them if *version* is still current.
+
+        Rows read after *version* was checked are at least that new, so they
+        are only dropped when another thread has since seen a newer version.
+        """
+        from .. import db
+        from ..models.producto import Product
+
+        query = db.session.query(*Product.__table__.c)
+        if clause is not None:
+            query = query.filter(clause)
+        entries = [_entry(row) for row in query]
+        if version is not None:
+            with self._lock:
+                if self._version == version:
+                    for entry in entries:
+                        self._put(entry)
+        return entries
+
+    def _put(self, entry: CatalogEntry) -> None:
+        old = self._entries.pop(entry.product_id, None)
+        if old is not None and old.sku != entry.sku:
+            self._drop_sku(old)
+        self._entries[entry.product_id] = entry
+        self._by_sku[entry.sku] = entry.product_id
+        while len(self._entries) > self.maxsize:
+            _, evicted = self._entries.popitem(last=False)
+            self._drop_sku(evicted)
+            self._complete = False
+
+    def _drop_sku(self, entry: CatalogEntry) -> None:
+        # The SKU may already belong to another product (SKUs swapped).
+        if self._by_sku.get(entry.sku) == entry.product_id:
+            del self._by_sku[entry.sku]
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._by_sku.clear()
+        self._complete = False
+
+
+def _entry(row) -> CatalogEntry:
+    return CatalogEntry(
+        row.product_id,
+        row.product_name,
+        row.sku,
+        row.unit_of_measure,
+        float(row.cost),
+        float(row.sale_price),
+        row.category,
+        row.location,
+        row.stk_qty,
+        row.active,
+        row.created_at,
+        row.updated_at,
+    )
+
+
+def mark_changed(product_ids: Iterable[str]) -> None:
+    """Record that *product_ids* change in the current transaction (no commit).
+
+    The ``product`` version is bumped right before the commit and stamped on
+    those rows as ``product.change_seq`` (see :mod:`app.models.version`).
+    The local cache is dropped once the transaction commits.
+    """
+    from .. import db
+    from ..models.version import DataVersion
+
+    db.session.info.setdefault(_PENDING_IDS, set()).update(product_ids)
+    DataVersion.bump(VERSION_NAME, _stamp_changed)
+
+
+def _stamp_changed(session, version: int) -> None:
+    """``on_bump`` callback: set ``change_seq`` of the changed rows."""
+    from ..models.producto import Product
+
+    table = Product.__table__
+    ids = sorted(session.info.get(_PENDING_IDS, ()))
+    for i in range(0, len(ids), _CHUNK):
+        session.execute(
+            table.update()
+            .where(table.c.product_id.in_(ids[i : i + _CHUNK]))
+            # Keep ``updated_at``: the stamp is bookkeeping, not an edit.
+            .values(change_seq=version, updated_at=table.c.updated_at)
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session) -> None:
+    if session.in_nested_transaction():
+        return
+    if session.info.pop(_PENDING_IDS, None) is not None and has_app_context():
+        get_catalog().invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session) -> None:
+    if not session.in_nested_transaction():
+        session.info.pop(_PENDING_IDS, None)
+
+
+def get_catalog() -> CatalogCache:
+    """The current app's catalog cache (one per app, created on first use)."""
+    app = current_app._get_current_object()
+    cache = app.extensions.get("catalog")
+    if cache is None:
+        cache = app.extensions.setdefault(
+            "catalog", CatalogCache(app.config.get("CATALOG_CACHE_SIZE", 50_000))
+        )
+    return cache
@@ -0,0 +1,187 @@
+"""In-process fan-out of :class:`~app.models.evento.StockEvent` rows to SSE clients.
+
+Each worker process has one :class:`EventHub`. A single poller thread reads
+new ``stock_event`` rows every ``STREAM_POLL_SECONDS`` and appends them to a
+bounded ring buffer. Subscribers wait on a condition variable and read from
+that buffer, so the database cost does not grow with the number of open
+streams. Writes committed in the same process wake the poller right away
+through a session ``after_commit`` hook. Writes from other workers are
+picked up by polling, which lets the SQLite table itself act as the broker
+between processes.
+
+Every open stream holds a server thread for its whole life. The hub counts
+them and refuses more than ``STREAM_MAX_CLIENTS`` per process (``0``: no
+limit), so streams can never take every thread away from the API.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """Poll ``stock_event`` once per process and fan out to waiting clients."""
+
+    def __init__(self, app, buffer_size: int = 1000, max_clients: int = 0):
+        self.app = app
+        self.max_clients = max_clients
+        self.clients = 0
+        self._buffer: "deque[Dict]" = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._slots = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_id = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def ensure_started(self) -> None:
+        """Start the poller on first use (CLI commands never need it)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            from ..models.evento import StockEvent
+
+            with self.app.app_context():
+                self.last_id = StockEvent.last_id()
+            self._thread = threading.Thread(target=self._loop, name="event-hub", daemon=True)
+            self._thread.start()
+
+    def poke(self) -> None:
+        self._wake.set()
+
+    def _loop(self) -> None:
+        from .. import db
+        from ..models.evento import StockEvent
+
+        config = self.app.config
+        polls = 0
+        while True:
+            try:
+                with self.app.app_context():
+                    fresh = StockEvent.since(self.last_id, limit=self._buffer.maxlen)
+                    polls += 1
+                    if config["STREAM_EVENT_RETENTION"] and polls % 1000 == 0:
+                        StockEvent.prune(config["STREAM_EVENT_RETENTION"])
+                    db.session.rollback()
+                if fresh:
+                    with self._cond:
+                        self._buffer.extend(fresh)
+                        self.last_id = fresh[-1]["id"]
+                        self._cond.notify_all()
+                    if len(fresh) == self._buffer.maxlen:
+                        continue  # more pending, read on without sleeping
+            except Exception as exc:  # keep the thread alive
+                logger.error("Error leyendo eventos de stock: %s", exc)
+            self._wake.wait(config["STREAM_POLL_SECONDS"])
+            self._wake.clear()
+
+    # ------------------------------------------------------------------
+    # Subscribers
+    # ------------------------------------------------------------------
+    def subscribe(self) -> bool:
+        """Reserve a stream slot; ``False`` when ``max_clients`` are open."""
+        with self._slots:
+            if self.max_clients and self.clients >= self.max_clients:
+                return False
+            self.clients += 1
+            return True
+
+    def unsubscribe(self) -> None:
+        with self._slots:
+            self.clients = max(self.clients - 1, 0)
+
+    def wait(self, after_id: int, timeout: float) -> Optional[List[Dict]]:
+        """Events with id greater than *after_id*, blocking up to *timeout*.
+
+        Returns ``[]`` on timeout. Returns ``None`` if *after_id* is older
+        than the buffer, in which case the caller catches up from the
+        database.
+        """
+        with self._cond:
+            if after_id >= self.last_id:
+                self._cond.wait(timeout)
+            if after_id >= self.last_id:
+                return []
+            if not self._buffer or self._buffer[0]["id"] > after_id + 1:
+                return None
+            return [e for e in self._buffer if e["id"] > after_id]
+
+
+def get_hub(app) -> EventHub:
+    hub = app.extensions.get("event_hub")
+    if hub is None:
+        hub = app.extensions.setdefault(
+            "event_hub",
+            EventHub(app, app.config["STREAM_BUFFER_SIZE"], app.config["STREAM_MAX_CLIENTS"]),
+        )
+    hub.ensure_started()
+    return hub
+
+
+def sse_stream(app, after_id: int, product_ids=None) -> Iterator[str]:
+    """Yield SSE frames for events after *after_id*, forever.
+
+    Sends a comment line every ``STREAM_HEARTBEAT_SECONDS`` so proxies keep
+    the connection open and dead clients are noticed.
+    """
+    from .. import db
+    from ..models.evento import StockEvent
+
+    hub = get_hub(app)
+    heartbeat = app.config["STREAM_HEARTBEAT_SECONDS"]
+    wanted = set(product_ids) if product_ids else None
+    yield f"retry: {int(app.config['STREAM_RETRY_MS'])}\n\n"
+    while True:
+        events = hub.wait(after_id, heartbeat)
+        if events is None:  # behind the buffer: catch up from the table
+            with app.app_context():
+                events = StockEvent.since(after_id)
+                db.session.remove()
+        if not events:
+            yield ": ping\n\n"
+            continue
+        frames = []
+        for ev in events:
+            if wanted is None or ev["product_id"] in wanted:
+                frames.append(_frame(ev))
+        after_id = events[-1]["id"]
+        if frames:
+            yield "".join(frames)
+
+
+def _frame(ev: Dict) -> str:
+    data = {k: v for k, v in ev.items() if k not in ("id", "kind")}
+    return (
+        f"id: {ev['id']}\nevent: {ev['kind']}\n"
+        f"data: {json.dumps(data, separators=(',', ':'), ensure_ascii=False)}\n\n"
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_hub(session) -> None:
+    from ..models.evento import PENDING_FLAG
+
+    if session.info.pop(PENDING_FLAG, False) and has_app_context():
+        hub = current_app.extensions.get("event_hub")
+        if hub is not None:
+            hub.poke()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session) -> None:
+    from ..models.evento import PENDING_FLAG
+
+    session.info.pop(PENDING_FLAG, None)
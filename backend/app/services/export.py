@@ -0,0 +1,244 @@
+"""Streamed CSV / Parquet exports of the movement ledger and stock snapshot.
+
+Rows are read with ``yield_per`` (server-side cursor / ``fetchmany``
+batches), encoded a batch at a time and handed out as ``bytes`` chunks.
+Memory therefore depends on the batch size, not on the export size, whether
+the chunks go to an HTTP response or to a file.
+
+* CSV is written through a small reusable text buffer. With ``gzip=True``
+  the chunks pass through a streaming ``zlib`` compressor in gzip framing,
+  so the output is a valid ``.csv.gz``.
+* Parquet needs the optional ``pyarrow`` package. Each batch becomes one
+  row group and is emitted as soon as it is written. The footer follows the
+  last row group. ``gzip=True`` selects gzip column compression; otherwise
+  snappy is used.
+
+The movement export covers the whole history. Archived months
+(:mod:`app.services.archive`) come first, then the hot table, all in date
+order.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import zlib
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .. import db
+from ..models.movimiento import InventoryMovement
+from ..models.producto import Product
+from . import archive
+
+try:  # optional dependency
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on environment
+    pa = pq = None
+
+FORMATS = ("csv", "parquet")
+DEFAULT_BATCH_SIZE = 5000
+
+MOVEMENT_COLUMNS = (
+    "movement_id", "date", "product_id", "movement_type", "quantity", "order_id", "notes",
+)
+STOCK_COLUMNS = (
+    "product_id", "sku", "product_name", "category", "location", "unit_of_measure",
+    "stk_qty", "cost", "sale_price", "active", "updated_at",
+)
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def content_type(fmt: str, gzip: bool) -> Tuple[str, str]:
+    """``(mimetype, file extension)`` for an export."""
+    if fmt == "parquet":
+        return "application/vnd.apache.parquet", ".parquet"
+    if gzip:
+        return "application/gzip", ".csv.gz"
+    return "text/csv", ".csv"
+
+
+# ---------------------------------------------------------------------------
+# Row sources (batches of tuples)
+# ---------------------------------------------------------------------------
+def movement_batches(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    include_archive: bool = True,
+) -> Iterator[List[tuple]]:
+    """Movements with ``date_from <= date < date_to``, oldest first."""
+    if include_archive:
+        for chunk in archive.iter_chunks(date_from, date_to, chunk_rows=batch_size):
+            dates = chunk.date.astype(datetime)
+            yield list(
+                zip(
+                    chunk.movement_id.tolist(),
+                    [d.replace(tzinfo=timezone.utc) for d in dates],
+                    chunk.product_id.tolist(),
+                    chunk.movement_type.tolist(),
+                    chunk.quantity.tolist(),
+                    chunk.order_id,
+                    chunk.notes,
+                )
+            )
+
+    rows = InventoryMovement.iter_rows(
+        [getattr(InventoryMovement, name) for name in MOVEMENT_COLUMNS],
+        date_from=date_from,
+        date_to=date_to,
+        batch_size=batch_size,
+    )
+    yield from _batched(((r[0], _utc(r[1]), *r[2:]) for r in rows), batch_size)
+
+
+def stock_batches(
+    *, active_only: bool = False, batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[List[tuple]]:
+    """Current stock snapshot from ``product``, by SKU."""
+    columns = [getattr(Product, name) for name in STOCK_COLUMNS]
+    query = db.session.query(*columns)
+    if active_only:
+        query = query.filter(Product.active.is_(True))
+    query = query.order_by(Product.sku).yield_per(batch_size)
+    yield from _batched(((*r[:10], _utc(r[10])) for r in query), batch_size)
+
+
+# ---------------------------------------------------------------------------
+# Encoders (bytes chunks)
+# ---------------------------------------------------------------------------
+def encode(
+    fmt: str, columns: Sequence[str], batches: Iterable[List[tuple]], *, gzip: bool = False
+) -> Iterator[bytes]:
+    if fmt == "csv":
+        chunks = csv_chunks(columns, batches)
+        return gzip_chunks(chunks) if gzip else chunks
+    if fmt == "parquet":
+        if pa is None:
+            raise ValueError("Exportar a Parquet requiere el paquete pyarrow")
+        return parquet_chunks(columns, batches, compression="gzip" if gzip else "snappy")
+    raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def csv_chunks(columns: Sequence[str], batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([_csv_value(v) for v in row] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip header
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose contents are collected and cleared by the caller."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def parquet_chunks(
+    columns: Sequence[str], batches: Iterable[List[tuple]], *, compression: str = "snappy"
+) -> Iterator[bytes]:
+    schema = pa.schema([_ARROW_TYPES[name] for name in columns])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for batch in batches:
+            table = pa.Table.from_arrays(
+                [pa.array(col, type=schema.field(i).type) for i, col in enumerate(zip(*batch))],
+                schema=schema,
+            )
+            writer.write_table(table)
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    batch: List[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _utc(value):
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+if pa is not None:
+    _ARROW_TYPES = {
+        "movement_id": pa.field("movement_id", pa.string()),
+        "date": pa.field("date", pa.timestamp("us", tz="UTC")),
+        "product_id": pa.field("product_id", pa.string()),
+        "movement_type": pa.field("movement_type", pa.string()),
+        "quantity": pa.field("quantity", pa.int64()),
+        "order_id": pa.field("order_id", pa.string()),
+        "notes": pa.field("notes", pa.string()),
+        "sku": pa.field("sku", pa.string()),
+        "product_name": pa.field("product_name", pa.string()),
+        "category": pa.field("category", pa.string()),
+        "location": pa.field("location", pa.string()),
+        "unit_of_measure": pa.field("unit_of_measure", pa.string()),
+        "stk_qty": pa.field("stk_qty", pa.int64()),
+        "cost": pa.field("cost", pa.decimal128(10, 2)),
+        "sale_price": pa.field("sale_price", pa.decimal128(10, 2)),
+        "active": pa.field("active", pa.bool_()),
+        "updated_at": pa.field("updated_at", pa.timestamp("us", tz="UTC")),
+    }
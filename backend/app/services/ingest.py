@@ -0,0 +1,234 @@
+"""Streaming bulk ingestion of inventory movements.
+
+Rows arrive as NDJSON (one JSON object per line) or CSV with a header row.
+They are parsed lazily, validated in chunks and written with one
+``executemany`` per batch, each batch in its own transaction together with
+its daily-rollup delta. Memory stays bounded by the batch size regardless
+of input size, and invalid rows are reported by line number without
+aborting the rest of the load.
+
+Assumptions
+-----------
+* ``movement_id`` is optional; a UUID4 is generated when it is missing.
+* Rows whose ``movement_id`` already exists, or that repeat an id within
+  the same batch, are reported as errors rather than overwritten.
+* At most ``max_errors`` error entries are kept; further errors are only
+  counted.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from typing import IO, Iterable, Iterator, List, Optional, Tuple, Union
+from uuid import uuid4
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from .. import db
+from ..models.demanda import DailyProductDemand
+from ..models.movimiento import InventoryMovement
+from ..models.producto import Product
+from ..models.version import DataVersion
+
+DEFAULT_BATCH_SIZE = 5000
+FORMATS = ("ndjson", "csv")
+
+Record = Tuple[int, Union[dict, Exception]]
+
+
+@dataclass
+class IngestReport:
+    inserted: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: List[dict] = field(default_factory=list)
+    max_errors: int = 1000
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+# ─── Parsing ──────────────────────────────────────────────────────────────
+def _text(stream: IO) -> IO[str]:
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def iter_ndjson(stream: IO) -> Iterator[Record]:
+    for line_no, line in enumerate(_text(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as exc:
+            yield line_no, ValueError(f"JSON inválido: {exc}")
+            continue
+        if not isinstance(obj, dict):
+            yield line_no, ValueError("Se esperaba un objeto JSON por línea")
+            continue
+        yield line_no, obj
+
+
+def iter_csv(stream: IO) -> Iterator[Record]:
+    reader = csv.DictReader(_text(stream))
+    for row in reader:
+        # line 1 is the header
+        yield reader.line_num, {k: v for k, v in row.items() if v not in (None, "")}
+
+
+def iter_records(stream: IO, fmt: str) -> Iterator[Record]:
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt} (use {' o '.join(FORMATS)})")
+    return iter_csv(stream) if fmt == "csv" else iter_ndjson(stream)
+
+
+# ─── Validation ───────────────────────────────────────────────────────────
+_REQUIRED = ("date", "product_id", "movement_type", "quantity")
+_COLUMNS = ("movement_id", "date", "product_id", "movement_type", "quantity", "order_id", "notes")
+
+
+def _validate(data: dict) -> dict:
+    missing = [k for k in _REQUIRED if k not in data]
+    if missing:
+        raise ValueError(f"Campos requeridos faltantes: {', '.join(missing)}")
+
+    qty = data["quantity"]
+    if isinstance(qty, str) and qty.strip().lstrip("-").isdigit():
+        qty = int(qty)
+    if not isinstance(qty, int) or isinstance(qty, bool):
+        raise ValueError("La cantidad debe ser un entero")
+
+    row = {k: data.get(k) for k in _COLUMNS}
+    row["movement_id"] = str(row["movement_id"] or uuid4())
+    row["date"] = InventoryMovement._coerce_date(data["date"])
+    row["quantity"] = qty
+    row["movement_type"] = str(row["movement_type"])
+    return row
+
+
+# ─── Loading ──────────────────────────────────────────────────────────────
+def ingest_movements(
+    records: Iterable[Record],
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_errors: int = 1000,
+) -> IngestReport:
+    """Validate and insert *records* in batches of *batch_size* rows."""
+    report = IngestReport(max_errors=max_errors)
+    known_products: set = set()
+    batch: List[Tuple[int, dict]] = []
+
+    for line_no, data in records:
+        if isinstance(data, Exception):
+            report.error(line_no, str(data))
+            continue
+        try:
+            row = _validate(data)
+        except ValueError as exc:
+            report.error(line_no, str(exc))
+            continue
+        batch.append((line_no, row))
+        if len(batch) >= batch_size:
+            _flush(batch, report, known_products)
+            batch = []
+    if batch:
+        _flush(batch, report, known_products)
+    return report
+
+
+def _flush(batch: List[Tuple[int, dict]], report: IngestReport, known_products: set) -> None:
+    """Insert one batch in its own transaction, dropping rows that would fail."""
+    sess = db.session
+    table = InventoryMovement.__table__
+
+    wanted = {row["product_id"] for _, row in batch} - known_products
+    if wanted:
+        known_products.update(
+            pid
+            for (pid,) in sess.query(Product.product_id).filter(Product.product_id.in_(wanted))
+        )
+    existing = {
+        mid
+        for (mid,) in sess.query(InventoryMovement.movement_id).filter(
+            InventoryMovement.movement_id.in_([row["movement_id"] for _, row in batch])
+        )
+    }
+
+    accepted: List[Tuple[int, dict]] = []
+    for line_no, row in batch:
+        if row["product_id"] not in known_products:
+            report.error(line_no, "Producto no encontrado")
+        elif row["movement_id"] in existing:
+            report.error(line_no, "movement_id ya existe")
+        else:
+            existing.add(row["movement_id"])
+            accepted.append((line_no, row))
+
+    report.batches += 1
+    rows = [row for _, row in accepted]
+    if not rows:
+        sess.rollback()
+        return
+    try:
+        _insert_many(table, rows)
+        DailyProductDemand.apply_many(
+            (r["product_id"], r["date"], r["movement_type"], r["quantity"]) for r in rows
+        )
+        DataVersion.bump(InventoryMovement.__tablename__)
+        sess.commit()
+        report.inserted += len(rows)
+    except SQLAlchemyError as exc:
+        sess.rollback()
+        for line_no, _ in accepted:
+            report.error(line_no, f"Error insertando el lote: {exc.__class__.__name__}")
+
+
+def _insert_many(table, rows: List[dict]) -> None:
+    """DBAPI ``executemany`` of *rows*, skipping per-row SQLAlchemy overhead.
+
+    Bind processors (e.g. DateTime → SQLite text) are resolved once per
+    batch and applied directly while building the parameter tuples.
+    """
+    conn = db.session.connection()
+    dialect = conn.dialect
+    compiled = table.insert().compile(dialect=dialect, column_keys=list(_COLUMNS))
+    keys = compiled.positiontup if compiled.positional else list(_COLUMNS)
+    procs = [
+        (i, proc)
+        for i, key in enumerate(keys)
+        if (proc := table.c[key].type.dialect_impl(dialect).bind_processor(dialect))
+    ]
+
+    params = []
+    for row in rows:
+        values = [row[key] for key in keys]
+        for i, proc in procs:
+            if values[i] is not None:
+                values[i] = proc(values[i])
+        params.append(tuple(values) if compiled.positional else dict(zip(keys, values)))
+    conn.exec_driver_sql(compiled.string, params)
+
+
+def ingest_stream(
+    stream: IO, fmt: str, *, batch_size: Optional[int] = None, max_errors: int = 1000
+) -> IngestReport:
+    return ingest_movements(
+        iter_records(stream, fmt),
+        batch_size=batch_size or DEFAULT_BATCH_SIZE,
+        max_errors=max_errors,
+    )
@@ -0,0 +1,37 @@
+"""Opaque continuation tokens for keyset (seek) pagination.
+
+A token is the URL-safe base64 of the JSON list of sort-key values of the
+last row returned. Clients must treat it as opaque.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from typing import Any, List
+
+MAX_PAGE_SIZE = 5000
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, size: int) -> List[Any]:
+    """Decode *token* into a list of *size* values or raise ``ValueError``."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError) as exc:
+        raise ValueError("Cursor inválido") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Cursor inválido")
+    return values
+
+
+def clamp_limit(value: int, default: int) -> int:
+    if value is None or value <= 0:
+        return default
+    return min(value, MAX_PAGE_SIZE)
@@ -0,0 +1,170 @@
+"""In-process background refresh of precomputed forecasts.
+
+A daemon thread wakes up every ``FORECAST_POLL_SECONDS`` and refreshes the
+stored :class:`~app.models.prediccion.ForecastResult` of the default
+parameter set when its result is stale (see its watermark) and one of these
+is true:
+
+* at least ``FORECAST_REFRESH_MOVEMENTS`` movements were written since the
+  result was computed,
+* it is older than ``FORECAST_REFRESH_SECONDS``, or
+* the calendar day changed, which moves the forecast window.
+
+The default parameter set is always kept warm, so the first
+``/api/get_prediction`` after a restart or data change does not pay for the
+computation. It is the only set kept: rows left for other sets (written by
+older versions) are deleted. Each worker process runs its own thread. The row claim in
+:meth:`ForecastResult.refresh` keeps them from computing the same result
+twice.
+
+The same thread also takes the periodic stock snapshot
+(:class:`~app.models.instantanea.StockSnapshot`) once the latest one is
+``SNAPSHOT_INTERVAL_DAYS`` old (``0`` disables it); its run registry plays
+the same claiming role.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastScheduler:
+    """Periodic, change-driven forecast refresher bound to one Flask app."""
+
+    def __init__(self, app, defaults: Dict[str, int]):
+        self.app = app
+        self.defaults = dict(defaults)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_check: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="forecast-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def poke(self) -> None:
+        """Run a check now instead of waiting for the next poll."""
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ------------------------------------------------------------------
+    # Work
+    # ------------------------------------------------------------------
+    def _loop(self) -> None:
+        poll = self.app.config["FORECAST_POLL_SECONDS"]
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self.run_once()
+                    self.snapshot_if_due()
+                self.last_error = None
+            except Exception as exc:  # keep the thread alive
+                self.last_error = str(exc)
+                logger.error("Error refrescando predicciones: %s", exc, exc_info=True)
+            self._wake.wait(poll)
+            self._wake.clear()
+
+    def run_once(self) -> int:
+        """Refresh the default parameter set if due; return how many were recomputed.
+
+        Must run inside an application context.
+        """
+        from .. import db
+        from ..models.movimiento import InventoryMovement
+        from ..models.prediccion import ForecastResult, params_key
+        from ..models.version import DataVersion
+
+        config = self.app.config
+        self.last_check = datetime.now(timezone.utc)
+        try:
+            watermark, _ = InventoryMovement.forecast_watermark()
+            version, _ = DataVersion.current(InventoryMovement.__tablename__)
+            rows = db.session.query(
+                ForecastResult.params_key,
+                ForecastResult.params,
+                ForecastResult.watermark,
+                ForecastResult.movements_version,
+                ForecastResult.computed_at,
+            ).all()
+        finally:
+            db.session.rollback()  # end the read transaction before long work
+
+        key = params_key(self.defaults)
+        if any(row.params_key != key for row in rows):
+            ForecastResult.prune([key])
+        rows = [row for row in rows if row.params_key == key]
+
+        due = [] if rows else [self.defaults]
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for row in rows:
+            if row.computed_at is None or row.watermark == repr(watermark):
+                continue
+            if (
+                version - row.movements_version >= config["FORECAST_REFRESH_MOVEMENTS"]
+                or (now - row.computed_at).total_seconds() >= config["FORECAST_REFRESH_SECONDS"]
+                or row.computed_at.date() != now.date()
+            ):
+                due.append(row.params)
+
+        refreshed = 0
+        for params in due:
+            if self._stop.is_set():
+                break
+            try:
+                if ForecastResult.refresh(params) is not None:
+                    refreshed += 1
+            except Exception as exc:  # recorded in the row; try the next one
+                logger.error("Error en predicción %s: %s", params, exc)
+        return refreshed
+
+    def snapshot_if_due(self) -> bool:
+        """Build today's stock snapshot when the interval has elapsed.
+
+        Must run inside an application context.
+        """
+        from ..models.instantanea import StockSnapshot
+
+        config = self.app.config
+        interval = config["SNAPSHOT_INTERVAL_DAYS"]
+        if not interval or self._stop.is_set() or not StockSnapshot.due(interval):
+            return False
+        run = StockSnapshot.build(batch_size=config["BULK_BATCH_SIZE"])
+        if run is not None:
+            logger.info("Snapshot de stock %s: %s productos", run.day, run.products)
+        return run is not None
+
+
+def start_scheduler(app, defaults: Dict[str, int]) -> ForecastScheduler:
+    """Create, register under ``app.extensions`` and start the scheduler.
+
+    A scheduler already registered for *app* is (re)started and returned.
+    """
+    scheduler = app.extensions.get("forecast_scheduler")
+    if scheduler is None:
+        scheduler = app.extensions.setdefault(
+            "forecast_scheduler", ForecastScheduler(app, defaults)
+        )
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,103 @@
+"""Full-text index over ``product.product_name`` (SQLite FTS5).
+
+``product_fts`` is an *external content* FTS5 table. It stores only the
+index and reads the text from ``product`` through its rowid. Three triggers
+keep it in step with every INSERT, UPDATE of ``product_name`` and DELETE on
+``product``, including writes made outside the ORM. No application code has
+to remember to update it.
+
+Assumptions
+-----------
+* ``product`` has an implicit rowid, because its primary key is a string.
+  ``VACUUM`` may renumber such rowids. After a VACUUM, run
+  ``flask rebuild-search``, which re-reads every row.
+* On databases without FTS5 (another dialect, or an SQLite build without
+  the extension) :func:`fts_available` is false. Callers then fall back to
+  ``LIKE`` filters.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+import sqlalchemy as sa
+
+FTS_TABLE = "product_fts"
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "product_name, content='product', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, product_name) VALUES (new.rowid, new.product_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, product_name)
+        VALUES ('delete', old.rowid, old.product_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF product_name ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, product_name)
+        VALUES ('delete', old.rowid, old.product_name);
+        INSERT INTO {FTS_TABLE}(rowid, product_name) VALUES (new.rowid, new.product_name);
+    END""",
+]
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def init_search(app, db, *, create: bool = True) -> None:
+    """Create the FTS table and triggers if missing, and index existing rows.
+
+    Must run inside an application context, after ``create_all``. With
+    ``create=False`` (schema managed elsewhere) it only detects the table.
+    """
+    available = False
+    if not create:
+        available = sa.inspect(db.engine).has_table(FTS_TABLE)
+    elif db.engine.dialect.name == "sqlite":
+        try:
+            with db.engine.begin() as conn:
+                created = not sa.inspect(conn).has_table(FTS_TABLE)
+                for ddl in _DDL:
+                    conn.exec_driver_sql(ddl)
+                if created:
+                    conn.exec_driver_sql(
+                        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+                    )
+            available = True
+        except sa.exc.OperationalError as exc:  # SQLite built without FTS5
+            app.logger.warning(f"Búsqueda de texto completo no disponible: {exc}")
+    app.extensions["product_fts"] = available
+
+
+def rebuild_search(db) -> None:
+    """Re-index every product (after VACUUM or a bulk load with triggers off)."""
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def fts_available(app) -> bool:
+    return bool(app.extensions.get("product_fts"))
+
+
+def match_expression(text: str, *, prefix: bool = False) -> Optional[str]:
+    """FTS5 query matching every word of *text* (implicit AND).
+
+    Words are quoted, so user input cannot inject FTS syntax. With *prefix*
+    the last word also matches as a prefix (``"lapt"*``).
+    """
+    words = _WORD.findall(text or "")
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    if prefix:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def matching_rowids(expression: str):
+    """Selectable of ``product`` rowids whose name matches *expression*."""
+    return sa.text(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts"
+    ).bindparams(fts=expression).columns(sa.column("rowid", sa.Integer))
@@ -0,0 +1,95 @@
+"""Streaming, ORM-free JSON serialisation for list endpoints.
+
+Instead of hydrating ORM objects, calling ``to_dict()`` on each and handing
+one giant list to ``jsonify``, list endpoints can select plain column
+tuples, convert them with per-column converters resolved once, and emit
+the JSON array in chunks from a generator. Time-to-first-byte and peak
+memory then no longer grow with the size of the result.
+
+``orjson`` is used when installed; otherwise the stdlib encoder is used.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+from flask import Response, stream_with_context
+from sqlalchemy import Column, DateTime, Numeric
+
+try:  # optional fast encoder
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+except ImportError:  # pragma: no cover - depends on environment
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def _dumps(obj) -> bytes:
+        return _encoder.encode(obj).encode()
+
+
+DEFAULT_CHUNK_ROWS = 1000
+
+Converter = Optional[Callable]
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def column_converters(columns: Sequence[Column]) -> List[Converter]:
+    """Per-column converters matching the models' ``to_dict`` output."""
+    converters: List[Converter] = []
+    for column in columns:
+        if isinstance(column.type, Numeric):
+            converters.append(lambda v: float(v) if v is not None else None)
+        elif isinstance(column.type, DateTime):
+            converters.append(_isoformat)
+        else:
+            converters.append(None)
+    return converters
+
+
+def iter_dicts(columns: Sequence[Column], rows: Iterable[tuple]) -> Iterator[dict]:
+    """Turn column tuples into ``{column.key: value}`` dicts lazily."""
+    keys = [c.key for c in columns]
+    converters = list(enumerate(column_converters(columns)))
+    for row in rows:
+        values = list(row)
+        for i, convert in converters:
+            if convert is not None:
+                values[i] = convert(values[i])
+        yield dict(zip(keys, values))
+
+
+def json_array_chunks(
+    records: Iterable[dict], chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> Iterator[bytes]:
+    """Yield a JSON array of *records* in chunks of *chunk_rows* items."""
+    yield b"["
+    first = True
+    buffer: List[bytes] = []
+    for record in records:
+        buffer.append(_dumps(record))
+        if len(buffer) >= chunk_rows:
+            yield (b"" if first else b",") + b",".join(buffer)
+            first = False
+            buffer = []
+    if buffer:
+        yield (b"" if first else b",") + b",".join(buffer)
+    yield b"]"
+
+
+def stream_json_array(records: Iterable[dict], status: int = 200) -> Response:
+    """Flask response streaming *records* as a JSON array."""
+    return Response(
+        stream_with_context(json_array_chunks(records)),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+def wants_stream(args) -> bool:
+    return args.get("stream", "").lower() in ("1", "true", "yes")
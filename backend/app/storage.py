@@ -0,0 +1,232 @@
+"""Configurable storage layer: engine options, SQLite tuning and read/write split.
+
+Configuration (``app.config`` keys, defaulting to environment variables)
+-----------------------------------------------------------------------
+``DATABASE_URL``
+    Any SQLAlchemy URL; defaults to ``sqlite:///stock.db`` (relative to the
+    instance folder). Use a server database for heavier deployments.
+``DATABASE_READ_URL``
+    Optional read replica for server databases. SQLite files get a
+    read-only engine on the same file automatically.
+``DB_READ_SPLIT``
+    Route ``GET``/``HEAD`` requests' SELECTs to the read engine (default on).
+``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW`` / ``DB_POOL_TIMEOUT``
+    Connection pool sizing for each engine.
+``SQLITE_TUNING``
+    Apply the per-connection pragmas below (default on).
+``SQLITE_BUSY_TIMEOUT_MS`` / ``SQLITE_SYNCHRONOUS`` / ``SQLITE_CACHE_SIZE_KB``
+/ ``SQLITE_MMAP_SIZE``
+    Values for ``busy_timeout``, ``synchronous``, ``cache_size`` and
+    ``mmap_size``. ``journal_mode=WAL`` is always set when tuning is on, so
+    readers never block the writer and vice versa.
+"""
+
+from __future__ import annotations
+
+import os
+
+import sqlalchemy as sa
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+_READ_METHODS = frozenset({"GET", "HEAD"})
+
+DEFAULTS = {
+    "DATABASE_URL": "sqlite:///stock.db",
+    "DATABASE_READ_URL": None,
+    "DB_READ_SPLIT": True,
+    "DB_POOL_SIZE": 5,
+    "DB_MAX_OVERFLOW": 10,
+    "DB_POOL_TIMEOUT": 30,
+    "SQLITE_TUNING": True,
+    "SQLITE_BUSY_TIMEOUT_MS": 5000,
+    "SQLITE_SYNCHRONOUS": "NORMAL",
+    "SQLITE_CACHE_SIZE_KB": 65536,
+    "SQLITE_MMAP_SIZE": 256 * 1024 * 1024,
+}
+
+
+def _env(key, default):
+    value = os.getenv(key)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    return value
+
+
+def _is_sqlite(url: sa.engine.URL) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_memory(url: sa.engine.URL) -> bool:
+    return url.database in (None, "", ":memory:")
+
+
+def configure_storage(app) -> None:
+    """Fill database config before ``db.init_app``; explicit config wins."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, _env(key, default))
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", app.config["DATABASE_URL"])
+
+    url = sa.engine.make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    if _is_sqlite(url):
+        if not _is_memory(url):
+            options.setdefault("pool_size", app.config["DB_POOL_SIZE"])
+            options.setdefault("max_overflow", app.config["DB_MAX_OVERFLOW"])
+            options.setdefault("pool_timeout", app.config["DB_POOL_TIMEOUT"])
+            connect_args = options.setdefault("connect_args", {})
+            connect_args.setdefault("check_same_thread", False)
+            connect_args.setdefault("timeout", app.config["SQLITE_BUSY_TIMEOUT_MS"] / 1000)
+    else:
+        options.setdefault("pool_size", app.config["DB_POOL_SIZE"])
+        options.setdefault("max_overflow", app.config["DB_MAX_OVERFLOW"])
+        options.setdefault("pool_timeout", app.config["DB_POOL_TIMEOUT"])
+        options.setdefault("pool_pre_ping", True)
+        options.setdefault("pool_recycle", 1800)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+
+def init_storage(app, db) -> None:
+    """Attach pragmas and build the read engine; call inside an app context."""
+    writer = db.engine
+    url = writer.url
+    reader = None
+
+    if _is_sqlite(url) and not _is_memory(url):
+        if app.config["SQLITE_TUNING"]:
+            sa.event.listen(writer, "connect", _sqlite_pragmas(app.config, writer=True))
+        if app.config["DB_READ_SPLIT"]:
+            reader = sa.create_engine(url, **app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+            listener = _sqlite_pragmas(
+                app.config, writer=False, tuning=app.config["SQLITE_TUNING"]
+            )
+            sa.event.listen(reader, "connect", listener)
+    elif app.config["DB_READ_SPLIT"] and app.config["DATABASE_READ_URL"]:
+        reader = sa.create_engine(
+            app.config["DATABASE_READ_URL"], **app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+        )
+
+    app.extensions["storage_reader"] = reader
+
+
+def dispose_engines(app, db) -> None:
+    """Forget pooled connections inherited across ``fork``.
+
+    ``close=False`` leaves the parent's sockets/file handles alone; the
+    child just starts with empty pools. Call inside an app context.
+    """
+    db.engine.dispose(close=False)
+    reader = app.extensions.get("storage_reader")
+    if reader is not None:
+        reader.dispose(close=False)
+
+
+def warm_pool(app, db, connections: int = 1) -> None:
+    """Open up to *connections* pooled connections per engine (pragmas run
+    on connect), so the first requests do not pay for them."""
+    engines = [db.engine, app.extensions.get("storage_reader")]
+    for engine in filter(None, engines):
+        size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+        opened = [engine.connect() for _ in range(max(1, min(connections, size)))]
+        for conn in opened:
+            conn.exec_driver_sql("SELECT 1")
+            conn.close()
+
+
+def ensure_columns(db) -> None:
+    """Add declared nullable columns missing from tables that already existed.
+
+    ``create_all`` never alters existing tables; columns introduced later are
+    added with ``ALTER TABLE ... ADD COLUMN`` (no default, so existing rows
+    get ``NULL``). Run it before :func:`ensure_indexes` so their indexes are
+    created too.
+    """
+    inspector = sa.inspect(db.engine)
+    dialect = db.engine.dialect
+    preparer = dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+                )
+
+
+def ensure_indexes(db) -> None:
+    """Create declared indexes missing from tables that already existed.
+
+    ``create_all`` only creates indexes together with new tables; this adds
+    indexes introduced later to databases created by older versions.
+    """
+    inspector = sa.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not table.indexes or not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine, checkfirst=True)
+
+
+def _sqlite_pragmas(config, *, writer: bool, tuning: bool = True):
+    pragmas = []
+    if tuning:
+        if writer:
+            pragmas.append("PRAGMA journal_mode=WAL")
+        pragmas += [
+            f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+            f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+            f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+            f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        ]
+    if not writer:
+        pragmas.append("PRAGMA query_only=ON")
+
+    def on_connect(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return on_connect
+
+
+class RoutingSession(Session):
+    """Session that sends read-only work of ``GET``/``HEAD`` requests to the
+    read engine.
+
+    Anything that flushes or executes DML, and everything after it in the same
+    session, stays on the primary engine so a request always reads its own
+    writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._reads_only(clause):
+                reader = current_app.extensions.get("storage_reader")
+                if reader is not None:
+                    return reader
+            elif clause is not None or self._flushing:
+                self.info["wrote"] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_only(self, clause) -> bool:
+        return (
+            isinstance(clause, sa.sql.Select)
+            and not self._flushing
+            and not self.info.get("wrote")
+            and has_request_context()
+            and request.method in _READ_METHODS
+        )
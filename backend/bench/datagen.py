@@ -0,0 +1,102 @@
+"""Seeded synthetic inventory generator for benchmarks.
+
+Creates *products* products and about *movements* ``InventoryMovement`` rows
+spread over the last *days* days. Demand follows a weekly and a yearly
+cycle around a per-product base rate drawn from a log-normal distribution,
+so a few SKUs sell a lot and most sell little. About one movement in five
+is an ``IN`` replenishment; the rest are ``OUT`` sales. Same seed, same data.
+
+Rows are written with Core ``executemany`` in batches and the daily demand
+rollup is rebuilt at the end, exactly as ``flask rebuild-rollup`` would.
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app import db
+from app.models.demanda import DailyProductDemand
+from app.models.movimiento import InventoryMovement
+from app.models.producto import Product
+
+CATEGORIES = ("Electrónica", "Accesorios", "Oficina", "Hogar", "Ferretería", "Limpieza")
+LOCATIONS = tuple(f"{aisle}{rack}-{shelf:02d}" for aisle in "ABCD" for rack in (1, 2) for shelf in (1, 2, 3))
+IN_RATIO = 0.2
+BATCH = 10_000
+
+
+def _seasonality(day: int) -> float:
+    weekly = 1 + 0.3 * math.sin(2 * math.pi * day / 7)
+    yearly = 1 + 0.5 * math.sin(2 * math.pi * day / 365)
+    return weekly * yearly
+
+
+def generate(products: int, movements: int, *, seed: int = 42, days: int = 365):
+    """Populate the current app's database; return the list of product ids."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    product_table = Product.__table__
+    movement_table = InventoryMovement.__table__
+
+    ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(products)]
+    rates = [rng.lognormvariate(0, 1) for _ in range(products)]
+    rows = []
+    for i, pid in enumerate(ids):
+        cost = round(rng.uniform(1, 500), 2)
+        rows.append(
+            {
+                "product_id": pid,
+                "product_name": f"Producto {i:06d}",
+                "sku": f"SKU-{i:06d}",
+                "unit_of_measure": "Unit",
+                "cost": cost,
+                "sale_price": round(cost * rng.uniform(1.1, 1.8), 2),
+                "category": rng.choice(CATEGORIES),
+                "location": rng.choice(LOCATIONS),
+                "stk_qty": rng.randint(0, 200),
+                "active": rng.random() > 0.05,
+                "created_at": now - timedelta(days=days),
+                "updated_at": now - timedelta(days=rng.randint(0, days)),
+            }
+        )
+        if len(rows) >= BATCH:
+            db.session.execute(product_table.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(product_table.insert(), rows)
+
+    # Draw days proportionally to seasonality and products by sales rate.
+    product_cum = list(itertools.accumulate(rates))
+    day_cum = list(itertools.accumulate(_seasonality(d) for d in range(days)))
+    for start in range(0, movements, BATCH):
+        k = min(BATCH, movements - start)
+        picks = rng.choices(range(products), cum_weights=product_cum, k=k)
+        day_picks = rng.choices(range(days), cum_weights=day_cum, k=k)
+        rows = []
+        for i, day in zip(picks, day_picks):
+            is_in = rng.random() < IN_RATIO
+            qty = (
+                rng.randint(10, 100)
+                if is_in
+                else max(1, int(rng.expovariate(1 / (1 + rates[i] * 3))))
+            )
+            rows.append(
+                {
+                    "movement_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "date": now - timedelta(days=day, seconds=rng.randrange(86400)),
+                    "product_id": ids[i],
+                    "movement_type": "IN" if is_in else "OUT",
+                    "quantity": qty,
+                    "order_id": None,
+                    "notes": None,
+                }
+            )
+        db.session.execute(movement_table.insert(), rows)
+    db.session.commit()
+
+    DailyProductDemand.rebuild()
+    return ids
@@ -0,0 +1,202 @@
+"""Reproducible benchmark suite with baseline regression check.
+
+For each scale a fresh SQLite database is filled by :mod:`datagen` (same
+seed, same data) and the following are timed through the Flask test client
+or the model API:
+
+``forecast``        ``InventoryMovement.forecast_purchase_needs()``
+``get_prediction``  ``GET /api/get_prediction`` (precomputed result)
+``get_products``    ``GET /api/get_products?all=true``
+``get_stocks``      ``GET /api/get_stocks`` (first page)
+``stock_add``       ``PATCH /api/products/<id>/stock/add``
+``stock_subtract``  ``PATCH /api/products/<id>/stock/subtract``
+``export_csv``      ``GET /api/export/movements`` (whole ledger, CSV)
+``export_csv_gzip`` same, ``gzip=true``
+``export_parquet``  same, ``format=parquet`` (only with ``pyarrow``)
+``export_stock``    ``GET /api/export/stock?all=true`` (CSV)
+
+Each case gets one warm-up call, then ``--rounds`` rounds of ``--repeat``
+calls; rounds go through all cases in turn, so each case is sampled across
+the whole run. The lowest per-round median wall time is reported in
+milliseconds: a slow spell of a shared machine hits some rounds of a case,
+while a real slowdown shows in all of them. Results are printed as JSON and
+can be written to a file. Export cases are also reported as throughput
+(``throughput_rows_per_s``: exported rows / median time). With ``--baseline`` the run fails (exit status 1)
+when any case is slower than its baseline by more than ``--threshold``
+(a fraction, 0.25 = 25 %).
+
+Usage::
+
+    python bench/run.py --scales 1k                         # print results
+    python bench/run.py --scales 1k --save-baseline         # refresh baseline
+    python bench/run.py --scales 1k --baseline bench/baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.models.movimiento import InventoryMovement  # noqa: E402
+from app.services.export import parquet_available  # noqa: E402
+from datagen import generate  # noqa: E402
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+
+def _median(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _time_cases(cases, repeat, rounds):
+    """``{case: ms}``, the lowest median over *rounds* interleaved rounds."""
+    for fn in cases.values():
+        fn()  # warm-up
+    medians = {case: [] for case in cases}
+    for _ in range(rounds):
+        for case, fn in cases.items():
+            medians[case].append(_median(fn, repeat))
+    return {case: round(min(values), 3) for case, values in medians.items()}
+
+
+def _expect(resp, status=200):
+    if resp.status_code != status:
+        raise RuntimeError(f"{resp.request.path}: HTTP {resp.status_code}")
+    return resp
+
+
+def _download(client, url, headers):
+    resp = _expect(client.get(url, headers=headers))
+    resp.get_data()  # drain the stream
+    return resp
+
+
+def run_scale(name, products, args):
+    tmp = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp}/bench.db",
+        "FORECAST_SCHEDULER": False,  # keep background work out of the timings
+    })
+    with app.app_context():
+        ids = generate(products, products * args.movements_per_product, seed=args.seed)
+        token = create_access_token(identity="admin")
+
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    target = ids[0]
+
+    def forecast():
+        with app.app_context():
+            InventoryMovement.forecast_purchase_needs()
+
+    cases = {
+        "forecast": forecast,
+        "get_prediction": lambda: _expect(client.get("/api/get_prediction", headers=headers)),
+        "get_products": lambda: _expect(client.get("/api/get_products?all=true", headers=headers)),
+        "get_stocks": lambda: _expect(client.get("/api/get_stocks", headers=headers)),
+        "stock_add": lambda: _expect(
+            client.patch(f"/api/products/{target}/stock/add", json={"qty": 1}, headers=headers)
+        ),
+        "stock_subtract": lambda: _expect(
+            client.patch(f"/api/products/{target}/stock/subtract", json={"qty": 1}, headers=headers)
+        ),
+        "export_csv": lambda: _download(client, "/api/export/movements", headers),
+        "export_csv_gzip": lambda: _download(client, "/api/export/movements?gzip=true", headers),
+        "export_stock": lambda: _download(client, "/api/export/stock?all=true", headers),
+    }
+    if parquet_available():
+        cases["export_parquet"] = lambda: _download(
+            client, "/api/export/movements?format=parquet", headers
+        )
+    timings = _time_cases(cases, args.repeat, args.rounds)
+
+    # Rows per export case (stock_add/subtract add a movement per call,
+    # negligible next to the ledger size).
+    movements = products * args.movements_per_product
+    rows = {case: movements for case in cases if case.startswith("export_")}
+    rows["export_stock"] = products
+    throughput = {case: round(n / (timings[case] / 1000)) for case, n in rows.items()}
+    return timings, throughput
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for scale, cases in results.items():
+        for case, ms in cases.items():
+            base = baseline.get(scale, {}).get(case)
+            if base and ms > base * (1 + threshold):
+                regressions.append(f"{scale}/{case}: {ms:.1f} ms vs baseline {base:.1f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1k", help="lista separada por comas: 1k,10k,100k")
+    parser.add_argument("--movements-per-product", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="rondas de --repeat; se informa la menor mediana")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="escribe los resultados JSON en este archivo")
+    parser.add_argument("--baseline", help="JSON de referencia contra el que comparar")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"guarda los resultados como referencia en {DEFAULT_BASELINE}")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results, throughput = {}, {}
+    for scale in args.scales.split(","):
+        if scale not in SCALES:
+            parser.error(f"escala desconocida: {scale}")
+        results[scale], throughput[scale] = run_scale(scale, SCALES[scale], args)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "movements_per_product": args.movements_per_product,
+        "repeat": args.repeat,
+        "rounds": args.rounds,
+        "seed": args.seed,
+        "results_ms": results,
+        "throughput_rows_per_s": throughput,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w") as fh:
+            fh.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)["results_ms"]
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESIÓN {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
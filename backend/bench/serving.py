@@ -0,0 +1,196 @@
+"""Serving benchmark: Flask dev server vs. gunicorn (``gunicorn.conf.py``).
+
+A throw-away SQLite database is filled by :mod:`datagen`. Each server is
+then started as a real process on a local port and measured over HTTP:
+
+``cold_start_ms``  process spawn → first ``200`` from ``/api/get_products``
+``<endpoint>``     requests/second with ``--clients`` keep-alive clients
+                   (one process each) during ``--duration`` seconds
+
+Servers:
+
+``dev``       ``flask --app wsgi run`` (the previous Docker ``CMD``)
+``gunicorn``  ``gunicorn -c gunicorn.conf.py`` with ``--workers`` and
+              ``--threads``
+
+The background scheduler is off in both, so only request serving is
+measured. Results are printed as JSON.
+
+Usage::
+
+    python bench/serving.py --scale 1k --clients 8 --duration 10
+    python bench/serving.py --servers gunicorn --workers 4 --threads 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(HERE, "..")
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, HERE)
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+ENDPOINTS = {
+    "get_products": "/api/get_products?all=true",
+    "get_stocks": "/api/get_stocks?limit=100",
+    "get_prediction": "/api/get_prediction",
+    "search": "/api/products/search?q=Producto&limit=50",
+    "dashboard": "/api/dashboard/summary",
+}
+SECRET = "serving-bench-secret-key-0123456789abcdef"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _prepare(products, movements_per_product, seed):
+    """Fill a fresh database; return ``(directory, url, token)``."""
+    from flask_jwt_extended import create_access_token
+
+    from app import create_app
+    from datagen import generate
+
+    tmp = tempfile.mkdtemp(prefix="bench-serving-")
+    url = f"sqlite:///{tmp}/bench.db"
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": url,
+        "JWT_SECRET_KEY": SECRET,
+        "FORECAST_SCHEDULER": False,
+    })
+    with app.app_context():
+        generate(products, products * movements_per_product, seed=seed)
+        token = create_access_token(identity="admin")
+    return tmp, url, token
+
+
+def _command(server, port, args):
+    if server == "dev":
+        return [sys.executable, "-m", "flask", "--app", "wsgi", "run",
+                "--host", "127.0.0.1", "--port", str(port)]
+    return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers),
+            "--threads", str(args.threads), "--access-logfile", "/dev/null"]
+
+
+def _get(port, path, headers, timeout=5.0):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status
+    finally:
+        conn.close()
+
+
+def _client(port, path, headers, duration):
+    """One keep-alive client; returns the number of ``200`` responses."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    done, deadline = 0, time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        if resp.status == 200:
+            done += 1
+    conn.close()
+    return done
+
+
+def run_server(server, url, token, args):
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=url, JWT_SECRET_KEY=SECRET, FORECAST_SCHEDULER="0")
+    headers = {"Authorization": f"Bearer {token}"}
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        _command(server, port, args), cwd=BACKEND, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{server}: el servidor terminó con código {proc.returncode}")
+            try:
+                if _get(port, ENDPOINTS["get_products"], headers) == 200:
+                    break
+            except OSError:
+                time.sleep(0.02)
+        result = {"cold_start_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+        with multiprocessing.Pool(args.clients) as pool:
+            for name, path in ENDPOINTS.items():
+                _get(port, path, headers, timeout=60)  # warm-up (e.g. first forecast)
+                counts = pool.starmap(
+                    _client, [(port, path, headers, args.duration)] * args.clients
+                )
+                result[name] = round(sum(counts) / args.duration, 1)
+        return result
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="1k", choices=sorted(SCALES))
+    parser.add_argument("--movements-per-product", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--servers", default="dev,gunicorn", help="dev,gunicorn")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="segundos por endpoint")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--output", help="escribe los resultados JSON en este archivo")
+    args = parser.parse_args(argv)
+
+    tmp, url, token = _prepare(SCALES[args.scale], args.movements_per_product, args.seed)
+    try:
+        results = {
+            server: run_server(server, url, token, args)
+            for server in args.servers.split(",")
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "clients": args.clients,
+        "duration_s": args.duration,
+        "gunicorn": {"workers": args.workers, "threads": args.threads},
+        "results": {"cold_start_ms": {}, "requests_per_s": {}},
+    }
+    for server, values in results.items():
+        report["results"]["cold_start_ms"][server] = values.pop("cold_start_ms")
+        report["results"]["requests_per_s"][server] = values
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
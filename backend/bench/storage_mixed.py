@@ -0,0 +1,118 @@
+"""Mixed read/write throughput before and after the SQLite storage tuning.
+
+Runs the same workload twice on fresh SQLite files:
+
+* ``legacy``: default journal mode, no pragmas, single engine (the old
+  ``create_app`` behaviour);
+* ``tuned``: WAL + pragmas from :mod:`app.storage` and GETs routed to the
+  read-only engine.
+
+Reader threads call ``GET /api/get_products`` and ``GET /api/get_stocks``;
+writer threads call ``PATCH /api/products/<id>/stock/add``. Every request
+goes through the Flask test client, so routing, JWT and serialisation are
+included.
+
+Usage::
+
+    python bench/storage_mixed.py [--seconds 10] [--readers 8] [--writers 4]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from app import create_app  # noqa: E402
+from datagen import generate  # noqa: E402
+
+MODES = {
+    "legacy": {"SQLITE_TUNING": False, "DB_READ_SPLIT": False},
+    "tuned": {"SQLITE_TUNING": True, "DB_READ_SPLIT": True},
+}
+
+
+def _seed(app, products):
+    with app.app_context():
+        ids = generate(products, products * 10)
+        return ids, create_access_token(identity="admin")
+
+
+def run(mode, args):
+    tmp = tempfile.mkdtemp(prefix=f"bench-{mode}-")
+    config = {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp}/bench.db",
+        "FORECAST_SCHEDULER": False,
+        **MODES[mode],
+    }
+    app = create_app(config)
+    ids, token = _seed(app, args.products)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    counts = {"read": Counter(), "write": Counter()}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def reader():
+        client, local = app.test_client(), Counter()
+        while not stop.is_set():
+            url = random.choice(("/api/get_products", "/api/get_stocks?limit=100"))
+            local[client.get(url, headers=headers).status_code] += 1
+        with lock:
+            counts["read"].update(local)
+
+    def writer():
+        client, local = app.test_client(), Counter()
+        while not stop.is_set():
+            url = f"/api/products/{random.choice(ids)}/stock/add"
+            local[client.patch(url, json={"qty": 1}, headers=headers).status_code] += 1
+        with lock:
+            counts["write"].update(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    result = {}
+    for kind, counter in counts.items():
+        ok = counter[200]
+        result[kind] = {
+            "ok_per_s": round(ok / args.seconds, 1),
+            "errors": sum(counter.values()) - ok,
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--products", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    for mode in MODES:
+        result = run(mode, args)
+        print(
+            f"{mode:>6}: lecturas {result['read']['ok_per_s']:>8}/s "
+            f"(errores {result['read']['errors']}), "
+            f"escrituras {result['write']['ok_per_s']:>8}/s "
+            f"(errores {result['write']['errors']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
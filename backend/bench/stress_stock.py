@@ -0,0 +1,114 @@
+"""Concurrency stress check for ``PATCH /api/products/<id>/stock/subtract``.
+
+Many threads hammer the endpoint for one product on a throw-away SQLite
+database. With atomic conditional updates the run must end with no lost
+updates and no overselling:
+
+* successful subtracts == initial stock - final ``stk_qty``
+* successful subtracts == ``OUT`` rows written to ``inventory_movement``
+* final ``stk_qty`` never drops below zero
+
+Usage::
+
+    python bench/stress_stock.py [--threads 16] [--requests 50] [--stock 500]
+
+Exits with status 1 if any invariant is violated.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models.movimiento import InventoryMovement  # noqa: E402
+from app.models.producto import Product  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="por thread")
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--qty", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="stress-stock-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp}/stress.db",
+        "FORECAST_SCHEDULER": False,
+    })
+
+    with app.app_context():
+        product = Product.create(
+            {
+                "product_name": "Stress",
+                "sku": "STRESS-001",
+                "unit_of_measure": "Unit",
+                "cost": 1,
+                "sale_price": 2,
+                "category": "Bench",
+                "location": "X",
+                "stk_qty": args.stock,
+            }
+        )
+        product_id = product.product_id
+        token = create_access_token(identity="admin")
+
+    url = f"/api/products/{product_id}/stock/subtract"
+    headers = {"Authorization": f"Bearer {token}"}
+    statuses = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        local = Counter()
+        for _ in range(args.requests):
+            resp = client.patch(url, json={"qty": args.qty}, headers=headers)
+            local[resp.status_code] += 1
+        with lock:
+            statuses.update(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with app.app_context():
+        final = db.session.get(Product, product_id).stk_qty
+        ledger = (
+            db.session.query(db.func.coalesce(db.func.sum(InventoryMovement.quantity), 0))
+            .filter_by(product_id=product_id, movement_type="OUT")
+            .scalar()
+        )
+
+    ok = statuses[200] * args.qty
+    print(f"respuestas: {dict(statuses)}")
+    print(f"stock inicial={args.stock} final={final} descontado={ok} ledger OUT={ledger}")
+
+    failures = []
+    if args.stock - final != ok:
+        failures.append("actualizaciones perdidas: stock final no cuadra con los 200")
+    if ledger != ok:
+        failures.append("el ledger no coincide con los descuentos confirmados")
+    if final < 0:
+        failures.append("sobreventa: stock negativo")
+    if set(statuses) - {200, 400}:
+        failures.append("respuestas inesperadas (p.ej. 500 por 'database is locked')")
+
+    for failure in failures:
+        print(f"FALLO: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
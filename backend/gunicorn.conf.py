@@ -0,0 +1,89 @@
+"""Gunicorn configuration for production serving: ``gunicorn -c gunicorn.conf.py``.
+
+Environment
+-----------
+``GUNICORN_BIND``      listen address (default ``0.0.0.0:5000``)
+``WEB_CONCURRENCY``    worker processes (default ``2 * CPUs + 1``, at most 8)
+``GUNICORN_THREADS``   threads per worker, ``gthread`` class (default 4)
+``STREAM_MAX_CLIENTS`` SSE streams per worker (default half the threads)
+``GUNICORN_PRELOAD``   import the app once in the master (default ``1``)
+``GUNICORN_TIMEOUT``   worker heartbeat timeout in seconds (default 60)
+
+Startup
+-------
+* With preload the master builds the app once, schema step included
+  (:func:`app.init_schema`), and workers fork from it with the code already
+  imported. Without preload the master runs the schema step in
+  ``on_starting`` and workers skip it (``SCHEMA_ON_STARTUP=0``).
+* Every worker drops the connection pools inherited from the master, then
+  opens its own connections and loads the catalog cache
+  (:func:`app.warmup`) and starts its background threads
+  (:func:`app.start_background`) before it accepts requests.
+* SSE clients (``/api/stream``) hold a thread each for as long as they stay
+  connected. Each worker accepts at most ``STREAM_MAX_CLIENTS`` of them and
+  answers 503 beyond that, so the remaining threads always serve the API.
+  Raise ``GUNICORN_THREADS`` together with it for more live dashboards.
+
+Logging
+-------
+The access log records the path without the query string: ``EventSource``
+cannot send headers, so ``/api/stream`` takes the JWT as ``?jwt=``, and the
+default format (full request line) would write every dashboard's token to
+stdout.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+wsgi_app = "wsgi:app"
+accesslog = "-"
+# Default format with ``%(r)s`` (request line) split into method, path
+# without query string (``%(U)s``) and protocol; see "Logging" above.
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(m)s %(U)s %(H)s" %(s)s %(b)s "%(f)s" "%(a)s"'
+
+# Threads started in the master would not survive the fork: start them per worker.
+os.environ.setdefault("BACKGROUND_ON_STARTUP", "0")
+# Streams never take more than half of a worker's threads.
+os.environ.setdefault("STREAM_MAX_CLIENTS", str(max(threads // 2, 1)))
+if not preload_app:
+    os.environ.setdefault("SCHEMA_ON_STARTUP", "0")
+
+
+def on_starting(server):
+    if preload_app:
+        return  # loading the app runs the schema step
+    from app import create_app, init_schema
+
+    app = create_app({"SCHEMA_ON_STARTUP": False, "BACKGROUND_ON_STARTUP": False})
+    with app.app_context():
+        init_schema(app)
+        from app import db
+
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from app import db
+    from app.storage import dispose_engines
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        dispose_engines(app, db)
+
+
+def post_worker_init(worker):
+    from app import start_background, warmup
+
+    app = worker.wsgi
+    warmup(app, connections=worker.cfg.threads)
+    start_background(app)
@@ -1,12 +1,9 @@
 import logging
 from app import create_app
-from flask_cors import CORS
 
 logging.basicConfig(level=logging.INFO)
+# CORS (incluido el frontend React en localhost:5173) se configura en create_app.
 app = create_app()
 
-# Permitir CORS para el frontend React en localhost:5173
-CORS(app)
-
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
@@ -11,35 +11,23 @@ import {
   Legend,
   ResponsiveContainer,
 } from "recharts";
-import { login, getAllProducts, addProduct, predictStock, getAllstockMoves,getPredicion } from "./api";
+import { login, getAllProducts, addProduct, predictStock, getMonthlyMoves,getPredicion } from "./api";
 import "./index.css";
 
 /* ──────────────────────────────────────────────────────────── */
-/* 🔧 Función utilitaria: agrupa cantidades por mes‑año         */
+/* 🔧 Función utilitaria: etiqueta los totales mensuales        */
 /* ──────────────────────────────────────────────────────────── */
-function agruparPorMes(movimientos) {  
-  if (!movimientos || movimientos.length === 0) return [];
-  
-  const acumulado = movimientos.reduce((acc, movs) => {
-    // Asegúrate que estos campos coincidan con tu API real
-    const fecha = new Date(movs.date);
-    if (isNaN(fecha.getTime())) return acc; // Fecha inválida
-    
-    const key = `${fecha.getUTCFullYear()}-${String(fecha.getUTCMonth() + 1).padStart(2, "0")}`;
-    const cantidad = movs.quantity ?? 0;
-    acc[key] = (acc[key] || 0) + cantidad;
-    return acc;
-  }, {});
+function agruparPorMes(meses) {
+  if (!meses || meses.length === 0) return [];
 
-  return Object.entries(acumulado)
-    .map(([key, existencia]) => {
-      const [y, m] = key.split("-").map(Number);
-      const mesNombre = new Date(y, m - 1, 1)
-        .toLocaleString("es", { month: "short" })
-        .replace(/^\w/, (c) => c.toUpperCase());
-      return { mes: mesNombre, existencia };
-    })
-    .sort((a, b) => a.mes.localeCompare(b.mes, "es"));
+  // El servidor ya agrupa por mes‑año (del más antiguo al más reciente).
+  return meses.map(({ month, in_qty, out_qty }) => {
+    const [y, m] = month.split("-").map(Number);
+    const mesNombre = new Date(y, m - 1, 1)
+      .toLocaleString("es", { month: "short" })
+      .replace(/^\w/, (c) => c.toUpperCase());
+    return { mes: mesNombre, existencia: in_qty + out_qty };
+  });
 }
 
 /* ──────────────────────────────────────────────────────────── */
@@ -61,7 +49,7 @@ export default function DashboardView() {
         const token = localStorage.getItem("token"); // o tu gestor de auth
         const products = await getAllProducts(token); // GET /api/products
         
-        const MovStock = await getAllstockMoves(token);
+        const MovStock = await getMonthlyMoves(token); // GET /api/dashboard/monthly
 
         const Predict = await getPredicion(token);
         setPrediccion(Predict);
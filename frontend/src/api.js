@@ -30,14 +30,33 @@ export async function getAllProducts(token) {
     return handleResponse(response);
 }
 
-export async function getAllstockMoves(token) {  
-    const response = await fetch(`${API_BASE_URL}/get_stocks`, {
+// /get_stocks devuelve páginas (keyset): se pide una sola y el cursor del
+// header X-Next-Cursor permite traer la siguiente cuando haga falta.
+const STOCKS_PAGE_SIZE = 100;
+
+export async function getStockMovesPage(token, cursor = null) {
+    const params = new URLSearchParams({ limit: STOCKS_PAGE_SIZE });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE_URL}/get_stocks?${params}`, {
         method: 'GET',
         headers: {
             'Content-Type': 'application/json',
             Authorization: `Bearer ${token}`
         }
-    });    
+    });
+    const movimientos = await handleResponse(response);
+    return { movimientos, nextCursor: response.headers.get('X-Next-Cursor') };
+}
+
+// Totales por mes calculados en el servidor: [{ month, in_qty, out_qty, movements }]
+export async function getMonthlyMoves(token) {
+    const response = await fetch(`${API_BASE_URL}/dashboard/monthly`, {
+        method: 'GET',
+        headers: {
+            'Content-Type': 'application/json',
+            Authorization: `Bearer ${token}`
+        }
+    });
     return handleResponse(response);
 }
 